@@ -0,0 +1,182 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from session_store import BoundedDict
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Paid generations running at once (payment + Bedrock), and how many may queue for a slot
+ADMISSION_MAX_GENERATIONS = int(os.getenv('ADMISSION_MAX_GENERATIONS', '8'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))
+# Longest a generation waits for a slot before it is rejected (well inside the 30s x402 timeout)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10'))
+# Nova Canvas calls in flight across all generations
+ADMISSION_BEDROCK_CONCURRENCY = int(os.getenv('ADMISSION_BEDROCK_CONCURRENCY', '8'))
+# Token buckets (0 disables): images per minute per session, USDC per minute per wallet
+ADMISSION_SESSION_RATE = float(os.getenv('ADMISSION_SESSION_RATE', '10'))
+ADMISSION_SESSION_BURST = float(os.getenv('ADMISSION_SESSION_BURST', '5'))
+ADMISSION_WALLET_SPEND_RATE = float(os.getenv('ADMISSION_WALLET_SPEND_RATE', '2'))
+ADMISSION_WALLET_SPEND_BURST = float(os.getenv('ADMISSION_WALLET_SPEND_BURST', '1'))
+
+# Session buckets kept; an evicted session starts again with a full bucket
+_MAX_SESSION_BUCKETS = 4096
+
+
+class AdmissionRejected(Exception):
+    """A paid generation was not admitted; retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class TokenBucket:
+    """Refills at rate tokens per minute up to burst"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it is now); more than burst needs a full bucket"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class AdmissionController:
+    """Scheduler in front of paid image generation.
+
+    A generation must pass its session's image bucket and its wallet's USDC spend
+    bucket, then wait for one of max_generations slots. Rejections are immediate when
+    a bucket is empty or the queue is full, and after queue_timeout in the queue, so
+    nothing is charged for a generation that can't run soon. Nova Canvas calls inside
+    admitted generations share bedrock_concurrency slots. Used from the shared tools loop only.
+    """
+
+    def __init__(self, max_generations: int = ADMISSION_MAX_GENERATIONS, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, bedrock_concurrency: int = ADMISSION_BEDROCK_CONCURRENCY):
+        self.max_generations = max_generations
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bedrock_concurrency = bedrock_concurrency
+        self._slots = asyncio.Semaphore(max_generations)
+        self._bedrock = asyncio.Semaphore(bedrock_concurrency)
+        self._session_buckets = BoundedDict(_MAX_SESSION_BUCKETS)
+        self._wallet_buckets = {}
+        self.active = 0
+        self.waiting = 0
+        self.bedrock_in_flight = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'rate_limited': 0, 'spend_limited': 0, 'timeout': 0}
+
+    def _bucket(self, buckets, key, rate: float, burst: float):
+        if rate <= 0:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _reject(self, kind: str, reason: str, retry_after: float):
+        self.rejected[kind] += 1
+        logger.info(f"[ADMISSION] Rejected ({kind}): {reason}")
+        raise AdmissionRejected(reason, retry_after)
+
+    @asynccontextmanager
+    async def generation(self, session_id: str, wallet: str, images: int, cost_usdc: float):
+        """Hold a generation slot for the enclosed payment and generation, or raise AdmissionRejected"""
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self._reject('queue_full', f"Generation queue is full ({self.waiting} waiting)", self.queue_timeout)
+
+        session_bucket = self._bucket(self._session_buckets, session_id, ADMISSION_SESSION_RATE, ADMISSION_SESSION_BURST)
+        wallet_bucket = self._bucket(self._wallet_buckets, wallet, ADMISSION_WALLET_SPEND_RATE, ADMISSION_WALLET_SPEND_BURST)
+        if session_bucket is not None and session_bucket.wait_time(images) > 0:
+            self._reject('rate_limited', f"Session {session_id} is generating images too quickly",
+                         session_bucket.wait_time(images))
+        if wallet_bucket is not None and wallet_bucket.wait_time(cost_usdc) > 0:
+            self._reject('spend_limited', f"Wallet {wallet} spend rate limit reached", wallet_bucket.wait_time(cost_usdc))
+        # Taken together so a rejection by one bucket never drains the other
+        if session_bucket is not None:
+            session_bucket.take(images)
+        if wallet_bucket is not None:
+            wallet_bucket.take(cost_usdc)
+
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except BaseException as e:
+            # Timed out or the caller went away - nothing ran, so give the tokens back
+            if session_bucket is not None:
+                session_bucket.refund(images)
+            if wallet_bucket is not None:
+                wallet_bucket.refund(cost_usdc)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject('timeout', f"No generation slot within {self.queue_timeout:g}s", self.queue_timeout)
+            raise
+        finally:
+            self.waiting -= 1
+        telemetry.observe('admission.wait', time.perf_counter() - started)
+
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    @asynccontextmanager
+    async def bedrock_call(self):
+        """Hold one of the global Nova Canvas call slots"""
+        async with self._bedrock:
+            self.bedrock_in_flight += 1
+            try:
+                yield
+            finally:
+                self.bedrock_in_flight -= 1
+
+    def stats(self) -> dict:
+        stats = {
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_generations': self.max_generations,
+            'max_queue': self.max_queue,
+            'bedrock_in_flight': self.bedrock_in_flight,
+            'admitted': self.admitted
+        }
+        stats.update({f"rejected_{kind}": count for kind, count in self.rejected.items()})
+        return stats
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the admission controller"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+    return _controller
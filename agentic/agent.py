@@ -1,28 +1,72 @@
-from fastapi import FastAPI, HTTPException
+# Imported first so the startup report covers the heavy imports below
+from startup import startup, STARTUP_WARMUP
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
 from datetime import datetime, timezone
 from strands import Agent
 from strands.models import BedrockModel
-from tools import estimate_image_cost, check_wallet_balance, make_payment, generate_image, analyze_content_monetization, IMAGE_STORAGE
-from memory_hook import MemoryHook, MEMORY_ID
+from tools import estimate_image_cost, estimate_batch_image_cost, check_wallet_balance, make_payment, generate_image, analyze_content_monetization, IMAGE_STORAGE, get_session_storage, get_settlements, get_agent_wallet, get_bedrock_runtime
+from memory_hook import MemoryHook, MEMORY_ID, prefetch_memory, record_memory, get_memory_managers
+from agent_pool import AgentPool
+from context_manager import create_conversation_manager, get_context_metrics
+from telemetry import telemetry, TELEMETRY_OTEL
+from idempotency import get_idempotency_cache, fingerprint, IdempotencyConflict, IdempotencyInProgress
+from admission import get_admission_controller
+from bedrock_client import client_config, get_bedrock_invoker
+from session_store import get_session_store
+from web3_provider import get_rpc_stats
+from generation_cache import GENERATION_CACHE, get_generation_cache
+from analysis_cache import get_analysis_cache
+from tx_pipeline import get_transaction_stats
+from purchase import purchase_image, match_purchase_intent
+from price_oracle import get_price_oracle
+from image_store import get_image_store, render_image, is_image_id
 import os
+import json
+import asyncio
 import logging
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+if TELEMETRY_OTEL:
+    try:
+        telemetry.setup_otel()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"OpenTelemetry export unavailable: {str(e)}")
+
 app = FastAPI(title="Content Monetization Agent", version="1.0.0")
 
-model = BedrockModel(
-    model_id="us.anthropic.claude-sonnet-4-20250514-v1:0",
-    temperature=0.7,
-    streaming=False  # Use Converse API for reliability
-)
+@app.on_event("startup")
+async def warm_caches():
+    # Fetch the USDC price in the background so the first estimate is a memory lookup
+    get_price_oracle().refresh_async()
+    # Resume settlements left pending by a previous run
+    get_settlements().start()
+    if STARTUP_WARMUP:
+        startup.warm()
+
+MODEL_ID = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_model(streaming: bool = False) -> BedrockModel:
+    """Converse model for invocations, or the ConverseStream model for streaming (created on first use)"""
+    with _models_lock:
+        if streaming not in _models:
+            _models[streaming] = BedrockModel(
+                model_id=MODEL_ID,
+                temperature=0.7,
+                streaming=streaming,  # Converse API for reliability unless streaming
+                boto_client_config=client_config()  # Adaptive retries, pool sized to concurrency
+            )
+        return _models[streaming]
 
-agent = Agent(
-    model=model,
-    system_prompt="""You are a helpful AI assistant that can generate and analyze images.
+SYSTEM_PROMPT = """You are a helpful AI assistant that can generate and analyze images.
 
 For wallet queries: Use check_wallet_balance(session_id)
 For image generation: Follow x402 payment flow with session_id parameter
@@ -33,27 +77,196 @@ x402 Payment Flow (FOLLOW EXACTLY):
 3. make_payment(session_id=session_id) → marks payment as authorized
 4. generate_image(session_id=session_id) AGAIN → x402 handles payment → returns SUCCESS
 
+For multiple images (several prompts or several images of one prompt), use
+estimate_batch_image_cost(prompts, images_per_prompt, session_id) instead of step 1.
+Steps 2-4 are the same: the whole batch is paid once and generated together.
+
 CRITICAL:
 - ALWAYS use the CURRENT session_id (NOT 'default') in ALL tool calls
 - NEVER re-estimate cost if request_id already exists in session
 - ALWAYS call generate_image FIRST (step 2) to get PAYMENT_REQUIRED
 - ALWAYS call generate_image AGAIN after make_payment (step 4)
 - Follow the exact sequence: estimate → generate → make_payment → generate
-- If user asks about wallet, call check_wallet_balance immediately""",
-    tools=[estimate_image_cost, check_wallet_balance, make_payment, generate_image, analyze_content_monetization],
-    hooks=[MemoryHook()],
-    state={"session_id": "default"}
-)
+- If user asks about wallet, call check_wallet_balance immediately
+- If generate_image returns BUSY, tell the user the service is busy and to try again after the given time (payment stays authorized; do NOT call make_payment again)"""
+
+def create_agent(session_id: str) -> Agent:
+    """Build an agent bound to a single session (one per session for state isolation)"""
+    agent = Agent(
+        model=get_model(),
+        system_prompt=SYSTEM_PROMPT,
+        tools=[estimate_image_cost, estimate_batch_image_cost, check_wallet_balance, make_payment, generate_image, analyze_content_monetization],
+        hooks=[MemoryHook()],
+        # Strands sliding window unless CONTEXT_MANAGEMENT opts into budget compaction (see context_manager)
+        conversation_manager=create_conversation_manager(),
+        state={"session_id": session_id}
+    )
+    agent.state.session_id = session_id
+    return agent
+
+# Memory for a session is prefetched as soon as its agent is acquired, before queueing for it
+agent_pool = AgentPool(create_agent, on_acquire=prefetch_memory, on_record=record_memory)
+
+# Heavy clients warm concurrently after startup; /ready reports when they're done
+startup.register("wallet", get_agent_wallet)
+startup.register("bedrock_runtime", get_bedrock_runtime)
+startup.register("model", get_model)
+startup.register("streaming_model", lambda: get_model(streaming=True), required=False)
+startup.mark_imported()
+
+# Component state exported as gauges on /metrics
+telemetry.register_stats("startup", startup.report)
+telemetry.register_stats("agent_pool", agent_pool.stats)
+telemetry.register_stats("session_store", lambda: get_session_store().stats(), counters=("evictions",))
+telemetry.register_stats("context", lambda: get_context_metrics().stats(), counters=("turns", "tokens_saved"))
+telemetry.register_stats("settlements", lambda: get_settlements().stats())
+telemetry.register_stats("idempotency", lambda: get_idempotency_cache().stats(),
+                         counters=("executed", "coalesced", "replayed", "rejected"))
+telemetry.register_stats("admission", lambda: get_admission_controller().stats(),
+                         counters=("admitted", "rejected_queue_full", "rejected_rate_limited",
+                                   "rejected_spend_limited", "rejected_timeout"))
+telemetry.register_stats("bedrock", lambda: get_bedrock_invoker().stats(),
+                         counters=("invocations", "retries", "fallbacks", "failures"))
+telemetry.register_stats("rpc", get_rpc_stats, label="url", counters=("requests", "errors"))
+telemetry.register_stats("analysis_cache", lambda: get_analysis_cache().stats(), counters=("hits", "misses", "evictions"))
+telemetry.register_stats("tx_sender", get_transaction_stats, label="wallet", counters=("sent", "failed"))
+if GENERATION_CACHE:
+    telemetry.register_stats("generation_cache", lambda: get_generation_cache(get_image_store()).stats(),
+                             counters=("hits", "misses", "evictions"))
+if MEMORY_ID:
+    telemetry.register_stats("memory", lambda: get_memory_managers().stats(), counters=("hits", "misses", "evictions"))
 
 class InvocationRequest(BaseModel):
     input: Dict[str, Any]
     session_id: Optional[str] = None
+    stream: bool = False
+    idempotency_key: Optional[str] = None  # Or the Idempotency-Key header
 
 class InvocationResponse(BaseModel):
     output: Dict[str, Any]
 
+class PurchaseRequest(BaseModel):
+    prompt: Optional[str] = None
+    session_id: Optional[str] = None
+    request_id: Optional[str] = None
+    authorize: bool = False
+    idempotency_key: Optional[str] = None  # Or the Idempotency-Key header
+
+def fulfilled_requests(session_id: str) -> set:
+    """Request IDs in a session that already produced images"""
+    storage = get_session_storage(session_id)
+    return {request_id for request_id, entry in storage.authorize_check.items() if entry.get('image_ids')}
+
+def new_image_ids(session_id: str, fulfilled_before: set) -> list:
+    """IDs of images from requests fulfilled since fulfilled_before was captured.
+    
+    Tracked per request rather than per image ID because content-addressed (and
+    cached) images can repeat within a session.
+    """
+    # Re-read the session: shared store backends return snapshots
+    storage = get_session_storage(session_id)
+    image_ids = {}
+    for request_id, entry in storage.authorize_check.items():
+        if request_id in fulfilled_before:
+            continue
+        for image_id in entry.get('image_ids', []):
+            image_ids[image_id] = None
+            # Clear global reference after extraction (session reference is kept for analysis)
+            IMAGE_STORAGE.pop(image_id, None)
+    return list(image_ids)
+
+async def render_images(image_ids: list) -> dict:
+    """Data URL or URL per image ID depending on IMAGE_DELIVERY (raw bytes stay in the image store)"""
+    images = {}
+    for image_id in image_ids:
+        # Reads the file or S3 object - keep it off the event loop
+        images[image_id] = await asyncio.to_thread(render_image, image_id)
+    return images
+
+async def with_images(response: dict) -> dict:
+    """Copy of a response with its image_ids rendered as images.
+    
+    Responses keep only IDs until they are returned, so results stored for
+    idempotent retries don't hold inline image data.
+    """
+    response = dict(response)
+    response["images"] = await render_images(response.pop("image_ids"))
+    return response
+
+def sse_event(event_type: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event"""
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_response(response: dict):
+    """Yield the SSE image and done events for a finished (or replayed) streamed run"""
+    for image_id, image_data in (await render_images(response["image_ids"])).items():
+        yield sse_event("image", {"image_id": image_id, "data": image_data})
+    yield sse_event("done", {key: value for key, value in response.items() if key != "image_ids"})
+
+def stream_agent(session_id: str, user_message: str, key=None, request_fingerprint: Optional[str] = None):
+    """Start the agent run and return SSE events for model tokens, tool calls and the final images.
+    
+    With an idempotency key (already claimed via IdempotencyCache.begin) the run
+    finishes even if the client disconnects, and its result is stored for retries.
+    """
+    logger = logging.getLogger(__name__)
+    fulfilled_before = fulfilled_requests(session_id)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def event_sink(event_type, data):
+        # Hooks may fire off the event loop thread (tool execution)
+        loop.call_soon_threadsafe(queue.put_nowait, (event_type, data))
+
+    async def produce():
+        response = None
+        try:
+            async for event in agent_pool.stream(session_id, user_message, model=get_model(streaming=True), event_sink=event_sink):
+                if "data" in event:
+                    queue.put_nowait(("token", {"text": event["data"]}))
+                elif "result" in event:
+                    logger.info(f"💬 [AGENT_RESPONSE] Session:{session_id} | Response:{str(event['result'].message)[:300]}...")
+                    response = {
+                        "message": event["result"].message,
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                        "model": "claude-sonnet-4.5",
+                        "session_id": session_id,
+                        "image_ids": new_image_ids(session_id, fulfilled_before)
+                    }
+                    queue.put_nowait(("result", response))
+        except Exception as e:
+            logger.error(f"Agent stream error: {str(e)}", exc_info=True)
+            queue.put_nowait(("error", {"detail": f"Agent error: {str(e)}"}))
+        finally:
+            if key is not None:
+                get_idempotency_cache().finish(key, request_fingerprint, response)
+            loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    logger.info(f"🤖 [AGENT_STREAM_START] Session:{session_id} | Message:{user_message[:100]}")
+    # Started here rather than in the generator so a claimed key is always released
+    producer = asyncio.create_task(produce())
+
+    async def events():
+        try:
+            while True:
+                event_type, data = await queue.get()
+                if event_type is done:
+                    break
+                if event_type == "result":
+                    async for event in stream_response(data):
+                        yield event
+                else:
+                    yield sse_event(event_type, data)
+        finally:
+            # Client disconnected or stream finished - stop the agent run unless a retry may replay it
+            if key is None and not producer.done():
+                producer.cancel()
+
+    return events()
+
 @app.post("/invocations", response_model=InvocationResponse)
-async def invoke_agent(request: InvocationRequest):
+async def invoke_agent(request: InvocationRequest, idempotency_key: Optional[str] = Header(None)):
     import logging
     logger = logging.getLogger(__name__)
     
@@ -67,40 +280,162 @@ async def invoke_agent(request: InvocationRequest):
                 detail="No prompt found in input. Please provide a 'prompt' key."
             )
         
-        # Set session ID for memory isolation
+        # Session ID selects the pooled agent for memory isolation
         session_id = request.session_id or request.input.get("session_id", "default")
-        agent.state.session_id = session_id
-        
-        logger.info(f"🤖 [AGENT_START] Session:{session_id} | Message:{user_message[:100]}")
-        result = agent(user_message)
-        logger.info(f"💬 [AGENT_RESPONSE] Session:{session_id} | Response:{str(result.message)[:300]}...")
         
-        # Extract images from global storage (images are returned to user)
-        images = {}
-        for image_id, image_data in IMAGE_STORAGE.items():
-            images[image_id] = image_data
+        key = idempotency_key or request.idempotency_key
+        if request.stream or request.input.get("stream"):
+            if not key:
+                return StreamingResponse(stream_agent(session_id, user_message), media_type="text/event-stream")
+            # A retry replays the stored result; a repeat while the stream is still running gets 409
+            request_fingerprint = fingerprint(request.input)
+            stored = get_idempotency_cache().begin((session_id, key), request_fingerprint)
+            if stored is not None:
+                return StreamingResponse(stream_response(stored), media_type="text/event-stream")
+            return StreamingResponse(stream_agent(session_id, user_message, (session_id, key), request_fingerprint),
+                                     media_type="text/event-stream")
         
-        # Clear storage after extraction
-        IMAGE_STORAGE.clear()
+        async def invoke() -> dict:
+            fulfilled_before = fulfilled_requests(session_id)
+            
+            # Unambiguous purchase requests skip LLM orchestration of the fixed tool sequence
+            image_prompt = match_purchase_intent(user_message)
+            if image_prompt:
+                logger.info(f"⚡ [FAST_PATH] Session:{session_id} | Prompt:{image_prompt[:100]}")
+                purchase = await asyncio.to_thread(purchase_image, prompt=image_prompt, session_id=session_id, authorize=True)
+                if purchase['status'] == 'busy':
+                    raise HTTPException(status_code=429, detail=purchase['error'], headers={"Retry-After": str(purchase['retry_after'])})
+                text = purchase['message'] if purchase['status'] == 'success' else purchase['error']
+                # Keep the exchange in the conversation so later turns can refer to the image
+                await agent_pool.record(session_id, [
+                    {"role": "user", "content": [{"text": user_message}]},
+                    {"role": "assistant", "content": [{"text": text}]}
+                ])
+                return {
+                    "message": {"role": "assistant", "content": [{"text": text}]},
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "model": "fast-path",
+                    "session_id": session_id,
+                    "image_ids": new_image_ids(session_id, fulfilled_before)
+                }
+            
+            logger.info(f"🤖 [AGENT_START] Session:{session_id} | Message:{user_message[:100]}")
+            result = await agent_pool.invoke(session_id, user_message)
+            logger.info(f"💬 [AGENT_RESPONSE] Session:{session_id} | Response:{str(result.message)[:300]}...")
+            
+            return {
+                "message": result.message,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "model": "claude-sonnet-4.5",
+                "session_id": session_id,
+                # Images generated by this session during this invocation
+                "image_ids": new_image_ids(session_id, fulfilled_before)
+            }
         
-        response = {
-            "message": result.message,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "model": "claude-sonnet-4.5",
-            "session_id": session_id,
-            "images": images
-        }
-
-        return InvocationResponse(output=response)
+        # Retries carrying the same idempotency key share one run and its result
+        if key:
+            response = await get_idempotency_cache().run((session_id, key), fingerprint(request.input), invoke)
+        else:
+            response = await invoke()
+        return InvocationResponse(output=await with_images(response))
 
+    except HTTPException:
+        raise
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Agent error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Agent error: {str(e)}")
 
+@app.post("/purchase_image")
+async def purchase_image_endpoint(request: PurchaseRequest, idempotency_key: Optional[str] = Header(None)):
+    """Deterministic x402 purchase without LLM orchestration.
+
+    Call once with a prompt to get the estimate (status authorization_required), then
+    again with the returned request_id and authorize=true to pay and generate.
+    Passing a prompt with authorize=true does both in one call.
+    """
+    logger = logging.getLogger(__name__)
+    session_id = request.session_id or "default"
+    
+    async def purchase() -> dict:
+        fulfilled_before = fulfilled_requests(session_id)
+        try:
+            result = await asyncio.to_thread(
+                purchase_image,
+                prompt=request.prompt,
+                session_id=session_id,
+                request_id=request.request_id,
+                authorize=request.authorize
+            )
+        except Exception as e:
+            logger.error(f"Purchase error: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Purchase error: {str(e)}")
+        
+        if result['status'] == 'busy':
+            # Includes the request_id: retrying with it reuses the authorized payment
+            raise HTTPException(status_code=429, detail=result, headers={"Retry-After": str(result['retry_after'])})
+        if result['status'] == 'error':
+            raise HTTPException(status_code=400, detail=result['error'])
+        
+        result['session_id'] = session_id
+        result['image_ids'] = new_image_ids(session_id, fulfilled_before)
+        return result
+    
+    key = idempotency_key or request.idempotency_key
+    if not key:
+        return await with_images(await purchase())
+    try:
+        body = {"prompt": request.prompt, "request_id": request.request_id, "authorize": request.authorize}
+        return await with_images(await get_idempotency_cache().run((session_id, key), fingerprint(body), purchase))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+
+@app.get("/images/{image_id}")
+async def get_image(image_id: str):
+    """Stream a generated image from the image store"""
+    if not is_image_id(image_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        # Opened once up front: the image may be evicted at any time
+        chunks = await asyncio.to_thread(get_image_store().iter_chunks, image_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return StreamingResponse(
+        chunks,
+        media_type="image/png",
+        # Content-addressed IDs never change content
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.get("/settlements/{request_id}")
+async def get_settlement(request_id: str):
+    """Settlement status (pending, settled or failed) for a paid request"""
+    settlement = await asyncio.to_thread(get_settlements().status, request_id)
+    if settlement is None:
+        raise HTTPException(status_code=404, detail="Settlement not found")
+    return settlement
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latency histograms and component gauges in the Prometheus text format"""
+    body = await asyncio.to_thread(telemetry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 @app.get("/ping")
 async def ping():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness (distinct from /ping liveness): wallet, Bedrock clients and model initialized"""
+    report = startup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8080)
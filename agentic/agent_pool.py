@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing (overridable via environment)
+AGENT_POOL_MAX_SESSIONS = int(os.getenv('AGENT_POOL_MAX_SESSIONS', '64'))
+AGENT_POOL_IDLE_TTL = float(os.getenv('AGENT_POOL_IDLE_TTL', '900'))
+AGENT_POOL_MAX_CONCURRENCY = int(os.getenv('AGENT_POOL_MAX_CONCURRENCY', '16'))
+
+# Acquire hook postponed until the session lock is held (the agent was busy when acquired)
+_DEFERRED = object()
+
+
+class _PooledAgent:
+    """Agent bound to one session plus its bookkeeping."""
+
+    __slots__ = ('agent', 'lock', 'in_use', 'last_used')
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.lock = asyncio.Lock()  # Serializes invocations within a session
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class AgentPool:
+    """Session-keyed agent pool with LRU eviction and idle TTL.
+
+    Each session gets its own Agent so conversation state never leaks between
+    users. Invocations run in a worker thread pool so the event loop stays free,
+    with a global concurrency limit and one in-flight invocation per session.
+    """
+
+    def __init__(self, factory, max_sessions=None, idle_ttl=None, max_concurrency=None, on_acquire=None, on_record=None):
+        self._factory = factory
+        # (session_id, agent) -> concurrent Future or None, e.g. start a memory prefetch
+        # that the invocation awaits before it runs. It may rewrite the agent's state, so it
+        # only runs early for an idle agent and otherwise waits for the session lock.
+        self._on_acquire = on_acquire
+        self._on_record = on_record  # (session_id, agent, messages) -> None, e.g. persist to memory
+        self.max_sessions = max_sessions or AGENT_POOL_MAX_SESSIONS
+        self.idle_ttl = idle_ttl if idle_ttl is not None else AGENT_POOL_IDLE_TTL
+        self.max_concurrency = max_concurrency or AGENT_POOL_MAX_CONCURRENCY
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='agent')
+
+    def _acquire(self, session_id: str):
+        """Get or create the pooled agent for a session and mark it in use.
+
+        Returns the entry and the acquire hook's future (None without one), or
+        _DEFERRED when another invocation is using the agent.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                entry = _PooledAgent(self._factory(session_id))
+                self._entries[session_id] = entry
+                logger.info(f"[AGENT_POOL] Created agent for session {session_id} ({len(self._entries)} active)")
+            self._entries.move_to_end(session_id)
+            entry.in_use += 1
+            busy = entry.in_use > 1
+            self._evict()
+        if busy:
+            return entry, _DEFERRED
+        return entry, self._run_hook(session_id, entry)
+
+    def _run_hook(self, session_id: str, entry: _PooledAgent):
+        if self._on_acquire is None:
+            return None
+        try:
+            return self._on_acquire(session_id, entry.agent)
+        except Exception as e:
+            logger.warning(f"[AGENT_POOL] Acquire hook failed for session {session_id}: {str(e)}")
+            return None
+
+    async def _wait_ready(self, session_id: str, entry: _PooledAgent, ready) -> None:
+        """Await the acquire hook's future without blocking the loop (a failure is logged, not raised).
+        Caller holds the session lock."""
+        if ready is _DEFERRED:
+            ready = self._run_hook(session_id, entry)
+        if ready is None:
+            return
+        try:
+            await asyncio.wrap_future(ready)
+        except Exception as e:
+            logger.warning(f"[AGENT_POOL] Acquire hook failed for session {session_id}: {str(e)}")
+
+    def _release(self, entry: _PooledAgent) -> None:
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    def _evict(self) -> None:
+        """Drop idle-expired agents, then least recently used ones over capacity.
+
+        Agents with an invocation in flight are never evicted, so the pool may
+        temporarily exceed max_sessions under load. Caller must hold self._lock.
+        """
+        now = time.monotonic()
+        for session_id, entry in list(self._entries.items()):
+            if entry.in_use == 0 and now - entry.last_used > self.idle_ttl:
+                del self._entries[session_id]
+                logger.info(f"[AGENT_POOL] Expired idle session {session_id}")
+
+        for session_id, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_sessions:
+                break
+            if entry.in_use == 0:
+                del self._entries[session_id]
+                logger.info(f"[AGENT_POOL] Evicted session {session_id}")
+
+    async def invoke(self, session_id: str, message: str):
+        """Run the session's agent on a worker thread and return its result"""
+        entry, ready = self._acquire(session_id)
+        try:
+            async with entry.lock:
+                await self._wait_ready(session_id, entry, ready)
+                async with self._semaphore:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor, entry.agent, message)
+        finally:
+            self._release(entry)
+
+    async def record(self, session_id: str, messages: list) -> None:
+        """Append an exchange handled outside the agent (e.g. a fast-path purchase) to its conversation"""
+        entry, ready = self._acquire(session_id)
+        try:
+            async with entry.lock:
+                # A memory restore still in flight would replace the agent's messages
+                await self._wait_ready(session_id, entry, ready)
+                if self._on_record is not None:
+                    await asyncio.to_thread(self._on_record, session_id, entry.agent, messages)
+                entry.agent.messages.extend(messages)
+        finally:
+            self._release(entry)
+
+    async def stream(self, session_id: str, message: str, model=None, event_sink=None):
+        """Stream the session's agent events, optionally with a streaming model and hook event sink.
+
+        The model and sink are swapped in only for the duration of this invocation,
+        which is safe because the session lock serializes access to the agent.
+        """
+        entry, ready = self._acquire(session_id)
+        try:
+            async with entry.lock:
+                await self._wait_ready(session_id, entry, ready)
+                async with self._semaphore:
+                    agent = entry.agent
+                    default_model = agent.model
+                    if model is not None:
+                        agent.model = model
+                    agent.event_sink = event_sink
+                    try:
+                        async for event in agent.stream_async(message):
+                            yield event
+                    finally:
+                        agent.model = default_model
+                        agent.event_sink = None
+        finally:
+            self._release(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._entries),
+                'in_use': sum(1 for entry in self._entries.values() if entry.in_use),
+                'max_sessions': self.max_sessions,
+                'max_concurrency': self.max_concurrency,
+                'idle_ttl': self.idle_ttl
+            }
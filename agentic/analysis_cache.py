@@ -0,0 +1,82 @@
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '500'))
+
+SECTION_HEADER = re.compile(r'^###\s*(.+?)\s*$', re.MULTILINE)
+
+
+def parse_analysis_types(analysis_type: str) -> list:
+    """Split a comma-separated analysis request into normalized, de-duplicated types"""
+    types = []
+    for part in analysis_type.split(','):
+        name = re.sub(r'\s+', ' ', part).strip().lower()
+        if name and name not in types:
+            types.append(name)
+    return types or ['monetization']
+
+
+def split_sections(text: str, analysis_types: list) -> dict:
+    """Split a batched analysis into {type: text} using its '### <type>' headers.
+
+    Types whose section can't be found are left out, so they are not cached.
+    """
+    sections = {}
+    matches = list(SECTION_HEADER.finditer(text))
+    for i, match in enumerate(matches):
+        name = match.group(1).strip().lower()
+        if name in analysis_types:
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            sections[name] = text[match.end():end].strip()
+    return sections
+
+
+class AnalysisCache:
+    """LRU cache of analysis text keyed by (image content hash, analysis type)"""
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_hash: str, analysis_type: str):
+        with self._lock:
+            text = self._entries.get((image_hash, analysis_type))
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((image_hash, analysis_type))
+            self.hits += 1
+            return text
+
+    def put(self, image_hash: str, analysis_type: str, text: str) -> None:
+        with self._lock:
+            self._entries[(image_hash, analysis_type)] = text
+            self._entries.move_to_end((image_hash, analysis_type))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> AnalysisCache:
+    """Get or create the analysis cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache()
+    return _cache
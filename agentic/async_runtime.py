@@ -0,0 +1,45 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Threads for blocking calls (boto3, CDP signing) made from the shared loop
+TOOLS_IO_THREADS = int(os.getenv('TOOLS_IO_THREADS', '32'))
+
+# Long-lived event loop shared by all tool I/O
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Get or start the shared tool event loop (runs in a daemon thread)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=TOOLS_IO_THREADS, thread_name_prefix='tools-io'))
+            threading.Thread(target=loop.run_forever, daemon=True, name='tools-loop').start()
+            _loop = loop
+            logger.info("Started shared tools event loop")
+    return _loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared loop from synchronous code and wait for the result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+
+async def run_shared(coro):
+    """Await a coroutine on the shared loop from any event loop.
+
+    Clients created on the shared loop can only be used there, so tools hop onto it
+    regardless of which loop (agent, streaming endpoint) invoked them.
+    """
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
@@ -0,0 +1,141 @@
+import os
+import time
+import logging
+import threading
+from wallet import get_balance
+from web3_provider import get_web3
+
+logger = logging.getLogger(__name__)
+
+# Max age of a cached balance even without a new block
+BALANCE_CACHE_TTL = float(os.getenv('BALANCE_CACHE_TTL', '30'))
+# Block polling interval (0 disables polling; balances then refresh on TTL only)
+BALANCE_BLOCK_POLL_INTERVAL = float(os.getenv('BALANCE_BLOCK_POLL_INTERVAL', '5'))
+# Stop refreshing on new blocks once nobody has read the balance for this long
+BALANCE_ACTIVE_WINDOW = float(os.getenv('BALANCE_ACTIVE_WINDOW', '300'))
+# Authorized-but-unsettled reservations expire after this long
+BALANCE_RESERVATION_TTL = float(os.getenv('BALANCE_RESERVATION_TTL', '600'))
+
+
+class BalanceCache:
+    """Cached wallet balances with block-aware refresh and local spend reservations.
+
+    A background poller watches the block number and refreshes the cached balances
+    when a new block arrives (while the cache is in use), so reads are memory
+    lookups. Our own settlements invalidate the cache explicitly. Reservations track
+    USDC authorized by make_payment but not yet settled, so concurrent consents
+    can't authorize more than the wallet holds.
+    """
+
+    def __init__(self, wallet, ttl: float = BALANCE_CACHE_TTL, poll_interval: float = BALANCE_BLOCK_POLL_INTERVAL):
+        self.wallet = wallet
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._balance = None
+        self._fetched_at = 0.0
+        self._last_read = 0.0
+        self._block = None
+        self._reservations = {}  # request_id -> (amount_usdc, reserved_at)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # Single-flight refreshes
+        self._poller = None
+
+    def refresh(self) -> dict:
+        """Fetch balances over RPC (concurrent callers share one fetch)"""
+        started = time.monotonic()
+        with self._refresh_lock:
+            with self._lock:
+                if self._balance is not None and self._fetched_at >= started:
+                    return self._balance
+            balance_info = get_balance(self.wallet)
+            if 'error' not in balance_info:
+                with self._lock:
+                    self._balance = balance_info
+                    self._fetched_at = time.monotonic()
+            return balance_info
+
+    def get(self) -> dict:
+        """Cached balances, refreshed over RPC only when missing, expired or invalidated"""
+        self._ensure_poller()
+        with self._lock:
+            self._last_read = time.monotonic()
+            if self._balance is not None and self._last_read - self._fetched_at < self.ttl:
+                return self._balance
+        return self.refresh()
+
+    def invalidate(self) -> None:
+        """Force the next read to refetch (e.g. after our own settlement)"""
+        with self._lock:
+            self._fetched_at = 0.0
+
+    def reserve(self, request_id: str, amount_usdc: float) -> None:
+        with self._lock:
+            self._reservations[request_id] = (amount_usdc, time.monotonic())
+
+    def try_reserve(self, request_id: str, amount_usdc: float, ttl: float = BALANCE_RESERVATION_TTL):
+        """Reserve amount_usdc if it is available, checked and reserved atomically.
+
+        Returns (reserved, available_usdc) - concurrent consents can't all pass the check.
+        """
+        balance = self.get().get('usdc_balance', 0.0)  # RPC on a miss - outside the lock
+        with self._lock:
+            reserved = self._reserved(time.monotonic(), ttl)
+            available = balance - reserved
+            if available < amount_usdc:
+                return False, available
+            self._reservations[request_id] = (amount_usdc, time.monotonic())
+            return True, available
+
+    def release(self, request_id: str) -> None:
+        with self._lock:
+            self._reservations.pop(request_id, None)
+
+    def _reserved(self, now: float, ttl: float) -> float:
+        """Drop expired reservations and sum the rest. Caller holds self._lock."""
+        for request_id, (_, reserved_at) in list(self._reservations.items()):
+            if now - reserved_at > ttl:
+                del self._reservations[request_id]
+        return sum(amount for amount, _ in self._reservations.values())
+
+    def reserved_usdc(self) -> float:
+        with self._lock:
+            return self._reserved(time.monotonic(), BALANCE_RESERVATION_TTL)
+
+    def available_usdc(self, balance_info: dict = None) -> float:
+        """USDC balance minus authorized-but-unsettled reservations"""
+        balance_info = balance_info or self.get()
+        return balance_info.get('usdc_balance', 0.0) - self.reserved_usdc()
+
+    def _ensure_poller(self) -> None:
+        if self.poll_interval <= 0 or self._poller is not None:
+            return
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, daemon=True, name='balance-poller')
+                self._poller.start()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            if time.monotonic() - self._last_read > BALANCE_ACTIVE_WINDOW:
+                continue
+            try:
+                block = get_web3().eth.block_number
+                if block != self._block:
+                    self._block = block
+                    self.invalidate()
+                    self.refresh()
+            except Exception as e:
+                logger.warning(f"Balance block poll failed: {str(e)}")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_balance_cache(wallet) -> BalanceCache:
+    """Get or create the balance cache for a wallet"""
+    with _caches_lock:
+        cache = _caches.get(id(wallet))
+        if cache is None:
+            cache = _caches[id(wallet)] = BalanceCache(wallet)
+    return cache
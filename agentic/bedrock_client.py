@@ -0,0 +1,203 @@
+import os
+import time
+import boto3
+import logging
+import threading
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+from admission import ADMISSION_BEDROCK_CONCURRENCY
+from agent_pool import AGENT_POOL_MAX_CONCURRENCY
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+BEDROCK_REGION = os.getenv('AWS_REGION', 'us-east-1')
+# botocore retries: adaptive adds client-side rate limiting to jittered exponential backoff
+BEDROCK_RETRY_MODE = os.getenv('BEDROCK_RETRY_MODE', 'adaptive')
+BEDROCK_MAX_ATTEMPTS = int(os.getenv('BEDROCK_MAX_ATTEMPTS', '5'))
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv('BEDROCK_CONNECT_TIMEOUT', '5'))
+BEDROCK_READ_TIMEOUT = float(os.getenv('BEDROCK_READ_TIMEOUT', '120'))
+# Overall limit for one Nova Canvas call, retries and fallback targets included. Paid
+# generations must finish inside the x402 payment window (maxTimeoutSeconds=300 in
+# lambda/seller.js); the rest of that window covers retry backoff and the payment itself
+BEDROCK_INVOKE_DEADLINE = float(os.getenv('BEDROCK_INVOKE_DEADLINE', '240'))
+# Nova Canvas clients shorten the read timeout so every attempt on a target fits the deadline
+# (text and vision calls keep BEDROCK_READ_TIMEOUT: long analyses need it)
+BEDROCK_IMAGE_READ_TIMEOUT = max(1.0, min(
+    BEDROCK_READ_TIMEOUT, BEDROCK_INVOKE_DEADLINE / BEDROCK_MAX_ATTEMPTS - BEDROCK_CONNECT_TIMEOUT))
+# Image generations plus one text/vision call per concurrent agent invocation
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv(
+    'BEDROCK_MAX_POOL_CONNECTIONS', str(ADMISSION_BEDROCK_CONCURRENCY + AGENT_POOL_MAX_CONCURRENCY)))
+# Tried in order once retries are exhausted: the model's cross-region inference profile
+# (us.<model> for a base ID, global.<model> for a geographic profile ID), then each fallback region
+BEDROCK_INFERENCE_PROFILE_FALLBACK = os.getenv('BEDROCK_INFERENCE_PROFILE_FALLBACK', 'false').lower() == 'true'
+BEDROCK_FALLBACK_REGIONS = [region.strip() for region in os.getenv('BEDROCK_FALLBACK_REGIONS', '').split(',') if region.strip()]
+# How long a throttled or unavailable target is tried last
+BEDROCK_COOLDOWN = float(os.getenv('BEDROCK_COOLDOWN', '30'))
+
+# Errors that mean "try elsewhere" rather than "this request is wrong"
+FALLBACK_ERROR_CODES = {
+    'ThrottlingException', 'ServiceUnavailableException', 'ModelNotReadyException',
+    'ModelTimeoutException', 'InternalServerException', 'ServiceQuotaExceededException'
+}
+_GEOGRAPHY_PREFIXES = {'us', 'eu', 'apac'}
+# Models without cross-region inference profiles get region fallback only
+_NO_INFERENCE_PROFILE = ('nova-canvas',)
+
+
+def client_config(max_attempts: int = BEDROCK_MAX_ATTEMPTS, read_timeout: float = BEDROCK_READ_TIMEOUT) -> Config:
+    """botocore config shared by the invoke_model clients and the agent's models"""
+    return Config(
+        retries={'mode': BEDROCK_RETRY_MODE, 'total_max_attempts': max_attempts},
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        tcp_keepalive=True
+    )
+
+
+def inference_profile_id(model_id: str, region: str):
+    """Cross-region inference profile to fall back to (None if the model has none left to try).
+
+    A base model ID maps to its geographic profile for the region, and a geographic
+    profile such as us.<model> maps to global.<model>.
+    """
+    prefix, _, base_id = model_id.partition('.')
+    if prefix == 'global' or any(name in model_id for name in _NO_INFERENCE_PROFILE):
+        return None
+    if prefix in _GEOGRAPHY_PREFIXES:
+        return f"global.{base_id}"
+    geography = {'us': 'us', 'ca': 'us', 'eu': 'eu', 'ap': 'apac'}.get(region.split('-', 1)[0])
+    return f"{geography}.{model_id}" if geography else None
+
+
+def should_fall_back(error: Exception) -> bool:
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in FALLBACK_ERROR_CODES
+    return isinstance(error, (BotoConnectionError, ReadTimeoutError))
+
+
+# Heavy clients are created on first use (or by startup warm-up) for fast cold starts
+_clients = {}  # region, or (region, max_attempts, read_timeout) for other settings -> bedrock-runtime client
+_clients_lock = threading.Lock()
+
+def get_bedrock_runtime(region: str = None, max_attempts: int = BEDROCK_MAX_ATTEMPTS, read_timeout: float = BEDROCK_READ_TIMEOUT):
+    """Get or create the Bedrock runtime client for a region (default AWS_REGION)"""
+    region = region or BEDROCK_REGION
+    default = max_attempts == BEDROCK_MAX_ATTEMPTS and read_timeout == BEDROCK_READ_TIMEOUT
+    key = region if default else (region, max_attempts, read_timeout)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                config = client_config(max_attempts, read_timeout)
+                client = _clients[key] = boto3.client('bedrock-runtime', region_name=region, config=config)
+    return client
+
+
+class BedrockInvoker:
+    """invoke_model with tuned clients and fallback targets.
+
+    Each target (region, model ID) is a client whose botocore retries absorb brief
+    throttling. When a target still fails with a throttling or availability error, the
+    call moves on to the next target, and the failed one is tried last for
+    BEDROCK_COOLDOWN seconds. Client errors such as validation failures are raised
+    immediately. A Nova Canvas call (paid generation) is bounded by
+    BEDROCK_INVOKE_DEADLINE: each target gets only the attempts whose read timeouts fit
+    in the time left, and no target is started once not even one fits.
+    """
+
+    def __init__(self, region: str = BEDROCK_REGION, fallback_regions=None, profile_fallback: bool = BEDROCK_INFERENCE_PROFILE_FALLBACK):
+        self.region = region
+        self.fallback_regions = BEDROCK_FALLBACK_REGIONS if fallback_regions is None else fallback_regions
+        self.profile_fallback = profile_fallback
+        self._down_until = {}  # (region, model_id) -> monotonic time
+        self._lock = threading.Lock()
+        self.invocations = 0
+        self.retries = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def targets(self, model_id: str) -> list:
+        """(region, model_id) pairs to try, cooling-down targets last"""
+        targets = [(self.region, model_id)]
+        profile_id = inference_profile_id(model_id, self.region) if self.profile_fallback else None
+        if profile_id:
+            targets.append((self.region, profile_id))
+        targets.extend((region, model_id) for region in self.fallback_regions if region != self.region)
+        now = time.monotonic()
+        with self._lock:
+            return sorted(targets, key=lambda target: self._down_until.get(target, 0) > now)
+
+    def _count(self, **increments) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def invoke(self, **kwargs) -> dict:
+        model_id = kwargs.get('modelId', '')
+        primary = (self.region, model_id)
+        paid = 'nova-canvas' in model_id
+        stage = 'bedrock.image' if paid else 'bedrock.text'
+        errors = {}
+        deadline = time.monotonic() + BEDROCK_INVOKE_DEADLINE if paid else None
+        for target in self.targets(model_id):
+            region, target_model_id = target
+            attempts, read_timeout = BEDROCK_MAX_ATTEMPTS, BEDROCK_READ_TIMEOUT
+            if deadline is not None:
+                # Worst case is every attempt timing out, so only start the attempts that fit
+                remaining = deadline - time.monotonic()
+                attempts = min(BEDROCK_MAX_ATTEMPTS, int(remaining // (BEDROCK_CONNECT_TIMEOUT + BEDROCK_IMAGE_READ_TIMEOUT)))
+                if attempts < 1 and errors:
+                    logger.warning(f"[BEDROCK] {model_id} deadline of {BEDROCK_INVOKE_DEADLINE:g}s reached, not trying further targets")
+                    break
+                attempts, read_timeout = max(attempts, 1), BEDROCK_IMAGE_READ_TIMEOUT
+            try:
+                with telemetry.span(stage, model_id=target_model_id, region=region):
+                    client = get_bedrock_runtime(region, attempts, read_timeout)
+                    response = client.invoke_model(**{**kwargs, 'modelId': target_model_id})
+            except Exception as e:
+                # A bad request fails everywhere; fallback targets may also lack the model
+                if target == primary and not should_fall_back(e):
+                    self._count(invocations=1, failures=1)
+                    raise
+                errors[target] = e
+                with self._lock:
+                    self._down_until[target] = time.monotonic() + BEDROCK_COOLDOWN
+                logger.warning(f"[BEDROCK] {target_model_id} in {region} failed, trying next target: {str(e)}")
+                continue
+            retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            self._count(invocations=1, retries=retries, fallbacks=int(target != primary))
+            if errors:
+                logger.info(f"[BEDROCK] {model_id} served by {target_model_id} in {region}")
+            return response
+        self._count(invocations=1, failures=1)
+        raise errors.get(primary) or next(iter(errors.values()))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'invocations': self.invocations,
+                'retries': self.retries,
+                'fallbacks': self.fallbacks,
+                'failures': self.failures,
+                'cooling_down': sum(1 for until in self._down_until.values() if until > now)
+            }
+
+
+_invoker = None
+_invoker_lock = threading.Lock()
+
+def get_bedrock_invoker() -> BedrockInvoker:
+    """Get or create the Bedrock invoker"""
+    global _invoker
+    with _invoker_lock:
+        if _invoker is None:
+            _invoker = BedrockInvoker()
+    return _invoker
+
+
+def invoke_model(**kwargs) -> dict:
+    return get_bedrock_invoker().invoke(**kwargs)
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import logging
+import threading
+from strands.agent.conversation_manager import (
+    ConversationManager,
+    NullConversationManager,
+    SlidingWindowConversationManager,
+)
+
+logger = logging.getLogger(__name__)
+
+# sliding: Strands default window; budget (opt-in): strip old tool noise and trim to CONTEXT_TOKEN_BUDGET; none: keep all
+CONTEXT_MANAGEMENT = os.getenv('CONTEXT_MANAGEMENT', 'sliding').lower()
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '8000'))
+# Most recent turns kept verbatim (tool results included)
+CONTEXT_KEEP_RECENT_TURNS = int(os.getenv('CONTEXT_KEEP_RECENT_TURNS', '2'))
+# Older tool results are cut to this many characters
+CONTEXT_TOOL_RESULT_CHARS = int(os.getenv('CONTEXT_TOOL_RESULT_CHARS', '160'))
+CONTEXT_SUMMARY_CHARS = int(os.getenv('CONTEXT_SUMMARY_CHARS', '1200'))
+
+# Rough token estimate for Claude (about 4 characters per token)
+_CHARS_PER_TOKEN = 4
+_URL = re.compile(r'https?://\S+')
+_IDS = re.compile(r'\b(?:IMAGE_IDS?|REQUEST_ID|Request ID|Image ID)\s*[:=]\s*([\w,\-]+)')
+SUMMARY_PREFIX = '[Earlier conversation summary]'
+
+
+def estimate_tokens(messages: list) -> int:
+    """Approximate input tokens for a message list (text, tool inputs and tool results)"""
+    chars = 0
+    for message in messages:
+        for block in message.get('content', []):
+            if 'text' in block:
+                chars += len(block['text'])
+            elif 'toolUse' in block:
+                chars += len(json.dumps(block['toolUse'].get('input', {}), default=str))
+            elif 'toolResult' in block:
+                chars += sum(len(item.get('text', '')) for item in block['toolResult'].get('content', []))
+    return chars // _CHARS_PER_TOKEN
+
+
+def is_turn_start(message: dict) -> bool:
+    """A user prompt (not a tool result) - the only safe place to cut history"""
+    return message.get('role') == 'user' and not any('toolResult' in block for block in message.get('content', []))
+
+
+def strip_tool_noise(text: str, limit: int = CONTEXT_TOOL_RESULT_CHARS) -> str:
+    """Keep the gist of a tool result: no URLs or blank lines, capped length"""
+    text = _URL.sub('', text)
+    text = '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+    return text if len(text) <= limit else text[:limit].rstrip() + ' [...]'
+
+
+class BudgetConversationManager(SlidingWindowConversationManager):
+    """Keeps each session's context under a token budget after every turn.
+
+    Tool results older than the last CONTEXT_KEEP_RECENT_TURNS turns are reduced to
+    their gist (x402 debug output, explorer links and success boilerplate dropped).
+    If the history is still over budget, the oldest turns are cut at prompt
+    boundaries and replaced by a short summary of the prompts and IDs they carried.
+    The current turn is never cut. Context overflow errors still fall back to the
+    sliding window behaviour.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, keep_recent_turns: int = CONTEXT_KEEP_RECENT_TURNS):
+        super().__init__()
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.saved_tokens = 0  # Compaction so far - not re-sent on any later turn
+
+    def apply_management(self, agent, **kwargs) -> None:
+        messages = agent.messages
+        before = estimate_tokens(messages)
+        turn_starts = [i for i, message in enumerate(messages) if is_turn_start(message)]
+
+        # Strip noise from tool results outside the recent turns
+        if len(turn_starts) > self.keep_recent_turns:
+            recent_start = turn_starts[-self.keep_recent_turns] if self.keep_recent_turns else len(messages)
+            for message in messages[:recent_start]:
+                for block in message.get('content', []):
+                    for item in block.get('toolResult', {}).get('content', []):
+                        if 'text' in item:
+                            item['text'] = strip_tool_noise(item['text'])
+
+        # Cut the oldest turns (keeping the current one) until within budget
+        dropped = []
+        while estimate_tokens(messages) > self.token_budget and len(turn_starts) > 1:
+            cut = turn_starts[1]
+            dropped.extend(messages[:cut])
+            del messages[:cut]
+            turn_starts = [start - cut for start in turn_starts[1:]]
+        if dropped:
+            self.removed_message_count += len(dropped)
+            self._prepend_summary(messages, dropped)
+
+        after = estimate_tokens(messages)
+        self.saved_tokens += before - after
+        get_context_metrics().record(after + self.saved_tokens, after)
+        if after < before:
+            session_id = getattr(agent.state, 'session_id', 'default')
+            logger.info(f"[CONTEXT] Session:{session_id} | Tokens:{before}->{after} | Saved per turn:{self.saved_tokens} | Dropped messages:{len(dropped)}")
+
+    def _prepend_summary(self, messages: list, dropped: list) -> None:
+        """Carry the dropped turns' prompts and IDs forward in the first remaining prompt"""
+        notes = []
+        seen_ids = set()
+        for message in dropped:
+            for block in message.get('content', []):
+                text = block.get('text', '')
+                if text.startswith(SUMMARY_PREFIX):
+                    notes.append(text.split('\n', 1)[0][len(SUMMARY_PREFIX):].strip())
+                    continue
+                if text and is_turn_start(message):
+                    notes.append(f"User asked: {text.splitlines()[0][:100]}")
+                for item in block.get('toolResult', {}).get('content', []):
+                    for match in _IDS.finditer(item.get('text', '')):
+                        if match.group(1) not in seen_ids:
+                            seen_ids.add(match.group(1))
+                            notes.append(match.group(0))
+        summary = ' | '.join(note for note in notes if note)
+        if len(summary) > CONTEXT_SUMMARY_CHARS:
+            summary = '... ' + summary[-CONTEXT_SUMMARY_CHARS:]
+
+        content = messages[0]['content']
+        if content and content[0].get('text', '').startswith(SUMMARY_PREFIX):
+            content.pop(0)
+        content.insert(0, {'text': f"{SUMMARY_PREFIX} {summary}\n"})
+
+
+class ContextMetrics:
+    """Per-turn token accounting for context compaction"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.last_saved = 0
+
+    def record(self, uncompacted: int, compacted: int) -> None:
+        """Record one turn's context size with and without compaction"""
+        with self._lock:
+            self.turns += 1
+            self.tokens_before += uncompacted
+            self.tokens_after += compacted
+            self.last_saved = uncompacted - compacted
+
+    def stats(self) -> dict:
+        with self._lock:
+            saved = self.tokens_before - self.tokens_after
+            return {
+                'mode': CONTEXT_MANAGEMENT,
+                'turns': self.turns,
+                'tokens_saved': saved,
+                'avg_tokens_saved_per_turn': saved / self.turns if self.turns else 0.0,
+                'last_tokens_saved': self.last_saved,
+                'avg_context_tokens': self.tokens_after / self.turns if self.turns else 0.0
+            }
+
+
+_metrics = ContextMetrics()
+
+def get_context_metrics() -> ContextMetrics:
+    return _metrics
+
+
+def create_conversation_manager() -> ConversationManager:
+    """Conversation manager for a new agent according to CONTEXT_MANAGEMENT"""
+    if CONTEXT_MANAGEMENT == 'budget':
+        return BudgetConversationManager()
+    if CONTEXT_MANAGEMENT == 'none':
+        return NullConversationManager()
+    return SlidingWindowConversationManager()
@@ -1,4 +1,4 @@
-import requests
+from price_oracle import get_price_oracle
 
 # Nova Canvas fixed per-image pricing
 NOVA_CANVAS_PRICING = {
@@ -7,17 +7,13 @@ NOVA_CANVAS_PRICING = {
 }
 
 def get_usdc_price() -> float:
-    """Fetch USDC price from CoinGecko (should be ~$1.00)"""
-    try:
-        response = requests.get('https://api.coingecko.com/api/v3/simple/price?ids=usd-coin&vs_currencies=usd', timeout=5)
-        return response.json()['usd-coin']['usd']
-    except:
-        return 1.0
+    """Get USDC price from the cached price oracle (should be ~$1.00)"""
+    return get_price_oracle().get_price()
 
-def estimate_cost(content: str, model: str = 'nova-canvas', resolution: str = '1024x1024', quality: str = 'standard') -> dict:
+def estimate_cost(content: str, model: str = 'nova-canvas', resolution: str = '1024x1024', quality: str = 'standard', count: int = 1) -> dict:
     """Estimate cost for Nova Canvas image generation (fixed per-image pricing)"""
     # Nova Canvas uses fixed pricing per image, not token-based
-    total_cost_usd = NOVA_CANVAS_PRICING[resolution][quality]
+    total_cost_usd = round(NOVA_CANVAS_PRICING[resolution][quality] * count, 6)
     
     usdc_price = get_usdc_price()
     total_cost_usdc = total_cost_usd / usdc_price
@@ -27,6 +23,7 @@ def estimate_cost(content: str, model: str = 'nova-canvas', resolution: str = '1
         'model': model,
         'resolution': resolution,
         'quality': quality,
+        'count': count,
         'totalCost': total_cost_usdc_wei,
         'totalCostUSD': total_cost_usd,
         'usdcPrice': usdc_price
@@ -0,0 +1,93 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: serve repeated prompts from previously generated images (still paid via x402)
+GENERATION_CACHE = os.getenv('GENERATION_CACHE', 'false').lower() == 'true'
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', '1000'))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive prompt form used for cache keys"""
+    return re.sub(r'\s+', ' ', prompt).strip().lower()
+
+
+def make_key(prompt: str, config: dict) -> str:
+    """Cache key for a prompt plus the full generation config (size, quality, count, seed)"""
+    payload = json.dumps({'prompt': normalize_prompt(prompt), 'config': config}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class GenerationCache:
+    """LRU index from generation key to content-addressed image IDs.
+
+    The index lives in memory and the image bytes live in the image store (disk or
+    S3), which bounds their size. Entries whose images were evicted from the store
+    count as misses and are dropped.
+    """
+
+    def __init__(self, image_store, max_entries: int = GENERATION_CACHE_MAX_ENTRIES):
+        self.image_store = image_store
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        """Return the cached image IDs for key, or None on a miss"""
+        with self._lock:
+            image_ids = self._entries.get(key)
+            if image_ids is not None:
+                self._entries.move_to_end(key)
+
+        if image_ids is not None and all(self.image_store.exists(image_id) for image_id in image_ids):
+            with self._lock:
+                self.hits += 1
+            return image_ids
+
+        with self._lock:
+            if image_ids is not None:
+                self._entries.pop(key, None)
+            self.misses += 1
+        return None
+
+    def put(self, key: str, image_ids: list) -> None:
+        with self._lock:
+            self._entries[key] = list(image_ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_generation_cache(image_store):
+    """Get or create the generation cache, or None when GENERATION_CACHE is disabled"""
+    global _cache
+    if not GENERATION_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = GenerationCache(image_store)
+    return _cache
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from session_store import BoundedDict
+
+logger = logging.getLogger(__name__)
+
+# How long a completed result is replayed for retries, and how many are kept
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '300'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '256'))
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused with a different request"""
+
+
+class IdempotencyInProgress(Exception):
+    """A streamed request with this idempotency key is still running"""
+
+
+def fingerprint(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyCache:
+    """Deduplicates retried requests by client-supplied idempotency key.
+
+    The first request with a key runs. Requests with the same key that arrive while
+    it is in flight await its result instead of starting another agent run (and
+    possibly another paid generation), and retries within IDEMPOTENCY_TTL get the
+    stored result. Failures are not stored, so a failed request can be retried.
+    The run is shielded from its callers, so a client that disconnects and retries
+    picks up the original run. Streamed runs claim their key with begin() and
+    release it with finish(); their output can't be shared, so a repeat while one
+    is running raises IdempotencyInProgress. Used from the server's event loop only.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self._in_flight = {}  # key -> (fingerprint, task, or None for a streamed run)
+        self._results = BoundedDict(max_entries)  # key -> (fingerprint, stored_at, result)
+        self.replayed = 0
+        self.coalesced = 0
+        self.executed = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _check(key, expected: str, actual: str) -> None:
+        if expected != actual:
+            raise IdempotencyConflict(f"Idempotency key {key[-1]!r} was already used with a different request")
+
+    def _stored(self, key, request_fingerprint: str):
+        """Stored (fingerprint, stored_at, result) for a key within the TTL, or None"""
+        stored = self._results.get(key)
+        if stored is not None:
+            if time.monotonic() - stored[1] < self.ttl:
+                self._check(key, stored[0], request_fingerprint)
+                self.replayed += 1
+                logger.info(f"[IDEMPOTENCY] Replayed result for key {key}")
+                return stored
+            del self._results[key]
+        return None
+
+    def _in_progress(self, key, request_fingerprint: str):
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._check(key, in_flight[0], request_fingerprint)
+            if in_flight[1] is None:
+                self.rejected += 1
+                raise IdempotencyInProgress(f"A request with idempotency key {key[-1]!r} is still streaming")
+        return in_flight
+
+    async def run(self, key, request_fingerprint: str, factory):
+        """Result of factory() for this key, running it at most once per key and TTL"""
+        stored = self._stored(key, request_fingerprint)
+        if stored is not None:
+            return stored[2]
+
+        in_flight = self._in_progress(key, request_fingerprint)
+        if in_flight is not None:
+            self.coalesced += 1
+            logger.info(f"[IDEMPOTENCY] Waiting for in-flight request with key {key}")
+            return await asyncio.shield(in_flight[1])
+
+        self.executed += 1
+        task = asyncio.ensure_future(self._execute(key, request_fingerprint, factory))
+        # Retrieve the exception even if every caller has gone away
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._in_flight[key] = (request_fingerprint, task)
+        return await asyncio.shield(task)
+
+    async def _execute(self, key, request_fingerprint: str, factory):
+        try:
+            result = await factory()
+            self._results[key] = (request_fingerprint, time.monotonic(), result)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+
+    def begin(self, key, request_fingerprint: str):
+        """Claim a key for a streamed run: the stored result to replay, or None once claimed"""
+        stored = self._stored(key, request_fingerprint)
+        if stored is not None:
+            return stored[2]
+        if self._in_progress(key, request_fingerprint) is not None:
+            # A run() request is executing - it can't be replayed as a stream yet
+            self.rejected += 1
+            raise IdempotencyInProgress(f"A request with idempotency key {key[-1]!r} is still running")
+        self.executed += 1
+        self._in_flight[key] = (request_fingerprint, None)
+        return None
+
+    def finish(self, key, request_fingerprint: str, result=None) -> None:
+        """Release a key claimed with begin(), storing the result of a successful run"""
+        self._in_flight.pop(key, None)
+        if result is not None:
+            self._results[key] = (request_fingerprint, time.monotonic(), result)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._in_flight),
+            'stored': len(self._results),
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'replayed': self.replayed,
+            'rejected': self.rejected
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_idempotency_cache() -> IdempotencyCache:
+    """Get or create the idempotency cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = IdempotencyCache()
+    return _cache
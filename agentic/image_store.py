@@ -0,0 +1,176 @@
+import os
+import re
+import base64
+import hashlib
+import logging
+import threading
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Image store configuration
+IMAGE_STORE = os.getenv('IMAGE_STORE', 'local')
+IMAGE_STORE_DIR = os.getenv('IMAGE_STORE_DIR', '/tmp/agent-images')
+IMAGE_STORE_MAX_BYTES = int(os.getenv('IMAGE_STORE_MAX_BYTES', str(1024 * 1024 * 1024)))
+IMAGE_BUCKET = os.getenv('IMAGE_BUCKET')
+IMAGE_PREFIX = os.getenv('IMAGE_PREFIX', 'images/')
+IMAGE_URL_TTL = int(os.getenv('IMAGE_URL_TTL', '3600'))
+# inline: responses carry data URLs (default, works with the existing frontend); reference: URLs only
+IMAGE_DELIVERY = os.getenv('IMAGE_DELIVERY', 'inline')
+IMAGE_BASE_URL = os.getenv('IMAGE_BASE_URL', '').rstrip('/')
+
+CHUNK_SIZE = 64 * 1024
+IMAGE_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def content_id(data: bytes) -> str:
+    """Content-addressed image ID (sha256 of the raw PNG bytes)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_image_id(image_id: str) -> bool:
+    return bool(IMAGE_ID_PATTERN.match(image_id))
+
+
+class LocalImageStore:
+    """Raw PNG files in a local spool directory, oldest removed beyond max_bytes"""
+
+    def __init__(self, directory: str = IMAGE_STORE_DIR, max_bytes: int = IMAGE_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, image_id: str) -> str:
+        return os.path.join(self.directory, f"{image_id}.png")
+
+    def put(self, data: bytes) -> str:
+        image_id = content_id(data)
+        path = self._path(image_id)
+        try:
+            # Already stored - mark it recently used so cleanup (oldest mtime first) keeps it
+            os.utime(path)
+            return image_id
+        except FileNotFoundError:
+            pass
+        # Write then rename so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._cleanup()
+        return image_id
+
+    def _cleanup(self) -> None:
+        """Delete least recently stored images until under budget. Caller holds self._lock."""
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith('.png')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def exists(self, image_id: str) -> bool:
+        return os.path.exists(self._path(image_id))
+
+    def get(self, image_id: str):
+        try:
+            with open(self._path(image_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def iter_chunks(self, image_id: str):
+        """Chunks of an image, opened now so a missing one raises FileNotFoundError here"""
+        return self._read_chunks(open(self._path(image_id), 'rb'))
+
+    @staticmethod
+    def _read_chunks(f):
+        with f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+
+    def url(self, image_id: str) -> str:
+        return f"{IMAGE_BASE_URL}/images/{image_id}"
+
+
+class S3ImageStore:
+    """Raw PNG objects in S3 (or an S3-compatible endpoint)"""
+
+    def __init__(self, bucket: str = IMAGE_BUCKET, prefix: str = IMAGE_PREFIX, client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client or boto3.client('s3', endpoint_url=os.getenv('IMAGE_S3_ENDPOINT_URL'))
+
+    def _key(self, image_id: str) -> str:
+        return f"{self.prefix}{image_id}.png"
+
+    def put(self, data: bytes) -> str:
+        image_id = content_id(data)
+        self.client.put_object(Bucket=self.bucket, Key=self._key(image_id), Body=data, ContentType='image/png')
+        return image_id
+
+    def exists(self, image_id: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(image_id))
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+    def get(self, image_id: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(image_id))['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def iter_chunks(self, image_id: str):
+        """Chunks of an image, fetched now so a missing one raises FileNotFoundError here"""
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(image_id))['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(image_id)
+        return body.iter_chunks(CHUNK_SIZE)
+
+    def url(self, image_id: str) -> str:
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._key(image_id)},
+            ExpiresIn=IMAGE_URL_TTL
+        )
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+def get_image_store():
+    """Get or create the image store configured from the environment"""
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            if IMAGE_STORE == 's3':
+                _image_store = S3ImageStore()
+            else:
+                _image_store = LocalImageStore()
+    return _image_store
+
+
+def render_image(image_id: str):
+    """Image value for API responses: a data URL (inline delivery) or a URL (reference delivery)"""
+    store = get_image_store()
+    if IMAGE_DELIVERY == 'reference':
+        return store.url(image_id)
+    data = store.get(image_id)
+    if data is None:
+        return None
+    return f"data:image/png;base64,{base64.b64encode(data).decode()}"
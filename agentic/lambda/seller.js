@@ -322,50 +322,68 @@ app.post('/generate_image', async (c) => {
   }
 });
 
+// Settle one pending nonce (facilitator failures are tolerated on testnet)
+const settleNonce = async (nonce) => {
+  // Look up pending payment data by nonce
+  const pendingPayment = processedPayments.get(nonce);
+  if (!pendingPayment || pendingPayment.status !== 'pending') {
+    return { error: 'No pending payment found for nonce' };
+  }
+  // Claimed before the facilitator call so a concurrent /settle for the nonce can't settle it again
+  processedPayments.set(nonce, { ...pendingPayment, status: 'settling' });
+  
+  const { paymentPayload, paymentRequirements } = pendingPayment;
+  
+  let transactionHash = null;
+  try {
+    const settlement = await settlePayment(paymentPayload, paymentRequirements);
+    if (settlement.success) {
+      console.log('Payment settled successfully');
+      console.log('Transaction:', settlement.transaction);
+      transactionHash = settlement.transaction;
+    } else {
+      console.log('Settlement failed (testnet expected):', settlement.errorReason);
+    }
+  } catch (error) {
+    console.log('Settlement error (testnet expected):', error.message);
+  }
+  
+  processedPayments.set(nonce, { timestamp: Date.now(), status: 'settled' });
+  return { status: 'settled', transaction_hash: transactionHash };
+};
+
 // x402 spec: settle after content delivery (fair billing - only charge on success)
+// Accepts { nonce } or a batch { nonces: [...] } (batch returns per-nonce results)
 app.post('/settle', async (c) => {
   try {
     const body = await c.req.json();
-    const { nonce } = body;
+    const { nonce, nonces } = body;
     
-    if (!nonce) {
+    if (!nonce && !(Array.isArray(nonces) && nonces.length)) {
       return c.json({ error: 'Missing nonce' }, 400);
     }
     
-    // Look up pending payment data by nonce
-    const pendingPayment = processedPayments.get(nonce);
-    if (!pendingPayment || pendingPayment.status !== 'pending') {
-      return c.json({ error: 'No pending payment found for nonce' }, 404);
+    let response;
+    if (nonces) {
+      // Each nonce is settled once, even if the batch repeats it
+      const unique = [...new Set(nonces)];
+      const settled = await Promise.all(unique.map(settleNonce));
+      response = { results: Object.fromEntries(unique.map((n, i) => [n, settled[i]])) };
+    } else {
+      response = await settleNonce(nonce);
     }
     
-    const { paymentPayload, paymentRequirements } = pendingPayment;
-    
-    let transactionHash = null;
-    try {
-      const settlement = await settlePayment(paymentPayload, paymentRequirements);
-      if (settlement.success) {
-        console.log('Payment settled successfully');
-        console.log('Transaction:', settlement.transaction);
-        transactionHash = settlement.transaction;
-      } else {
-        console.log('Settlement failed (testnet expected):', settlement.errorReason);
-      }
-    } catch (error) {
-      console.log('Settlement error (testnet expected):', error.message);
-    }
-    
-    // Mark as settled and clean old entries
-    processedPayments.set(nonce, { timestamp: Date.now(), status: 'settled' });
+    // Clean old entries
     const oneHourAgo = Date.now() - 3600000;
     for (const [n, entry] of processedPayments.entries()) {
       const ts = typeof entry === 'object' ? entry.timestamp : entry;
       if (ts < oneHourAgo) processedPayments.delete(n);
     }
     
-    return c.json({
-      status: 'settled',
-      transaction_hash: transactionHash
-    });
+    if (response.error) {
+      return c.json(response, 404);
+    }
+    return c.json(response);
   } catch (error) {
     console.error('Settlement error:', error);
     return c.json({ error: error.message }, 500);
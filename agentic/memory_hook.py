@@ -1,23 +1,164 @@
 import os
+import time
+import queue
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from strands.hooks import HookProvider, HookRegistry, BeforeInvocationEvent, AfterInvocationEvent, BeforeToolCallEvent, AfterToolCallEvent, BeforeModelCallEvent, AfterModelCallEvent
 from bedrock_agentcore.memory.integrations.strands.config import AgentCoreMemoryConfig
 from bedrock_agentcore.memory.integrations.strands.session_manager import AgentCoreMemorySessionManager
+from context_manager import is_turn_start
+from telemetry import telemetry
 
 MEMORY_ID = os.getenv("BEDROCK_AGENTCORE_MEMORY_ID")
 REGION = os.getenv("AWS_REGION", "us-east-1")
 
+# Memory manager cache size and prefetch threads
+MEMORY_CACHE_MAX_SESSIONS = int(os.getenv("MEMORY_CACHE_MAX_SESSIONS", "256"))
+MEMORY_PREFETCH_THREADS = int(os.getenv("MEMORY_PREFETCH_THREADS", "8"))
+
 # Configure logging for CloudWatch
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class _MemoryEntry:
+    """Prefetched memory manager for a session and the agent it restored"""
+
+    __slots__ = ('agent', 'manager')
+
+    def __init__(self, agent, manager):
+        self.agent = agent
+        self.manager = manager  # Future: manager once the agent's history is loaded
+
+
+class MemoryManagerCache:
+    """Per-session AgentCore memory managers with LRU eviction, prefetch and write-behind.
+
+    Building a manager reads (or creates) the session and restoring an agent lists
+    its messages, so both run on prefetch threads as soon as a request acquires its
+    agent and overlap with queueing for the agent. A manager is bound to the agent
+    it restored (AgentCore allows one agent per session manager); a new agent for
+    the session gets a fresh manager. New turns are persisted by a background
+    writer after the invocation, in order, instead of per message on the critical path.
+    """
+
+    def __init__(self, max_sessions: int = MEMORY_CACHE_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()  # session_id -> _MemoryEntry
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=MEMORY_PREFETCH_THREADS, thread_name_prefix='memory-prefetch')
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name='memory-writer')
+        self._writer.start()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _restore(self, session_id: str, agent) -> AgentCoreMemorySessionManager:
+        memory_config = AgentCoreMemoryConfig(
+            memory_id=MEMORY_ID,
+            session_id=session_id,
+            actor_id="user"
+        )
+        manager = AgentCoreMemorySessionManager(
+            agentcore_memory_config=memory_config,
+            region_name=REGION
+        )
+        manager.initialize(agent)
+        return manager
+
+    def prefetch(self, session_id: str, agent) -> _MemoryEntry:
+        """Start building the session's manager and restoring the agent's history (non-blocking)"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            failed = entry is not None and entry.manager.done() and entry.manager.exception() is not None
+            if entry is None or failed or entry.agent is not agent:
+                entry = _MemoryEntry(agent, self._executor.submit(self._restore, session_id, agent))
+                self._entries[session_id] = entry
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return entry
+
+    def get(self, session_id: str, agent) -> AgentCoreMemorySessionManager:
+        """Manager with the agent's history restored (waits only for an in-flight prefetch)"""
+        return self.prefetch(session_id, agent).manager.result()
+
+    def ready(self, session_id: str, agent):
+        """Manager if the agent's history is already restored, else None (never blocks)"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if entry is None or entry.agent is not agent or not entry.manager.done() or entry.manager.exception():
+            return None
+        return entry.manager.result()
+
+    def write_behind(self, manager, agent, messages: list) -> None:
+        """Queue new turn messages and an agent state sync for the background writer"""
+        self._writes.put((manager, agent, list(messages)))
+
+    def _write_loop(self) -> None:
+        while True:
+            manager, agent, messages = self._writes.get()
+            try:
+                for message in messages:
+                    manager.append_message(message, agent)
+                manager.sync_agent(agent)
+            except Exception as e:
+                logger.error(f"[MEMORY] Write-behind failed for session {manager.session_id}: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'pending_writes': self._writes.qsize()
+            }
+
+
+_memory_managers = None
+_memory_managers_lock = threading.Lock()
+
+def get_memory_managers() -> MemoryManagerCache:
+    """Get or create the memory manager cache"""
+    global _memory_managers
+    with _memory_managers_lock:
+        if _memory_managers is None:
+            _memory_managers = MemoryManagerCache()
+        return _memory_managers
+
+def prefetch_memory(session_id: str, agent):
+    """AgentPool acquire hook: start restoring the session's memory; the pool awaits the future"""
+    if MEMORY_ID:
+        return get_memory_managers().prefetch(session_id, agent).manager
+    return None
+
+def record_memory(session_id: str, agent, messages: list) -> None:
+    """AgentPool record hook: persist messages added outside an invocation (MemoryHook only sees turns)"""
+    if MEMORY_ID:
+        managers = get_memory_managers()
+        managers.write_behind(managers.get(session_id, agent), agent, messages)
+
+
 class MemoryHook(HookProvider):
     def __init__(self):
         self.session_manager = None
+        self._last_message = None
+        # Stage start times for telemetry (tools keyed by ID: they may run concurrently)
+        self._invocation_started = None
+        self._model_started = None
+        self._tool_started = {}  # toolUseId -> start time
     
     def register_hooks(self, registry: HookRegistry) -> None:
         if MEMORY_ID:
             registry.add_callback(BeforeInvocationEvent, self.setup_memory)
+            registry.add_callback(AfterInvocationEvent, self.persist_memory)
         
         # Add observability hooks
         registry.add_callback(BeforeInvocationEvent, self.log_invocation_start)
@@ -28,40 +169,72 @@ class MemoryHook(HookProvider):
         registry.add_callback(AfterModelCallEvent, self.log_model_call_end)
     
     def setup_memory(self, event: BeforeInvocationEvent) -> None:
-        if MEMORY_ID and not hasattr(event.agent, 'session_manager'):
-            session_id = getattr(event.agent.state, "session_id", "default")
-            memory_config = AgentCoreMemoryConfig(
-                memory_id=MEMORY_ID,
-                session_id=session_id,
-                actor_id="user"
-            )
-            session_manager = AgentCoreMemorySessionManager(
-                agentcore_memory_config=memory_config,
-                region_name=REGION
-            )
-            event.agent.session_manager = session_manager
+        session_id = getattr(event.agent.state, "session_id", "default")
+        # Runs on the event loop for streams: AgentPool has already awaited the restore
+        self.session_manager = get_memory_managers().ready(session_id, event.agent)
+        if self.session_manager is None:
+            logger.warning(f"[MEMORY] History not restored for session {session_id}, running this turn without memory")
+            return
+        event.agent.session_manager = self.session_manager
+        # Turn boundary: messages after this one are written behind
+        self._last_message = event.agent.messages[-1] if event.agent.messages else None
+    
+    def persist_memory(self, event: AfterInvocationEvent) -> None:
+        if self.session_manager is None:
+            return
+        messages = event.agent.messages
+        start = 0
+        if self._last_message is not None:
+            # Find the boundary by identity: context compaction may have cut older messages
+            start = next((i + 1 for i in range(len(messages) - 1, -1, -1) if messages[i] is self._last_message), None)
+            if start is None:
+                # Boundary compacted away - the turn starts at its prompt, which is never cut
+                start = next((i for i in range(len(messages) - 1, -1, -1) if is_turn_start(messages[i])), 0)
+        get_memory_managers().write_behind(self.session_manager, event.agent, messages[start:])
+        self._last_message = messages[-1] if messages else None
     
     def log_invocation_start(self, event: BeforeInvocationEvent) -> None:
         session_id = getattr(event.agent.state, "session_id", "default")
         logger.info(f"[INVOCATION_START] Session: {session_id}, Agent: {event.agent.__class__.__name__}")
+        self._invocation_started = time.perf_counter()
     
     def log_invocation_end(self, event: AfterInvocationEvent) -> None:
         session_id = getattr(event.agent.state, "session_id", "default")
         logger.info(f"[INVOCATION_END] Session: {session_id}, Success: {not hasattr(event, 'error')}")
+        if self._invocation_started is not None:
+            telemetry.observe("invocation", time.perf_counter() - self._invocation_started, hasattr(event, 'error'))
+            self._invocation_started = None
+    
+    def emit(self, agent, event_type: str, data: dict) -> None:
+        """Forward an observability event to the agent's stream sink, if one is attached"""
+        event_sink = getattr(agent, "event_sink", None)
+        if event_sink is not None:
+            event_sink(event_type, data)
     
     def log_tool_call_start(self, event: BeforeToolCallEvent) -> None:
         tool_name = event.tool_use.get('name', 'unknown')
         tool_input = event.tool_use.get('input', {})
         logger.info(f"[TOOL_CALL_START] Tool: {tool_name}, Input: {tool_input}")
+        self._tool_started[event.tool_use.get('toolUseId')] = time.perf_counter()
+        self.emit(event.agent, "tool_call_start", {"tool": tool_name, "input": tool_input})
     
     def log_tool_call_end(self, event: AfterToolCallEvent) -> None:
         tool_name = event.tool_use.get('name', 'unknown')
         result_preview = str(event.result)[:200] if event.result else "None"
         logger.info(f"[TOOL_CALL_END] Tool: {tool_name}, Result: {result_preview}...")
+        status = event.result.get('status') if event.result else None
+        started = self._tool_started.pop(event.tool_use.get('toolUseId'), None)
+        if started is not None:
+            telemetry.observe(f"tool.{tool_name}", time.perf_counter() - started, status == 'error')
+        self.emit(event.agent, "tool_call_end", {"tool": tool_name, "status": status, "result": result_preview})
     
     def log_model_call_start(self, event: BeforeModelCallEvent) -> None:
         logger.info("[MODEL_CALL_START]")
+        self._model_started = time.perf_counter()
     
     def log_model_call_end(self, event: AfterModelCallEvent) -> None:
         success = event.exception is None
-        logger.info(f"[MODEL_CALL_END] Success: {success}")
\ No newline at end of file
+        logger.info(f"[MODEL_CALL_END] Success: {success}")
+        if self._model_started is not None:
+            telemetry.observe("model_call", time.perf_counter() - self._model_started, not success)
+            self._model_started = None
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+import requests
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_URL = 'https://api.coingecko.com/api/v3/simple/price?ids=usd-coin&vs_currencies=usd'
+
+# Fallback when no price has ever been fetched (USDC is pegged to ~$1.00)
+DEFAULT_USDC_PRICE = 1.0
+
+
+class CoinGeckoPriceSource:
+    """USDC/USD price from the CoinGecko simple price API"""
+
+    name = 'coingecko'
+
+    def __init__(self, url: str = COINGECKO_URL, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def fetch(self) -> float:
+        response = self._session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return float(response.json()['usd-coin']['usd'])
+
+
+class FixedPriceSource:
+    """Constant price - for offline development and tests"""
+
+    name = 'fixed'
+
+    def __init__(self, price: float = DEFAULT_USDC_PRICE):
+        self.price = float(price)
+
+    def fetch(self) -> float:
+        return self.price
+
+
+class PriceOracle:
+    """TTL-cached price with stale-while-revalidate and single-flight refresh.
+
+    Fresh prices (younger than ttl) are served from memory. Stale prices (younger
+    than max_stale) are served immediately while one background thread refreshes
+    them. Only when there is no usable price does a caller block on the source, and
+    concurrent callers share that single fetch.
+    """
+
+    def __init__(self, source, ttl: float = 60, max_stale: float = 3600):
+        self.source = source
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._price = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_done = None  # threading.Event while a refresh is in flight
+
+    def _refresh(self, done: threading.Event) -> None:
+        try:
+            price = self.source.fetch()
+            with self._lock:
+                self._price = price
+                self._fetched_at = time.monotonic()
+            logger.info(f"USDC price refreshed from {self.source.name}: {price}")
+        except Exception as e:
+            logger.warning(f"USDC price refresh from {self.source.name} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refresh_done = None
+            done.set()
+
+    def _start_refresh(self, background: bool) -> threading.Event:
+        """Start a refresh unless one is already running; return its completion event"""
+        with self._lock:
+            if self._refresh_done is not None:
+                return self._refresh_done
+            done = self._refresh_done = threading.Event()
+        if background:
+            threading.Thread(target=self._refresh, args=(done,), daemon=True, name='price-oracle').start()
+        else:
+            self._refresh(done)
+        return done
+
+    def refresh_async(self) -> None:
+        """Trigger a background refresh (e.g. to warm the cache at startup)"""
+        self._start_refresh(background=True)
+
+    def get_price(self) -> float:
+        age = time.monotonic() - self._fetched_at
+        price = self._price
+
+        if price is not None and age < self.ttl:
+            return price
+
+        if price is not None and age < self.max_stale:
+            self._start_refresh(background=True)
+            return price
+
+        done = self._start_refresh(background=False)
+        done.wait(timeout=getattr(self.source, 'timeout', 5) + 1)
+        if self._price is not None:
+            return self._price
+        logger.warning(f"No USDC price available, using default {DEFAULT_USDC_PRICE}")
+        return DEFAULT_USDC_PRICE
+
+
+_oracle = None
+_oracle_lock = threading.Lock()
+
+def get_price_oracle() -> PriceOracle:
+    """Get or create the USDC price oracle configured from the environment"""
+    global _oracle
+    if _oracle is None:
+        with _oracle_lock:
+            if _oracle is None:
+                source_name = os.getenv('USDC_PRICE_SOURCE', 'coingecko')
+                if source_name == 'fixed':
+                    source = FixedPriceSource(float(os.getenv('USDC_PRICE_FIXED', DEFAULT_USDC_PRICE)))
+                else:
+                    source = CoinGeckoPriceSource()
+                _oracle = PriceOracle(
+                    source,
+                    ttl=float(os.getenv('USDC_PRICE_TTL', '60')),
+                    max_stale=float(os.getenv('USDC_PRICE_MAX_STALE', '3600'))
+                )
+    return _oracle
@@ -0,0 +1,117 @@
+import os
+import re
+import logging
+from tools import estimate_image_cost, make_payment, generate_image, get_session_storage, AUTHORIZE_CHECK
+from async_runtime import run_sync
+
+logger = logging.getLogger(__name__)
+
+# Agent-level shortcut for unambiguous purchase prompts (opt-in)
+PURCHASE_FAST_PATH = os.getenv('PURCHASE_FAST_PATH', 'false').lower() == 'true'
+
+# Matches e.g. "Generate an image of a futuristic city at sunset"
+PURCHASE_INTENT = re.compile(
+    r"^\s*(?:please\s+)?(?:generate|create|make|draw)\s+(?:me\s+)?an?\s+(?:image|picture|photo)\s+(?:of|showing)\s+(?P<subject>.+?)\s*[.!]?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+
+# generate_image result when admission control turned the generation away
+BUSY = re.compile(r"^BUSY\|RETRY_AFTER:(?P<seconds>\d+)")
+
+def match_purchase_intent(message: str):
+    """Return the image prompt if the message is an unambiguous purchase request, else None"""
+    if not PURCHASE_FAST_PATH:
+        return None
+    match = PURCHASE_INTENT.match(message)
+    if not match or '?' in message:
+        return None
+    return match.group('subject')
+
+def purchase_image(prompt: str = None, session_id: str = "default", request_id: str = None, authorize: bool = False) -> dict:
+    """Run the x402 purchase flow (estimate → generate → make_payment → generate) in code.
+
+    Uses the same tools and SessionStorage state machine as the agent, so the consent
+    gate is unchanged: without authorize=True the flow stops at AUTHORIZE_CHECK and
+    returns the estimate; calling again with the request_id and authorize=True pays
+    and generates.
+    """
+    # Session state is re-read after each tool call (shared store backends return snapshots)
+    # 1. Estimate (reuses an active unauthorized request, as the tool does)
+    if request_id is None:
+        if not prompt:
+            return {'status': 'error', 'error': 'Provide a prompt or an existing request_id.'}
+        storage = get_session_storage(session_id)
+        active_id = storage.current_request_id
+        active = storage.authorize_check.get(active_id) if active_id else None
+        if active is not None and not active.get('image_id') and active['prompt'] == prompt:
+            # Same prompt as the open request (e.g. a retry after BUSY) - continue it
+            request_id = active_id
+        else:
+            if active is not None and not active.get('auth'):
+                # A different prompt replaces the stale unauthorized estimate instead of paying for it
+                del storage.authorize_check[active_id]
+                AUTHORIZE_CHECK.pop(active_id, None)
+                storage.current_request_id = None
+                storage.current_cost = None
+                storage.save()
+            result = estimate_image_cost(prompt, session_id=session_id)
+            request_id = get_session_storage(session_id).current_request_id
+            if request_id is None:
+                return {'status': 'error', 'error': result}
+
+    storage = get_session_storage(session_id)
+    if request_id not in storage.authorize_check:
+        return {'status': 'error', 'error': 'Invalid request ID. Please estimate image cost first.'}
+
+    entry = storage.authorize_check[request_id]
+    if entry.get('image_id'):
+        # Already fulfilled - never pay twice for the same request
+        return {
+            'status': 'success',
+            'request_id': request_id,
+            'prompt': entry['prompt'],
+            'cost': entry['cost'],
+            'image_id': entry['image_id'],
+            'transaction_hash': entry.get('transaction_hash'),
+            'settlement': entry.get('settlement'),
+            'message': f"SUCCESS|IMAGE_ID:{entry['image_id']}"
+        }
+    logger.info(f"[FAST_PATH] Session:{session_id} | Request:{request_id} | Cost:{entry['cost']}")
+
+    # 2. Consent gate
+    if not entry.get('auth'):
+        result = run_sync(generate_image(request_id=request_id, session_id=session_id))
+        if not authorize:
+            return {
+                'status': 'authorization_required',
+                'request_id': request_id,
+                'prompt': entry['prompt'],
+                'cost': entry['cost'],
+                'message': result
+            }
+
+        # 3. Authorize (balance check + auth flag)
+        result = make_payment(request_id=request_id, session_id=session_id)
+        if result.startswith('Error'):
+            return {'status': 'error', 'request_id': request_id, 'error': result}
+
+    # 4. Paid generation via x402
+    result = run_sync(generate_image(request_id=request_id, session_id=session_id))
+    busy = BUSY.match(result)
+    if busy:
+        # Still authorized - calling again with the request_id retries without a new estimate
+        return {'status': 'busy', 'request_id': request_id, 'retry_after': int(busy.group('seconds')), 'error': result}
+    if not result.startswith('SUCCESS'):
+        return {'status': 'error', 'request_id': request_id, 'error': result}
+
+    entry = get_session_storage(session_id).authorize_check[request_id]
+    return {
+        'status': 'success',
+        'request_id': request_id,
+        'prompt': entry['prompt'],
+        'cost': entry['cost'],
+        'image_id': entry['image_id'],
+        'transaction_hash': entry.get('transaction_hash'),
+        'settlement': entry.get('settlement'),
+        'message': result
+    }
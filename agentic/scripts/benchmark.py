@@ -0,0 +1,424 @@
+"""Offline load test for the agent service.
+
+Drives /invocations, /purchase_image or the purchase tools directly against local
+stand-ins for Bedrock, the x402 gateway and /settle, CDP signing, CoinGecko and the
+RPC node (see benchmark_fakes.py), with injected latency. For each session count it
+reports request latency percentiles, throughput and process memory.
+
+Usage (from the agentic directory):
+    python scripts/benchmark.py --sessions 1,10,50 --requests-per-session 3
+    python scripts/benchmark.py --scenario stream --latency-scale 0.1 --json results.json
+
+Service tuning variables (AGENT_POOL_*, X402_*, SETTLEMENT_*, CONTEXT_*, ...) are read
+from the environment as usual, so configurations can be compared run by run.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+import resource
+import statistics
+import contextlib
+import tracemalloc
+
+AGENTIC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENTIC_DIR)
+
+from benchmark_fakes import (
+    Latency, FakeBedrockRuntime, ScriptedModel, FakeGateway, FakeCdpWallet, FakePriceSource,
+    FakeRPCProvider, calls, SELLER_ADDRESS, USDC_ADDRESS
+)
+
+GATEWAY_URL = 'http://gateway.benchmark'
+SCENARIOS = ('agent', 'stream', 'purchase', 'tools')
+SUBJECTS = ['a lighthouse at dawn', 'a city of glass', 'a fox in the snow', 'a paper boat on a lake', 'a desert observatory']
+
+
+def benchmark_env(workdir: str, admission_limits: bool = False) -> dict:
+    """Environment that keeps every client local (applied before the service is imported)"""
+    env = {
+        'GATEWAY_URL': GATEWAY_URL,
+        'RPC_URL': 'http://rpc.benchmark',
+        'RPC_URLS': 'http://rpc.benchmark',
+        'USDC_CONTRACT': USDC_ADDRESS,
+        'SELLER_WALLET': SELLER_ADDRESS,
+        'NETWORK_ID': 'base-sepolia',
+        'SESSION_STORE': 'memory',
+        'IMAGE_STORE': 'local',
+        'IMAGE_STORE_DIR': os.path.join(workdir, 'images'),
+        'SETTLEMENT_DB': os.path.join(workdir, 'settlements.db'),
+        'STARTUP_WARMUP': 'false'
+    }
+    if not admission_limits:
+        # Load tests exceed the per-session and wallet spend rates on purpose; the generation
+        # queue and Bedrock concurrency caps still apply
+        env.update({'ADMISSION_SESSION_RATE': '0', 'ADMISSION_WALLET_SPEND_RATE': '0'})
+    return env
+
+
+def install_fakes(args, env: dict):
+    """Import the service and swap every external client for its stand-in"""
+    scale = args.latency_scale
+
+    def latency(seconds):
+        return Latency(seconds * scale, args.jitter, args.seed)
+
+    import agent
+    import wallet
+    import memory_hook
+    import price_oracle
+    import web3_provider
+    import bedrock_client
+    from web3 import Web3
+
+    # tools.py reloads .env with override - put the local endpoints back
+    os.environ.update(env)
+    memory_hook.MEMORY_ID = None
+
+    # Throttling applies to the primary region; fallback regions (BEDROCK_FALLBACK_REGIONS) have headroom
+    for region in [bedrock_client.BEDROCK_REGION] + bedrock_client.BEDROCK_FALLBACK_REGIONS:
+        throttle_rate = args.bedrock_throttle if region == bedrock_client.BEDROCK_REGION else 0
+        fake_bedrock = FakeBedrockRuntime(
+            latency(args.image_latency), latency(args.vision_latency), args.image_bytes, throttle_rate, args.seed)
+        bedrock_client._clients[region] = fake_bedrock
+        # Nova Canvas clients use a shorter read timeout, with fewer retries once part of
+        # BEDROCK_INVOKE_DEADLINE is spent
+        bedrock_client._clients.update({
+            (region, attempts, bedrock_client.BEDROCK_IMAGE_READ_TIMEOUT): fake_bedrock
+            for attempts in range(1, bedrock_client.BEDROCK_MAX_ATTEMPTS + 1)
+        })
+    model = ScriptedModel(latency(args.model_latency), args.tokens_per_second)
+    agent._models[False] = model
+    agent._models[True] = model
+    # The real failover provider, with the fake node behind its endpoint
+    provider = web3_provider.FailoverHTTPProvider(['http://rpc.benchmark'])
+    provider.endpoints[0].provider = FakeRPCProvider(latency(args.rpc_latency))
+    web3_provider._web3 = Web3(provider)
+    price_oracle._oracle = price_oracle.PriceOracle(
+        FakePriceSource(latency(args.price_latency)),
+        ttl=float(os.getenv('USDC_PRICE_TTL', '60')),
+        max_stale=float(os.getenv('USDC_PRICE_MAX_STALE', '3600'))
+    )
+
+    fake_wallet = FakeCdpWallet(latency(args.sign_latency))
+    wallet._agentkit = type('BenchmarkAgentKit', (), {'wallet_provider': fake_wallet})()
+    gateway = FakeGateway(latency(args.gateway_latency), latency(args.settle_latency), GATEWAY_URL)
+    wallet.get_x402_gateway_client(fake_wallet, GATEWAY_URL).http = gateway.client()
+    return agent
+
+
+async def asgi_request(app, method: str, path: str, body: dict = None):
+    """Call the ASGI app in-process; returns (status, body, seconds to first body byte)"""
+    payload = json.dumps(body or {}).encode()
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'agent.benchmark'), (b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 0), 'server': ('agent.benchmark', 80)
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    started = time.perf_counter()
+    response = {'status': None, 'chunks': [], 'ttfb': None}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body' and message.get('body'):
+            if response['ttfb'] is None:
+                response['ttfb'] = time.perf_counter() - started
+            response['chunks'].append(message['body'])
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    return response['status'], b''.join(response['chunks']), response['ttfb']
+
+
+async def run_agent(app, session_id: str, subject: str, idempotency_key: str = None):
+    status, body, ttfb = await asgi_request(app, 'POST', '/invocations', {
+        'input': {'prompt': f"Generate an image of {subject} (session_id: {session_id})"},
+        'session_id': session_id,
+        'idempotency_key': idempotency_key
+    })
+    return status == 200 and bool(json.loads(body)['output'].get('images')), ttfb
+
+
+async def run_stream(app, session_id: str, subject: str, idempotency_key: str = None):
+    while True:
+        status, body, ttfb = await asgi_request(app, 'POST', '/invocations', {
+            'input': {'prompt': f"Generate an image of {subject} (session_id: {session_id})"},
+            'session_id': session_id,
+            'stream': True,
+            'idempotency_key': idempotency_key
+        })
+        if status != 409:
+            break
+        # Another copy is still streaming under this key - retry until its result can be replayed
+        await asyncio.sleep(0.05)
+    return status == 200 and b'event: image' in body and b'event: done' in body, ttfb
+
+
+async def run_purchase(app, session_id: str, subject: str, idempotency_key: str = None):
+    status, body, ttfb = await asgi_request(app, 'POST', '/purchase_image', {
+        'prompt': subject, 'session_id': session_id, 'authorize': True, 'idempotency_key': idempotency_key
+    })
+    return status == 200 and json.loads(body)['status'] == 'success', ttfb
+
+
+async def run_tools(app, session_id: str, subject: str, idempotency_key: str = None):
+    from purchase import purchase_image
+    result = await asyncio.to_thread(purchase_image, prompt=subject, session_id=session_id, authorize=True)
+    return result['status'] == 'success', None
+
+
+RUNNERS = {'agent': run_agent, 'stream': run_stream, 'purchase': run_purchase, 'tools': run_tools}
+
+
+def percentile(values: list, pct: int) -> float:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def rss_mb() -> float:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+async def wait_for_settlements(timeout: float) -> float:
+    """Seconds until the settlement queue has nothing pending (capped at timeout)"""
+    from tools import get_settlements
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if not get_settlements().stats().get('pending'):
+            break
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+async def run_level(app, args, sessions: int, level: int) -> dict:
+    runner = RUNNERS[args.scenario]
+    latencies, ttfbs = [], []
+    errors = 0
+    calls_before = calls.snapshot()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+    async def session_worker(index: int):
+        nonlocal errors
+        session_id = f"bench-{level}-{index}"
+        for request in range(args.requests_per_session):
+            number = index * args.requests_per_session + request
+            # Subject and variation both come from the prompt number, so repeats are exact
+            prompt = number % args.distinct_prompts if args.distinct_prompts else number
+            subject = f"{SUBJECTS[prompt % len(SUBJECTS)]}, variation {prompt}"
+            started = time.perf_counter()
+            try:
+                if args.duplicates:
+                    # Simulated client retries: concurrent copies sharing one idempotency key
+                    key = f"{session_id}-{request}"
+                    outcomes = await asyncio.gather(*(runner(app, session_id, subject, key) for _ in range(args.duplicates + 1)))
+                    ok, ttfb = all(outcome[0] for outcome in outcomes), outcomes[0][1]
+                else:
+                    ok, ttfb = await runner(app, session_id, subject)
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Request failed in {session_id}: {str(e)}")
+                ok, ttfb = False, None
+            if ok:
+                latencies.append(time.perf_counter() - started)
+                if ttfb is not None:
+                    ttfbs.append(ttfb)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session_worker(index) for index in range(sessions)))
+    elapsed = time.perf_counter() - started
+    drain = await wait_for_settlements(args.settle_timeout)
+
+    calls_after = calls.snapshot()
+    return {
+        'sessions': sessions,
+        'requests': sessions * args.requests_per_session,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': max(latencies) if latencies else None,
+        'ttfb_p50': percentile(ttfbs, 50),
+        'ttfb_p95': percentile(ttfbs, 95),
+        'settlement_drain_seconds': round(drain, 3),
+        'rss_mb': round(rss_mb(), 1),
+        'traced_peak_mb': round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1) if tracemalloc.is_tracing() else None,
+        'calls': {name: count - calls_before.get(name, 0) for name, count in calls_after.items()}
+    }
+
+
+def format_seconds(value) -> str:
+    return '-' if value is None else f"{value * 1000:.0f}ms"
+
+
+def print_level(result: dict, stream) -> None:
+    stream.write(
+        f"{result['sessions']:>8} {result['requests']:>8} {result['errors']:>6} "
+        f"{format_seconds(result['latency_p50']):>9} {format_seconds(result['latency_p95']):>9} "
+        f"{format_seconds(result['latency_p99']):>9} {format_seconds(result['ttfb_p50']):>9} "
+        f"{result['throughput_rps']:>8.2f} {result['rss_mb']:>8.1f}"
+    )
+    if result['traced_peak_mb'] is not None:
+        stream.write(f" {result['traced_peak_mb']:>9.1f}")
+    stream.write('\n')
+    stream.write(f"{'':>8} calls: {', '.join(f'{name}={count}' for name, count in sorted(result['calls'].items()))}\n")
+    stream.flush()
+
+
+def service_stats() -> dict:
+    import agent
+    from session_store import get_session_store
+    from context_manager import get_context_metrics
+    from tools import get_settlements
+    from telemetry import telemetry
+    from idempotency import get_idempotency_cache
+    from admission import get_admission_controller
+    from bedrock_client import get_bedrock_invoker
+    from image_store import get_image_store
+    from generation_cache import get_generation_cache
+    from analysis_cache import get_analysis_cache
+    generation_cache = get_generation_cache(get_image_store())
+    return {
+        'stages': telemetry.summary(),
+        'agent_pool': agent.agent_pool.stats(),
+        'idempotency': get_idempotency_cache().stats(),
+        'admission': get_admission_controller().stats(),
+        'bedrock': get_bedrock_invoker().stats(),
+        'session_store': get_session_store().stats(),
+        'context': get_context_metrics().stats(),
+        'settlements': get_settlements().stats(),
+        'generation_cache': generation_cache.stats() if generation_cache else None,
+        'analysis_cache': get_analysis_cache().stats()
+    }
+
+
+async def main(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='agent-benchmark-')
+    env = benchmark_env(workdir, args.admission_limits)
+    os.environ.update(env)
+    os.environ.pop('BEDROCK_AGENTCORE_MEMORY_ID', None)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    quiet = open(os.devnull, 'w') if not args.verbose else None
+    if quiet:
+        logging.disable(logging.WARNING)  # Injected failures (--bedrock-throttle) log warnings
+    out = sys.stdout
+
+    with contextlib.redirect_stdout(quiet or out):
+        agent = install_fakes(args, env)
+        await agent.warm_caches()
+        for index in range(args.warmup):
+            await RUNNERS[args.scenario](agent.app, f"bench-warmup-{index}", f"{SUBJECTS[0]}, warm-up {index}")
+        await wait_for_settlements(args.settle_timeout)
+
+    out.write(f"Scenario: {args.scenario} | requests per session: {args.requests_per_session} | latency scale: {args.latency_scale}\n")
+    out.write(f"{'sessions':>8} {'requests':>8} {'errors':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'ttfb p50':>9} {'req/s':>8} {'rss MB':>8}"
+              f"{' traced MB' if args.tracemalloc else ''}\n")
+    results = []
+    for level, sessions in enumerate(args.sessions):
+        with contextlib.redirect_stdout(quiet or out):
+            result = await run_level(agent.app, args, sessions, level)
+        results.append(result)
+        print_level(result, out)
+
+    stats = service_stats()
+    out.write(f"\n{'stage (all runs)':<32} {'count':>7} {'errors':>6} {'avg':>9}\n")
+    for stage, entry in stats['stages'].items():
+        out.write(f"{stage:<32} {entry['count']:>7} {entry['errors']:>6} {entry['avg_ms']:>7.0f}ms\n")
+    for name in ('generation_cache', 'analysis_cache'):
+        cache = stats[name]
+        if cache and cache['hits'] + cache['misses']:
+            out.write(f"{name}: {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions\n")
+
+    report = {
+        'scenario': args.scenario,
+        'requests_per_session': args.requests_per_session,
+        'latency': {name: getattr(args, name) for name in (
+            'model_latency', 'image_latency', 'vision_latency', 'gateway_latency', 'settle_latency',
+            'sign_latency', 'rpc_latency', 'price_latency', 'jitter', 'latency_scale')},
+        'levels': results,
+        'service': stats
+    }
+    if quiet:
+        quiet.close()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline load test for the agent service')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='agent',
+                        help='agent: /invocations with the x402 tool flow; stream: the same over SSE; '
+                             'purchase: /purchase_image; tools: purchase tools called directly')
+    parser.add_argument('--sessions', type=lambda value: [int(n) for n in value.split(',')], default=[1, 10, 50],
+                        help='Comma-separated concurrent session counts, one run each (default 1,10,50)')
+    parser.add_argument('--requests-per-session', type=int, default=3)
+    parser.add_argument('--distinct-prompts', type=int, default=0,
+                        help='Reuse this many prompts (exercises GENERATION_CACHE); 0 makes every prompt unique')
+    parser.add_argument('--duplicates', type=int, default=0,
+                        help='Concurrent retries sent with each request under the same idempotency key (agent, stream, purchase)')
+    parser.add_argument('--admission-limits', action='store_true',
+                        help='Keep the per-session and per-wallet admission rate limits (off by default)')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured requests before the first run')
+    parser.add_argument('--settle-timeout', type=float, default=30, help='Max wait for queued settlements after a run')
+
+    latency = parser.add_argument_group('injected latency (seconds)')
+    latency.add_argument('--model-latency', type=float, default=0.8, help='Claude (agent model) time to first token')
+    latency.add_argument('--tokens-per-second', type=float, default=0, help='Final answer streaming rate (0: instant)')
+    latency.add_argument('--image-latency', type=float, default=3.0, help='Nova Canvas invoke_model')
+    latency.add_argument('--vision-latency', type=float, default=4.0, help='Claude vision invoke_model')
+    latency.add_argument('--gateway-latency', type=float, default=0.15, help='x402 gateway /generate_image')
+    latency.add_argument('--settle-latency', type=float, default=0.5, help='Gateway /settle (facilitator)')
+    latency.add_argument('--sign-latency', type=float, default=0.3, help='CDP remote signing')
+    latency.add_argument('--rpc-latency', type=float, default=0.08, help='RPC node')
+    latency.add_argument('--price-latency', type=float, default=0.2, help='CoinGecko price API')
+    latency.add_argument('--jitter', type=float, default=0.2, help='Latency jitter as a fraction of the mean')
+    latency.add_argument('--latency-scale', type=float, default=1.0, help='Multiplier for every latency (e.g. 0.1 for quick runs)')
+    latency.add_argument('--seed', type=int, default=None, help='Seed for reproducible jitter')
+
+    parser.add_argument('--bedrock-throttle', type=float, default=0,
+                        help='Fraction of Bedrock calls in AWS_REGION that fail with ThrottlingException')
+    parser.add_argument('--image-bytes', type=int, default=1024 * 1024, help='Size of each fake generated image')
+    parser.add_argument('--tracemalloc', action='store_true', help='Also report peak traced Python allocations (slower)')
+    parser.add_argument('--json', metavar='PATH', help='Write the full report (per-dependency calls, service stats) as JSON')
+    parser.add_argument('--verbose', action='store_true', help='Keep service logs and x402 debug output')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
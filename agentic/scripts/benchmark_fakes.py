@@ -0,0 +1,352 @@
+"""Local stand-ins for the agent's external dependencies, used by benchmark.py.
+
+Each fake answers like the real service (same request/response shapes) after an
+injected latency, and counts its calls so a benchmark run shows how many round-trips
+each dependency actually received. Nothing here touches the network.
+"""
+import io
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import asyncio
+import threading
+from collections import Counter
+from types import SimpleNamespace
+import httpx
+from botocore.exceptions import ClientError
+from eth_abi import encode, decode
+from web3 import Web3
+from web3.providers import BaseProvider
+from strands.models import Model
+
+CHAIN_ID = 84532  # Base Sepolia
+AGENT_ADDRESS = '0x00000000000000000000000000000000000A6E47'
+SELLER_ADDRESS = '0x000000000000000000000000000000000005E11E'
+USDC_ADDRESS = '0x036CbD53842c5426634e7929541eC2318f3dCF7e'
+# Stand-in for the agent wallet's balances
+FAKE_ETH_WEI = 10 ** 18
+FAKE_USDC_UNITS = 1_000_000 * 10 ** 6
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_SELECTOR_AGGREGATE3 = Web3.keccak(text='aggregate3((address,bool,bytes)[])')[:4]
+_SELECTOR_GET_ETH_BALANCE = Web3.keccak(text='getEthBalance(address)')[:4]
+_SELECTOR_BALANCE_OF = Web3.keccak(text='balanceOf(address)')[:4]
+
+
+class Latency:
+    """Injected latency: mean seconds with +/- jitter (fraction of the mean)"""
+
+    def __init__(self, mean: float, jitter: float = 0.2, seed: int = None):
+        self.mean = mean
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            return max(self.mean * self._random.uniform(1 - self.jitter, 1 + self.jitter), 0.0)
+
+    def sleep(self) -> None:
+        time.sleep(self.sample())
+
+    async def asleep(self) -> None:
+        await asyncio.sleep(self.sample())
+
+
+class CallCounter:
+    """Thread-safe call counts per dependency"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+calls = CallCounter()
+
+
+class FakeBedrockRuntime:
+    """bedrock-runtime client answering invoke_model for Nova Canvas and Claude vision.
+
+    throttle_rate is the fraction of calls that fail with ThrottlingException, as they
+    do once botocore's retries are exhausted.
+    """
+
+    def __init__(self, image_latency: Latency, text_latency: Latency, image_bytes: int = 1024 * 1024,
+                 throttle_rate: float = 0, seed: int = None):
+        self.image_latency = image_latency
+        self.text_latency = text_latency
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        # Random filler so every image is a unique size-realistic payload (unique content ID)
+        self._filler = random.Random(0).randbytes(max(image_bytes - len(PNG_SIGNATURE) - 16, 0))
+
+    def _image(self) -> str:
+        return base64.b64encode(PNG_SIGNATURE + uuid.uuid4().bytes + self._filler).decode()
+
+    def invoke_model(self, modelId: str, body: str, **kwargs) -> dict:
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            calls.add('bedrock_throttled')
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests'}}, 'InvokeModel')
+        request = json.loads(body)
+        if 'nova-canvas' in modelId:
+            calls.add('bedrock_nova_canvas')
+            self.image_latency.sleep()
+            count = request['imageGenerationConfig']['numberOfImages']
+            response = {'images': [self._image() for _ in range(count)]}
+        else:
+            calls.add('bedrock_claude')
+            self.text_latency.sleep()
+            prompt = request['messages'][0]['content'][-1]['text']
+            headers = re.findall(r"'(### [^']+)'", prompt)
+            if headers:
+                text = '\n'.join(f"{header}\nBenchmark analysis." for header in headers)
+            else:
+                text = 'Benchmark analysis of the image.'
+            response = {'content': [{'type': 'text', 'text': text}]}
+        return {'body': io.BytesIO(json.dumps(response).encode())}
+
+
+class ScriptedModel(Model):
+    """Strands model that plays the system prompt's x402 tool sequence without an LLM.
+
+    Each call looks at the current turn: a new prompt starts estimate_image_cost (or
+    check_wallet_balance / analyze_content_monetization when asked), and each tool
+    result selects the next step of estimate -> generate -> make_payment -> generate
+    before a final answer. The session ID is read from "session_id: <id>" in the prompt.
+    """
+
+    _SESSION = re.compile(r'session_id[:=]\s*([\w\-]+)')
+    _IMAGE_ID = re.compile(r'IMAGE_IDS?:([0-9a-f]{64})')
+
+    def __init__(self, latency: Latency, tokens_per_second: float = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.config = {'model_id': 'scripted-benchmark-model'}
+
+    def update_config(self, **model_config) -> None:
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError('ScriptedModel does not support structured output')
+
+    def _next_step(self, messages: list):
+        """(tool name, input) for the next tool call, or (None, final text)"""
+        tool_names = {}
+        start = 0
+        for i, message in enumerate(messages):
+            for block in message['content']:
+                if 'toolUse' in block:
+                    tool_names[block['toolUse']['toolUseId']] = block['toolUse']['name']
+            if message['role'] == 'user' and not any('toolResult' in block for block in message['content']):
+                start = i
+
+        prompt = ' '.join(block.get('text', '') for block in messages[start]['content'])
+        match = self._SESSION.search(prompt)
+        session_id = match.group(1) if match else 'default'
+
+        last_tool, last_result = None, ''
+        for message in messages[start:]:
+            for block in message['content']:
+                if 'toolResult' in block:
+                    last_tool = tool_names.get(block['toolResult']['toolUseId'])
+                    last_result = ' '.join(item.get('text', '') for item in block['toolResult']['content'])
+
+        if last_tool is None:
+            if 'balance' in prompt.lower():
+                return 'check_wallet_balance', {'session_id': session_id}
+            if 'analy' in prompt.lower():
+                image_ids = self._IMAGE_ID.findall(json.dumps(messages))
+                if image_ids:
+                    return 'analyze_content_monetization', {'image_id': image_ids[-1], 'analysis_type': 'description', 'session_id': session_id}
+            return 'estimate_image_cost', {'prompt': prompt, 'session_id': session_id}
+        if last_tool == 'estimate_image_cost' and last_result.startswith('REQUEST_ID'):
+            return 'generate_image', {'session_id': session_id}
+        if last_tool == 'generate_image' and last_result.startswith('AUTHORIZE_CHECK'):
+            return 'make_payment', {'session_id': session_id}
+        if last_tool == 'make_payment' and 'authorized' in last_result:
+            return 'generate_image', {'session_id': session_id}
+        return None, f"Done. {last_result.splitlines()[0] if last_result else ''}"
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        calls.add('model')
+        await self.latency.asleep()
+        name, value = self._next_step(messages)
+        input_tokens = sum(len(json.dumps(message['content'])) for message in messages) // 4
+        yield {'messageStart': {'role': 'assistant'}}
+        if name is None:
+            for word in value.split(' '):
+                if self.tokens_per_second:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                yield {'contentBlockDelta': {'delta': {'text': word + ' '}}}
+            yield {'contentBlockStop': {}}
+            yield {'messageStop': {'stopReason': 'end_turn'}}
+        else:
+            yield {'contentBlockStart': {'start': {'toolUse': {'toolUseId': f"tooluse_{uuid.uuid4().hex[:12]}", 'name': name}}}}
+            yield {'contentBlockDelta': {'delta': {'toolUse': {'input': json.dumps(value)}}}}
+            yield {'contentBlockStop': {}}
+            yield {'messageStop': {'stopReason': 'tool_use'}}
+        yield {'metadata': {
+            'usage': {'inputTokens': input_tokens, 'outputTokens': 20, 'totalTokens': input_tokens + 20},
+            'metrics': {'latencyMs': int(self.latency.mean * 1000)}
+        }}
+
+
+class FakeGateway:
+    """x402 seller gateway (agentic/lambda/seller.js): 402 negotiation, verification and /settle"""
+
+    def __init__(self, latency: Latency, settle_latency: Latency, base_url: str):
+        self.latency = latency
+        self.settle_latency = settle_latency
+        self.base_url = base_url
+        self._pending = set()
+
+    def requirements(self, price: str) -> dict:
+        return {
+            'scheme': 'exact',
+            'network': 'base-sepolia',
+            'maxAmountRequired': str(price),
+            'resource': f"{self.base_url}/generate_image",
+            'description': 'AI image generation with Nova Canvas',
+            'mimeType': 'application/json',
+            'outputSchema': {'status': 'string', 'request_id': 'string', 'message': 'string'},
+            'payTo': SELLER_ADDRESS,
+            'asset': USDC_ADDRESS,
+            'maxTimeoutSeconds': 300,
+            'extra': {'name': 'USDC', 'version': '2', 'chainId': CHAIN_ID}
+        }
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content or b'{}')
+        if request.url.path == '/settle':
+            calls.add('gateway_settle')
+            await self.settle_latency.asleep()
+            nonces = body.get('nonces') or [body.get('nonce')]
+            results = {}
+            for nonce in nonces:
+                if nonce in self._pending:
+                    self._pending.discard(nonce)
+                    results[nonce] = {'status': 'settled', 'transaction_hash': '0x' + uuid.uuid4().hex * 2}
+                else:
+                    results[nonce] = {'error': 'No pending payment found for nonce'}
+            if 'nonces' in body:
+                return httpx.Response(200, json={'results': results})
+            return httpx.Response(200 if 'status' in results[nonces[0]] else 404, json=results[nonces[0]])
+
+        calls.add('gateway_generate_image')
+        await self.latency.asleep()
+        payment = request.headers.get('X-PAYMENT')
+        if not payment:
+            return httpx.Response(402, json={
+                'x402Version': 1,
+                'accepts': [self.requirements(body.get('price', '20000'))],
+                'error': 'Payment required'
+            })
+        authorization = json.loads(base64.b64decode(payment))['payload']['authorization']
+        self._pending.add(authorization['nonce'])
+        return httpx.Response(200, json={
+            'status': 'payment_verified',
+            'request_id': body.get('request_id'),
+            'message': 'Payment verified - proceed with image generation',
+            'nonce': authorization['nonce']
+        })
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(base_url=self.base_url, transport=httpx.MockTransport(self.handle))
+
+
+class FakeCdpWallet:
+    """CDP EVM wallet provider: address, network and remote (blocking) signing"""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+    def get_address(self) -> str:
+        return AGENT_ADDRESS
+
+    def get_network(self):
+        return SimpleNamespace(protocol_family='evm', network_id='base-sepolia', chain_id=str(CHAIN_ID))
+
+    def sign_typed_data(self, typed_data: dict) -> str:
+        calls.add('cdp_sign')
+        self.latency.sleep()
+        return '0x' + random.randbytes(64).hex() + '1b'
+
+    def sign_transaction(self, transaction: dict) -> dict:
+        calls.add('cdp_sign')
+        self.latency.sleep()
+        return {'rawTransaction': random.randbytes(110)}
+
+
+class FakePriceSource:
+    """CoinGecko USDC/USD price"""
+
+    name = 'benchmark'
+
+    def __init__(self, latency: Latency, price: float = 1.0):
+        self.latency = latency
+        self.price = price
+        self.timeout = 5
+
+    def fetch(self) -> float:
+        calls.add('price')
+        self.latency.sleep()
+        return self.price
+
+
+class FakeRPCProvider(BaseProvider):
+    """Base Sepolia JSON-RPC node: chain ID, blocks, balances and Multicall3 balance reads"""
+
+    def __init__(self, latency: Latency, block_time: float = 2.0):
+        super().__init__()
+        self.latency = latency
+        self.block_time = block_time
+        self._started = time.monotonic()
+        self._id = 0
+
+    def _block_number(self) -> int:
+        return 20_000_000 + int((time.monotonic() - self._started) / self.block_time)
+
+    def _call(self, data: bytes) -> bytes:
+        selector, args = data[:4], data[4:]
+        if selector == _SELECTOR_AGGREGATE3:
+            (sub_calls,) = decode(['(address,bool,bytes)[]'], args)
+            return encode(['(bool,bytes)[]'], [[(True, self._call(call_data)) for _, _, call_data in sub_calls]])
+        if selector == _SELECTOR_GET_ETH_BALANCE:
+            return encode(['uint256'], [FAKE_ETH_WEI])
+        if selector == _SELECTOR_BALANCE_OF:
+            return encode(['uint256'], [FAKE_USDC_UNITS])
+        raise ValueError(f"Unsupported eth_call selector 0x{selector.hex()}")
+
+    def make_request(self, method, params):
+        calls.add('rpc')
+        self.latency.sleep()
+        self._id += 1
+        if method == 'eth_chainId':
+            result = hex(CHAIN_ID)
+        elif method == 'eth_blockNumber':
+            result = hex(self._block_number())
+        elif method == 'eth_getBalance':
+            result = hex(FAKE_ETH_WEI)
+        elif method == 'eth_call':
+            result = '0x' + self._call(bytes.fromhex(params[0]['data'][2:])).hex()
+        else:
+            return {'jsonrpc': '2.0', 'id': self._id, 'error': {'code': -32601, 'message': f"{method} not supported by the benchmark node"}}
+        return {'jsonrpc': '2.0', 'id': self._id, 'result': result}
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
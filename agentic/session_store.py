@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Session store configuration
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+SESSION_STORE_MAX_SESSIONS = int(os.getenv('SESSION_STORE_MAX_SESSIONS', '1000'))
+SESSION_STORE_TTL = float(os.getenv('SESSION_STORE_TTL', '3600'))
+# Per-session caps: oldest purchase requests and image references beyond these are dropped
+SESSION_MAX_REQUESTS = int(os.getenv('SESSION_MAX_REQUESTS', '100'))
+SESSION_MAX_IMAGES = int(os.getenv('SESSION_MAX_IMAGES', '500'))
+# Optimistic-locking retries when concurrent requests save the same Redis session
+SESSION_STORE_SAVE_RETRIES = int(os.getenv('SESSION_STORE_SAVE_RETRIES', '10'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+
+class BoundedDict(OrderedDict):
+    """Dict that drops its oldest (least recently set) entries beyond maxlen"""
+
+    def __init__(self, maxlen: int):
+        super().__init__()
+        self.maxlen = maxlen
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxlen:
+            self.popitem(last=False)
+
+
+class BoundedSet(BoundedDict):
+    """Set-like BoundedDict supporting add()"""
+
+    def add(self, key) -> None:
+        self[key] = True
+
+
+# Session-level storage - will be managed per session
+# authorize_check: User consent layer before x402 automatic payment
+# Enables natural language approval ("yes, proceed") with optional AgentKit spending allowances
+class SessionStorage:
+    __slots__ = ('session_id', 'image_storage', 'authorize_check', 'auth_verified',
+                 'current_request_id', 'current_cost', '_store', '_loaded')
+
+    def __init__(self, session_id="default", store=None):
+        self.session_id = session_id
+        self.image_storage = BoundedDict(SESSION_MAX_IMAGES)  # image_id -> content type (bytes live in the image store)
+        self.authorize_check = BoundedDict(SESSION_MAX_REQUESTS)  # User consent tracking - auth:True means user approved spend
+        self.auth_verified = set()
+        self.current_request_id = None  # Track current request_id
+        self.current_cost = None        # Track current cost
+        self._store = store
+        self._loaded = {}  # State as last read from a shared store, for merging concurrent saves
+
+    def save(self) -> None:
+        """Persist changes (no-op for the in-memory store, which holds this object)"""
+        if self._store is not None:
+            self._store.save(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'image_storage': self.image_storage,
+            'authorize_check': self.authorize_check,
+            'auth_verified': sorted(self.auth_verified),
+            'current_request_id': self.current_request_id,
+            'current_cost': self.current_cost
+        }
+
+    @classmethod
+    def from_dict(cls, session_id: str, data: dict, store=None) -> "SessionStorage":
+        storage = cls(session_id, store)
+        storage.image_storage.update(data.get('image_storage', {}))
+        storage.authorize_check.update(data.get('authorize_check', {}))
+        storage.auth_verified = set(data.get('auth_verified', []))
+        storage.current_request_id = data.get('current_request_id')
+        storage.current_cost = data.get('current_cost')
+        return storage
+
+
+class MemorySessionStore:
+    """In-process session store with LRU + idle TTL eviction.
+
+    Sessions hold only bookkeeping (image bytes live in the image store, which has its
+    own byte budget), capped at SESSION_MAX_REQUESTS requests and SESSION_MAX_IMAGES
+    image references each, so the session count bounds memory.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_STORE_MAX_SESSIONS, ttl: float = SESSION_STORE_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # session_id -> (last_used, SessionStorage)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> SessionStorage:
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            storage = entry[1] if entry else SessionStorage(session_id)
+            self._sessions[session_id] = (time.monotonic(), storage)
+            self._evict()
+            return storage
+
+    def save(self, storage: SessionStorage) -> None:
+        pass
+
+    def _evict(self) -> None:
+        """Evict expired sessions, then least recently used ones over max_sessions"""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, (last_used, storage) = next(iter(self._sessions.items()))
+            if now - last_used > self.ttl or len(self._sessions) > self.max_sessions:
+                del self._sessions[session_id]
+                self.evictions += 1
+                continue
+            break
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'evictions': self.evictions
+            }
+
+
+def merge_session(base: dict, ours: dict, theirs: dict) -> dict:
+    """Three-way merge of session dicts: our changes since base, applied onto theirs"""
+    merged = {}
+    for field in ('image_storage', 'authorize_check'):
+        base_items, our_items = base.get(field, {}), ours[field]
+        items = dict(theirs.get(field, {}))
+        for key in base_items.keys() - our_items.keys():
+            items.pop(key, None)
+        for key, value in our_items.items():
+            if base_items.get(key) != value:
+                items.pop(key, None)  # Re-insert so a changed request counts as recent
+                items[key] = value
+        merged[field] = items
+    base_verified, our_verified = set(base.get('auth_verified', [])), set(ours['auth_verified'])
+    merged['auth_verified'] = sorted(
+        (set(theirs.get('auth_verified', [])) - (base_verified - our_verified)) | (our_verified - base_verified))
+    for field in ('current_request_id', 'current_cost'):
+        merged[field] = ours[field] if ours[field] != base.get(field) else theirs.get(field)
+    return merged
+
+
+class RedisSessionStore:
+    """Session store shared across replicas via a Redis-compatible client.
+
+    Sessions are stored as JSON with a TTL refreshed on every write. A request holds
+    its session across long x402 and Bedrock calls, so save() merges its changes into
+    the current stored value under WATCH/MULTI instead of overwriting updates that
+    other requests saved meanwhile. Any client with get/pipeline/dbsize works, so tests
+    can pass a local stand-in (e.g. fakeredis).
+    """
+
+    def __init__(self, client, ttl: float = SESSION_STORE_TTL, prefix: str = 'session:'):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.conflicts = 0
+
+    def get(self, session_id: str) -> SessionStorage:
+        raw = self.client.get(self.prefix + session_id)
+        if raw is None:
+            return SessionStorage(session_id, self)
+        storage = SessionStorage.from_dict(session_id, json.loads(raw), self)
+        # Separate copy: callers mutate request entries in place
+        storage._loaded = json.loads(raw)
+        return storage
+
+    def save(self, storage: SessionStorage) -> None:
+        from redis.exceptions import WatchError  # Optional dependency, only needed for the shared backend
+        key = self.prefix + storage.session_id
+        # Round-trip through JSON: entries are mutated in place, so the snapshot must be a copy
+        ours = json.loads(json.dumps(storage.to_dict()))
+        for _ in range(SESSION_STORE_SAVE_RETRIES):
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    theirs = json.loads(raw) if raw is not None else {}
+                    # Round-trip through SessionStorage applies the per-session caps
+                    merged = SessionStorage.from_dict(storage.session_id, merge_session(storage._loaded, ours, theirs)).to_dict()
+                    pipe.multi()
+                    pipe.set(key, json.dumps(merged), ex=self.ttl)
+                    pipe.execute()
+                except WatchError:
+                    self.conflicts += 1
+                    continue
+            # Continue from the merged state so the next save only applies newer changes
+            fresh = SessionStorage.from_dict(storage.session_id, merged)
+            storage.image_storage, storage.authorize_check = fresh.image_storage, fresh.authorize_check
+            storage.auth_verified = fresh.auth_verified
+            storage.current_request_id, storage.current_cost = fresh.current_request_id, fresh.current_cost
+            storage._loaded = json.loads(json.dumps(merged))
+            return
+        raise RuntimeError(f"Session {storage.session_id} changed concurrently {SESSION_STORE_SAVE_RETRIES} times, not saved")
+
+    def stats(self) -> dict:
+        return {'backend': 'redis', 'keys': self.client.dbsize(), 'conflicts': self.conflicts}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """Get or create the session store configured from the environment"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_STORE == 'redis':
+                import redis  # Optional dependency, only needed for the shared backend
+                _store = RedisSessionStore(redis.Redis.from_url(REDIS_URL))
+            else:
+                _store = MemorySessionStore()
+    return _store
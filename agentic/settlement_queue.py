@@ -0,0 +1,253 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+from async_runtime import get_loop
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Durable queue location (SQLite) and worker tuning
+SETTLEMENT_DB = os.getenv('SETTLEMENT_DB', '/tmp/agent-settlements.db')
+# Nonces per /settle call (gateways that predate batching get one nonce per call)
+SETTLEMENT_BATCH_SIZE = int(os.getenv('SETTLEMENT_BATCH_SIZE', '10'))
+# How long the worker waits to gather more nonces into a batch (seconds)
+SETTLEMENT_BATCH_WINDOW = float(os.getenv('SETTLEMENT_BATCH_WINDOW', '0.1'))
+SETTLEMENT_MAX_ATTEMPTS = int(os.getenv('SETTLEMENT_MAX_ATTEMPTS', '6'))
+SETTLEMENT_BACKOFF_BASE = float(os.getenv('SETTLEMENT_BACKOFF_BASE', '1'))
+SETTLEMENT_BACKOFF_MAX = float(os.getenv('SETTLEMENT_BACKOFF_MAX', '60'))
+SETTLEMENT_TIMEOUT = float(os.getenv('SETTLEMENT_TIMEOUT', '30'))
+# Settled/failed rows are kept this long for status lookups (seconds)
+SETTLEMENT_RETENTION = float(os.getenv('SETTLEMENT_RETENTION', '86400'))
+
+# Client errors worth retrying (timeouts, rate limits); other 4xx responses are final
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+# Error a gateway that predates batching returns (with 400) for a { nonces } body
+UNBATCHED_GATEWAY_ERROR = 'Missing nonce'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settlements (
+    request_id TEXT PRIMARY KEY,
+    nonce TEXT NOT NULL,
+    gateway_url TEXT NOT NULL,
+    session_id TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    transaction_hash TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class SettlementQueue:
+    """Durable queue that settles x402 payments off the response path.
+
+    generate_image enqueues the payment nonce once content exists and returns
+    immediately. A worker on the shared tools loop posts due nonces to the gateway's
+    /settle in batches, retrying network errors, 5xx and transient 4xx responses with
+    jittered exponential backoff. Rows
+    live in SQLite, so pending settlements survive restarts and status can be looked
+    up by request_id.
+    """
+
+    def __init__(self, http_client_for, on_complete=None, path: str = SETTLEMENT_DB):
+        self.http_client_for = http_client_for  # gateway_url -> httpx.AsyncClient
+        self.on_complete = on_complete  # (request_id, session_id, status, transaction_hash)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(_SCHEMA)
+        self._db.execute('CREATE INDEX IF NOT EXISTS settlements_due ON settlements (status, next_attempt_at)')
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._worker = None
+        self._clients = {}  # gateway_url -> httpx.AsyncClient
+        self._single_nonce_gateways = set()
+
+    def _execute(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def start(self) -> None:
+        """Start the worker on the shared loop (resumes rows left pending by a restart)"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = asyncio.run_coroutine_threadsafe(self._run(), get_loop())
+
+    def enqueue(self, request_id: str, nonce: str, gateway_url: str, session_id: str = None) -> None:
+        """Queue a nonce for settlement (blocking SQLite write - call off the event loop)"""
+        now = time.time()
+        self._execute(
+            'INSERT OR REPLACE INTO settlements (request_id, nonce, gateway_url, session_id, status, attempts, '
+            'next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)',
+            (request_id, nonce, gateway_url, session_id, 'pending', now, now, now)
+        )
+        self.start()
+        if self._wakeup is not None:
+            get_loop().call_soon_threadsafe(self._wakeup.set)
+
+    def status(self, request_id: str):
+        rows = self._execute(
+            'SELECT request_id, status, attempts, transaction_hash, error, created_at, updated_at '
+            'FROM settlements WHERE request_id = ?', (request_id,)
+        )
+        return dict(rows[0]) if rows else None
+
+    def stats(self) -> dict:
+        rows = self._execute('SELECT status, COUNT(*) AS count FROM settlements GROUP BY status')
+        return {row['status']: row['count'] for row in rows}
+
+    async def _run(self) -> None:
+        # SQLite calls, client lookups and completion callbacks block, so they run in threads
+        self._wakeup = asyncio.Event()
+        while True:
+            # Cleared before scanning so an enqueue during the scan still wakes us
+            self._wakeup.clear()
+            try:
+                due = await asyncio.to_thread(
+                    self._execute,
+                    'SELECT request_id, nonce, gateway_url, session_id, attempts, created_at FROM settlements '
+                    'WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at',
+                    ('pending', time.time())
+                )
+                batches = {}
+                for row in due:
+                    batches.setdefault(row['gateway_url'], []).append(row)
+                for gateway_url, rows in batches.items():
+                    for i in range(0, len(rows), SETTLEMENT_BATCH_SIZE):
+                        await self._settle(gateway_url, rows[i:i + SETTLEMENT_BATCH_SIZE])
+                await asyncio.to_thread(
+                    self._execute,
+                    'DELETE FROM settlements WHERE status != ? AND updated_at < ?',
+                    ('pending', time.time() - SETTLEMENT_RETENTION)
+                )
+                # Sleep until the next retry is due or a new settlement arrives
+                next_due = await asyncio.to_thread(
+                    self._execute, 'SELECT MIN(next_attempt_at) AS at FROM settlements WHERE status = ?', ('pending',)
+                )
+                delay = SETTLEMENT_BACKOFF_MAX if next_due[0]['at'] is None else max(next_due[0]['at'] - time.time(), 0)
+            except Exception as e:
+                logger.error(f"Settlement worker error: {str(e)}", exc_info=True)
+                delay = SETTLEMENT_BACKOFF_BASE
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            # Let concurrent requests join the batch
+            await asyncio.sleep(SETTLEMENT_BATCH_WINDOW)
+
+    async def _client(self, gateway_url: str):
+        http = self._clients.get(gateway_url)
+        if http is None:
+            # Creating a gateway client loads the wallet on first use
+            http = self._clients[gateway_url] = await asyncio.to_thread(self.http_client_for, gateway_url)
+        return http
+
+    async def _settle(self, gateway_url: str, rows: list) -> None:
+        http = await self._client(gateway_url)
+        if len(rows) > 1 and gateway_url not in self._single_nonce_gateways:
+            response = await self._post(http, {'nonces': [row['nonce'] for row in rows]}, len(rows))
+            # Any other 400 is a real rejection - settling one at a time would only repeat it
+            if not self._rejects_batches(response):
+                await asyncio.to_thread(self._record, rows, response)
+                return
+            logger.warning(f"Gateway {gateway_url} does not accept batched nonces, settling them one at a time")
+            self._single_nonce_gateways.add(gateway_url)
+        await asyncio.gather(*(self._settle_one(http, row) for row in rows))
+
+    @staticmethod
+    def _rejects_batches(response) -> bool:
+        if isinstance(response, Exception) or response.status_code != 400:
+            return False
+        try:
+            return response.json().get('error') == UNBATCHED_GATEWAY_ERROR
+        except ValueError:
+            return False
+
+    async def _settle_one(self, http, row) -> None:
+        response = await self._post(http, {'nonce': row['nonce']}, 1)
+        await asyncio.to_thread(self._record, [row], response)
+
+    async def _post(self, http, body: dict, size: int):
+        """POST /settle, returning the response or the exception it raised"""
+        try:
+            with telemetry.span('settlement.batch', size=size):
+                return await http.post('/settle', json=body, timeout=SETTLEMENT_TIMEOUT)
+        except Exception as e:
+            return e
+
+    def _record(self, rows: list, response) -> None:
+        """Apply a /settle outcome to its rows: retry transient failures, complete the rest"""
+        if isinstance(response, Exception):
+            for row in rows:
+                self._retry(row, str(response))
+            return
+
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUS_CODES:
+            retry_after = response.headers.get('Retry-After', '')
+            for row in rows:
+                self._retry(row, f"Gateway returned {response.status_code}",
+                            float(retry_after) if retry_after.isdigit() else 0)
+            return
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {'error': response.text[:200]}
+        results = data.get('results') or {rows[0]['nonce']: data}
+        for row in rows:
+            result = results.get(row['nonce']) or {'error': f"Gateway returned {response.status_code}"}
+            if result.get('status') == 'settled':
+                self._complete(row, 'settled', result.get('transaction_hash'))
+            else:
+                # Unknown or already-settled nonces won't succeed on retry
+                self._complete(row, 'failed', None, result.get('error'))
+
+    def _retry(self, row, error: str, retry_after: float = 0) -> None:
+        attempts = row['attempts'] + 1
+        if attempts >= SETTLEMENT_MAX_ATTEMPTS:
+            self._complete(row, 'failed', None, error, attempts)
+            return
+        backoff = min(SETTLEMENT_BACKOFF_BASE * 2 ** attempts, SETTLEMENT_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+        backoff = max(backoff, retry_after)
+        logger.warning(f"Settlement {row['request_id']} failed ({error}), retry {attempts} in {backoff:.1f}s")
+        self._execute(
+            'UPDATE settlements SET attempts = ?, next_attempt_at = ?, error = ?, updated_at = ? WHERE request_id = ?',
+            (attempts, time.time() + backoff, error, time.time(), row['request_id'])
+        )
+
+    def _complete(self, row, status: str, transaction_hash: str = None, error: str = None, attempts: int = None) -> None:
+        self._execute(
+            'UPDATE settlements SET status = ?, transaction_hash = ?, error = ?, attempts = ?, updated_at = ? '
+            'WHERE request_id = ?',
+            (status, transaction_hash, error, attempts if attempts is not None else row['attempts'] + 1,
+             time.time(), row['request_id'])
+        )
+        logger.info(f"Settlement {row['request_id']} {status}: {transaction_hash or error}")
+        # Enqueue to final status, retries included
+        telemetry.observe('settlement.complete', time.time() - row['created_at'], status != 'settled')
+        if self.on_complete is not None:
+            try:
+                self.on_complete(row['request_id'], row['session_id'], status, transaction_hash)
+            except Exception as e:
+                logger.warning(f"Settlement callback failed for {row['request_id']}: {str(e)}")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_settlement_queue(http_client_for=None, on_complete=None) -> SettlementQueue:
+    """Get or create the settlement queue (the first caller supplies the gateway client and callback)"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if http_client_for is None:
+                raise RuntimeError('Settlement queue is not initialized')
+            _queue = SettlementQueue(http_client_for, on_complete)
+        return _queue
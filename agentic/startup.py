@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Process start as seen by this module (imported first by agent.py)
+PROCESS_STARTED = time.perf_counter()
+
+# Warm heavy clients in the background after startup (false: initialize on first use only)
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'true').lower() == 'true'
+
+
+class Startup:
+    """Tracks import time and concurrent background warm-up of heavy clients.
+
+    Components (wallet, Bedrock clients, models) register an initializer; warm()
+    runs them all in parallel threads so /ping answers immediately while /ready
+    reports healthy only once every required component has initialized.
+    """
+
+    def __init__(self):
+        self._components = {}  # name -> (initializer, required)
+        self._results = {}  # name -> {'status', 'seconds', 'error'}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._started = False
+        self.import_seconds = None
+        self.warmup_seconds = None
+
+    def register(self, name: str, initializer, required: bool = True) -> None:
+        self._components[name] = (initializer, required)
+
+    def mark_imported(self) -> None:
+        self.import_seconds = time.perf_counter() - PROCESS_STARTED
+        logger.info(f"Imports finished in {self.import_seconds:.2f}s")
+
+    def _run(self, name: str, initializer) -> None:
+        started = time.perf_counter()
+        try:
+            initializer()
+            result = {'status': 'ready', 'seconds': round(time.perf_counter() - started, 3)}
+        except Exception as e:
+            logger.error(f"Warm-up of {name} failed: {str(e)}", exc_info=True)
+            result = {'status': 'error', 'seconds': round(time.perf_counter() - started, 3), 'error': str(e)}
+        with self._lock:
+            self._results[name] = result
+
+    def _warm_all(self) -> None:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(len(self._components), 1), thread_name_prefix='warmup') as executor:
+            for name, (initializer, _) in self._components.items():
+                executor.submit(self._run, name, initializer)
+        self.warmup_seconds = time.perf_counter() - started
+        self._done.set()
+        logger.info(f"Startup report: {self.report()}")
+
+    def warm(self) -> None:
+        """Initialize all components concurrently in a background thread"""
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._warm_all, daemon=True, name='startup-warmup').start()
+
+    def _ready(self) -> bool:
+        if not self._started:
+            return True  # Warm-up disabled: components initialize on first use
+        return all(self._results.get(name, {}).get('status') == 'ready'
+                   for name, (_, required) in self._components.items() if required)
+
+    def ready(self) -> bool:
+        with self._lock:
+            return self._ready()
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                'ready': self._ready(),
+                'import_seconds': round(self.import_seconds, 3) if self.import_seconds is not None else None,
+                'warmup_seconds': round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+                'uptime_seconds': round(time.perf_counter() - PROCESS_STARTED, 3),
+                'components': {name: self._results.get(name, {'status': 'pending' if self._started else 'lazy'})
+                               for name in self._components}
+            }
+
+
+startup = Startup()
@@ -0,0 +1,166 @@
+import os
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets for stage durations (seconds)
+TELEMETRY_BUCKETS = tuple(float(bucket) for bucket in os.getenv(
+    'TELEMETRY_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60').split(','))
+# Export spans over OTLP together with Strands' agent, model and tool spans
+# (needs strands-agents[otel]; endpoint from OTEL_EXPORTER_OTLP_ENDPOINT)
+TELEMETRY_OTEL = os.getenv('TELEMETRY_OTEL', 'false').lower() == 'true'
+# Log every span as a structured line
+TELEMETRY_LOG_SPANS = os.getenv('TELEMETRY_LOG_SPANS', 'false').lower() == 'true'
+
+_METRIC_NAME = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class _Histogram:
+    """Per-bucket counts (cumulated when rendered), sum and count"""
+
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * len(TELEMETRY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        index = bisect_left(TELEMETRY_BUCKETS, seconds)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+def _label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Telemetry:
+    """Timing spans for each stage of a request, exposed in the Prometheus text format.
+
+    Stages are dotted names (invocation, model_call, tool.generate_image, x402.negotiate,
+    x402.sign, bedrock.image, settlement.batch, rpc.eth_call, ...). Every span feeds the
+    agent_stage_duration_seconds histogram; with TELEMETRY_OTEL it is also an
+    OpenTelemetry span. Components register their stats() so /metrics also reports
+    their current state as gauges and their running totals as counters.
+    """
+
+    def __init__(self):
+        self._histograms = {}  # (stage, status) -> _Histogram
+        self._sources = {}  # name -> (stats callable, label for list entries, counter fields)
+        self._lock = threading.Lock()
+        self._tracer = None
+
+    def setup_otel(self) -> None:
+        """Export spans over OTLP (Strands adds its agent, model and tool spans to the same traces)"""
+        from strands.telemetry import StrandsTelemetry  # OTLP exporter ships with strands-agents[otel]
+        from opentelemetry import trace
+        StrandsTelemetry().setup_otlp_exporter()
+        self._tracer = trace.get_tracer('agentic')
+        logger.info("OpenTelemetry span export enabled")
+
+    def observe(self, stage: str, seconds: float, error: bool = False) -> None:
+        """Record a stage duration measured elsewhere (e.g. between two hook events)"""
+        key = (stage, 'error' if error else 'ok')
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(seconds)
+        if TELEMETRY_LOG_SPANS:
+            logger.info(f"[SPAN] stage={stage} duration_ms={seconds * 1000:.1f} status={key[1]}")
+
+    @contextmanager
+    def span(self, stage: str, **attributes):
+        """Time the enclosed block as a stage (errors are recorded and re-raised)"""
+        if self._tracer is not None:
+            attributes = {name: value for name, value in attributes.items() if value is not None}
+            otel_span = self._tracer.start_as_current_span(stage, attributes=attributes)
+        else:
+            otel_span = nullcontext()
+        started = time.perf_counter()
+        error = False
+        try:
+            with otel_span:
+                yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, error)
+
+    def register_stats(self, name: str, stats, label: str = None, counters=()) -> None:
+        """Export a component's stats() numbers as agent_<name>_<field> gauges.
+
+        stats returns a dict, or a list of dicts whose `label` field becomes a label.
+        Fields listed in counters only ever increase and are exported as
+        agent_<name>_<field>_total counters.
+        """
+        self._sources[name] = (stats, label, frozenset(counters))
+
+    def summary(self) -> dict:
+        """Count, errors and mean duration per stage"""
+        stages = {}
+        with self._lock:
+            for (stage, status), histogram in self._histograms.items():
+                entry = stages.setdefault(stage, {'count': 0, 'errors': 0, 'seconds': 0.0})
+                entry['count'] += histogram.count
+                entry['seconds'] += histogram.sum
+                if status == 'error':
+                    entry['errors'] += histogram.count
+        return {stage: {'count': entry['count'], 'errors': entry['errors'],
+                        'avg_ms': round(entry['seconds'] / entry['count'] * 1000, 1)}
+                for stage, entry in sorted(stages.items())}
+
+    def _stats_metrics(self) -> dict:
+        metrics = {}  # metric name -> (type, [(labels, value)])
+        for name, (stats, label, counters) in list(self._sources.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logger.debug(f"Stats for {name} unavailable: {str(e)}")
+                continue
+            rows = values if isinstance(values, list) else [values]
+            for row in rows:
+                labels = f'{{{label}="{_label_value(row.get(label))}"}}' if label else ''
+                for field, value in row.items():
+                    if isinstance(value, bool):
+                        value = int(value)
+                    if isinstance(value, (int, float)):
+                        kind = 'counter' if field in counters else 'gauge'
+                        metric = _METRIC_NAME.sub('_', f"agent_{name}_{field}" + ('_total' if kind == 'counter' else ''))
+                        metrics.setdefault(metric, (kind, []))[1].append((labels, value))
+        return metrics
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = [
+            '# HELP agent_stage_duration_seconds Time spent in each request stage',
+            '# TYPE agent_stage_duration_seconds histogram'
+        ]
+        with self._lock:
+            histograms = sorted((key, list(h.buckets), h.sum, h.count) for key, h in self._histograms.items())
+        for (stage, status), buckets, total, count in histograms:
+            labels = f'stage="{_label_value(stage)}",status="{status}"'
+            cumulative = 0
+            for bound, bucket_count in zip(TELEMETRY_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f'agent_stage_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'agent_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'agent_stage_duration_seconds_sum{{{labels}}} {total}')
+            lines.append(f'agent_stage_duration_seconds_count{{{labels}}} {count}')
+
+        for metric, (kind, samples) in sorted(self._stats_metrics().items()):
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.extend(f'{metric}{labels} {value}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+telemetry = Telemetry()
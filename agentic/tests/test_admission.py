@@ -0,0 +1,118 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+from admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    # Only the buckets' clock - the event loop keeps the real one
+    monkeypatch.setattr(admission, 'time', SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter))
+    return now
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    bucket = TokenBucket(rate=60, burst=2)  # One token per second
+    bucket.take(2)
+    assert bucket.wait_time(1) == pytest.approx(1)
+
+    clock[0] += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock[0] += 10
+    assert bucket.wait_time(2) == 0
+    assert bucket.tokens == 2
+
+
+def test_bucket_caps_requests_larger_than_burst(clock):
+    bucket = TokenBucket(rate=60, burst=2)
+    # A request over burst needs (and takes) a full bucket rather than never fitting
+    assert bucket.wait_time(5) == 0
+    bucket.take(5)
+    assert bucket.tokens == 0
+
+
+def test_bucket_refund_never_exceeds_burst(clock):
+    bucket = TokenBucket(rate=60, burst=2)
+    bucket.take(1)
+    bucket.refund(5)
+    assert bucket.tokens == 2
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(admission, 'ADMISSION_SESSION_RATE', 60)
+    monkeypatch.setattr(admission, 'ADMISSION_SESSION_BURST', 2)
+    monkeypatch.setattr(admission, 'ADMISSION_WALLET_SPEND_RATE', 60)
+    monkeypatch.setattr(admission, 'ADMISSION_WALLET_SPEND_BURST', 1)
+
+
+async def generate(controller, session_id='s1', images=1, cost=0.04):
+    async with controller.generation(session_id, 'wallet', images, cost):
+        pass
+
+
+def test_rate_limited_session_is_rejected_without_draining_the_wallet(limits, clock):
+    controller = AdmissionController()
+    asyncio.run(generate(controller, images=2))
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(generate(controller, images=1))
+    assert rejected.value.retry_after == 1
+    assert controller.rejected['rate_limited'] == 1
+    assert controller._wallet_buckets['wallet'].tokens == pytest.approx(0.96)
+
+
+def test_spend_limited_wallet_is_rejected_without_draining_the_session(limits, clock):
+    controller = AdmissionController()
+    asyncio.run(generate(controller, cost=2.0))  # Takes the full wallet bucket
+
+    with pytest.raises(AdmissionRejected):
+        asyncio.run(generate(controller, cost=0.5))
+    assert controller.rejected['spend_limited'] == 1
+    assert controller._session_buckets['s1'].tokens == 1
+
+
+def test_queue_timeout_refunds_both_buckets(limits):
+    controller = AdmissionController(max_generations=1, queue_timeout=0.01)
+
+    async def main():
+        holding = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.generation('s0', 'wallet', 1, 0.1):
+                holding.set()
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await holding.wait()
+        try:
+            with pytest.raises(AdmissionRejected):
+                await generate(controller, 's1', images=2, cost=0.5)
+        finally:
+            release.set()
+            await holder
+
+    asyncio.run(main())
+    assert controller.rejected['timeout'] == 1
+    assert controller._session_buckets['s1'].tokens == 2
+    assert controller._wallet_buckets['wallet'].tokens == pytest.approx(0.9, abs=0.05)
+    assert controller.waiting == 0
+
+
+def test_full_queue_is_rejected_before_taking_tokens(limits, clock):
+    controller = AdmissionController(max_generations=1, max_queue=0)
+
+    async def main():
+        async with controller.generation('s0', 'wallet', 1, 0.1):
+            with pytest.raises(AdmissionRejected):
+                await generate(controller, 's1')
+
+    asyncio.run(main())
+    assert controller.rejected['queue_full'] == 1
+    assert 's1' not in controller._session_buckets
@@ -0,0 +1,39 @@
+from analysis_cache import AnalysisCache, parse_analysis_types, split_sections
+
+
+def test_parse_analysis_types_normalizes_and_deduplicates():
+    assert parse_analysis_types('Monetization,  market   fit , monetization,') == ['monetization', 'market fit']
+
+
+def test_parse_analysis_types_defaults_to_monetization():
+    assert parse_analysis_types(' , ') == ['monetization']
+
+
+def test_split_sections_by_header():
+    text = ("Intro line\n"
+            "### Monetization\nSell prints.\n\n"
+            "###  Market Fit \nWall art buyers.\n"
+            "### Unrequested\nIgnored.\n")
+    assert split_sections(text, ['monetization', 'market fit']) == {
+        'monetization': 'Sell prints.',
+        'market fit': 'Wall art buyers.'
+    }
+
+
+def test_split_sections_leaves_out_missing_types():
+    assert split_sections("### Monetization\nSell prints.", ['monetization', 'licensing']) == {
+        'monetization': 'Sell prints.'
+    }
+    assert split_sections("No headers at all", ['monetization']) == {}
+
+
+def test_cache_evicts_least_recently_used():
+    cache = AnalysisCache(max_entries=2)
+    cache.put('h1', 'monetization', 'a')
+    cache.put('h2', 'monetization', 'b')
+    assert cache.get('h1', 'monetization') == 'a'
+    cache.put('h3', 'monetization', 'c')
+
+    assert cache.get('h2', 'monetization') is None
+    assert cache.get('h1', 'monetization') == 'a'
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 1, 1)
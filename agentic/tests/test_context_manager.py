@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+from context_manager import SUMMARY_PREFIX, BudgetConversationManager, estimate_tokens, is_turn_start
+
+
+def prompt(text):
+    return {'role': 'user', 'content': [{'text': text}]}
+
+
+def tool_use(name):
+    return {'role': 'assistant', 'content': [{'toolUse': {'toolUseId': name, 'name': name, 'input': {}}}]}
+
+
+def tool_result(name, text):
+    return {'role': 'user', 'content': [{'toolResult': {'toolUseId': name, 'content': [{'text': text}]}}]}
+
+
+def reply(text):
+    return {'role': 'assistant', 'content': [{'text': text}]}
+
+
+def turn(index, result_chars=400):
+    return [
+        prompt(f"Generate image {index}"),
+        tool_use(f"t{index}"),
+        tool_result(f"t{index}", f"IMAGE_ID: img-{index}\nhttps://sepolia.basescan.org/tx/0x{index}\n" + 'x' * result_chars),
+        reply(f"Here is image {index}")
+    ]
+
+
+def agent_with(messages):
+    return SimpleNamespace(messages=messages, state=SimpleNamespace(session_id='s1'))
+
+
+def test_tool_results_are_never_turn_starts():
+    assert is_turn_start(prompt('hi'))
+    assert not is_turn_start(tool_result('t1', 'ok'))
+    assert not is_turn_start(reply('hi'))
+
+
+def test_old_tool_results_are_stripped_recent_ones_kept():
+    messages = turn(1) + turn(2) + turn(3)
+    agent = agent_with(messages)
+    BudgetConversationManager(token_budget=10_000, keep_recent_turns=2).apply_management(agent)
+
+    assert len(agent.messages) == 12
+    old = agent.messages[2]['content'][0]['toolResult']['content'][0]['text']
+    assert 'https://' not in old and old.endswith('[...]')
+    recent = agent.messages[6]['content'][0]['toolResult']['content'][0]['text']
+    assert 'https://sepolia.basescan.org/tx/0x2' in recent
+
+
+def test_history_is_cut_at_prompt_boundaries_with_a_summary():
+    messages = turn(1) + turn(2) + turn(3)
+    agent = agent_with(messages)
+    manager = BudgetConversationManager(token_budget=150, keep_recent_turns=1)
+    manager.apply_management(agent)
+
+    # Every cut lands on a user prompt, so no tool result is separated from its tool use
+    assert is_turn_start(agent.messages[0])
+    assert len(agent.messages) % 4 == 0
+    first = agent.messages[0]['content'][0]['text']
+    assert first.startswith(SUMMARY_PREFIX)
+    assert 'User asked: Generate image 1' in first and 'IMAGE_ID: img-1' in first
+    assert manager.removed_message_count == 12 - len(agent.messages)
+
+
+def test_current_turn_is_never_cut():
+    messages = turn(1, result_chars=4000)
+    agent = agent_with(messages)
+    BudgetConversationManager(token_budget=10, keep_recent_turns=0).apply_management(agent)
+
+    assert len(agent.messages) == 4
+    assert estimate_tokens(agent.messages) > 10
+
+
+def test_summaries_carry_forward_across_cuts():
+    manager = BudgetConversationManager(token_budget=150, keep_recent_turns=1)
+    agent = agent_with(turn(1) + turn(2))
+    manager.apply_management(agent)
+    agent.messages.extend(turn(3) + turn(4))
+    manager.apply_management(agent)
+
+    first = agent.messages[0]['content'][0]['text']
+    assert first.count(SUMMARY_PREFIX) == 1
+    assert 'Generate image 1' in first
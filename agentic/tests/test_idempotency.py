@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyInProgress, fingerprint
+
+KEY = ('s1', 'order-1')
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({'prompt': 'a cat', 'n': 1}) == fingerprint({'n': 1, 'prompt': 'a cat'})
+    assert fingerprint({'prompt': 'a cat'}) != fingerprint({'prompt': 'a dog'})
+
+
+def test_concurrent_requests_share_one_run():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'message': 'done'}
+
+    async def main():
+        return await asyncio.gather(*(cache.run(KEY, 'fp', factory) for _ in range(3)))
+
+    assert asyncio.run(main()) == [{'message': 'done'}] * 3
+    assert len(calls) == 1
+    assert (cache.executed, cache.coalesced) == (1, 2)
+
+
+def test_completed_result_is_replayed():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        return {'message': 'done'}
+
+    asyncio.run(cache.run(KEY, 'fp', factory))
+    assert asyncio.run(cache.run(KEY, 'fp', factory)) == {'message': 'done'}
+    assert len(calls) == 1
+    assert cache.replayed == 1
+
+
+def test_reused_key_with_a_different_request_conflicts():
+    cache = IdempotencyCache()
+
+    async def factory():
+        return {}
+
+    asyncio.run(cache.run(KEY, 'fp', factory))
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(cache.run(KEY, 'other', factory))
+
+
+def test_in_flight_key_with_a_different_request_conflicts():
+    cache = IdempotencyCache()
+
+    async def main():
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(0.01)
+            return {}
+
+        first = asyncio.create_task(cache.run(KEY, 'fp', slow))
+        await started.wait()
+        with pytest.raises(IdempotencyConflict):
+            await cache.run(KEY, 'other', slow)
+        await first
+
+    asyncio.run(main())
+
+
+def test_failures_are_not_stored():
+    cache = IdempotencyCache()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('gateway timeout')
+        return {'message': 'done'}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.run(KEY, 'fp', flaky))
+    assert asyncio.run(cache.run(KEY, 'fp', flaky)) == {'message': 'done'}
+    assert len(attempts) == 2
+
+
+def test_expired_result_runs_again():
+    cache = IdempotencyCache(ttl=0)
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        return {}
+
+    asyncio.run(cache.run(KEY, 'fp', factory))
+    asyncio.run(cache.run(KEY, 'fp', factory))
+    assert len(calls) == 2
+
+
+def test_streamed_run_rejects_repeats_then_replays():
+    cache = IdempotencyCache()
+    assert cache.begin(KEY, 'fp') is None
+
+    with pytest.raises(IdempotencyInProgress):
+        cache.begin(KEY, 'fp')
+    with pytest.raises(IdempotencyInProgress):
+        asyncio.run(cache.run(KEY, 'fp', None))
+    with pytest.raises(IdempotencyConflict):
+        cache.begin(KEY, 'other')
+
+    cache.finish(KEY, 'fp', {'message': 'done'})
+    assert cache.begin(KEY, 'fp') == {'message': 'done'}
+    assert cache.rejected == 2
+
+
+def test_failed_streamed_run_releases_its_key():
+    cache = IdempotencyCache()
+    cache.begin(KEY, 'fp')
+    cache.finish(KEY, 'fp')
+    assert cache.begin(KEY, 'fp') is None
@@ -0,0 +1,128 @@
+import pytest
+
+import session_store
+from session_store import RedisSessionStore, SessionStorage, merge_session
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def store():
+    return RedisSessionStore(fakeredis.FakeRedis())
+
+
+def test_round_trip(store):
+    storage = store.get('s1')
+    storage.authorize_check['r1'] = {'prompt': 'a cat', 'cost': 0.04, 'auth': False}
+    storage.current_request_id = 'r1'
+    storage.save()
+
+    loaded = store.get('s1')
+    assert loaded.authorize_check == {'r1': {'prompt': 'a cat', 'cost': 0.04, 'auth': False}}
+    assert loaded.current_request_id == 'r1'
+
+
+def test_concurrent_saves_keep_both_updates(store):
+    # Two requests load the session, then save after their (long) x402 calls
+    first, second = store.get('s1'), store.get('s1')
+    first.authorize_check['r1'] = {'prompt': 'a cat', 'image_ids': ['i1']}
+    first.image_storage['i1'] = 'image/png'
+    first.save()
+    second.authorize_check['r2'] = {'prompt': 'a dog', 'image_ids': ['i2']}
+    second.image_storage['i2'] = 'image/png'
+    second.current_request_id = 'r2'
+    second.save()
+
+    loaded = store.get('s1')
+    assert set(loaded.authorize_check) == {'r1', 'r2'}
+    assert set(loaded.image_storage) == {'i1', 'i2'}
+    assert loaded.current_request_id == 'r2'
+    # The saving object continues from the merged state
+    assert set(second.authorize_check) == {'r1', 'r2'}
+
+
+def test_concurrent_delete_and_update(store):
+    storage = store.get('s1')
+    storage.authorize_check['r1'] = {'auth': False}
+    storage.authorize_check['r2'] = {'auth': False}
+    storage.save()
+
+    first, second = store.get('s1'), store.get('s1')
+    del first.authorize_check['r1']
+    first.save()
+    second.authorize_check['r2']['auth'] = True
+    second.save()
+
+    assert store.get('s1').authorize_check == {'r2': {'auth': True}}
+
+
+def test_unchanged_fields_keep_the_stored_value(store):
+    first, second = store.get('s1'), store.get('s1')
+    first.current_request_id = 'r1'
+    first.current_cost = 0.04
+    first.save()
+    second.auth_verified.add('r0')
+    second.save()
+
+    loaded = store.get('s1')
+    assert (loaded.current_request_id, loaded.current_cost) == ('r1', 0.04)
+    assert loaded.auth_verified == {'r0'}
+
+
+def test_save_retries_after_a_concurrent_write(store, monkeypatch):
+    storage = store.get('s1')
+    storage.authorize_check['r1'] = {'auth': False}
+    real_pipeline = store.client.pipeline
+    interfered = []
+
+    def pipeline():
+        pipe = real_pipeline()
+        if not interfered:
+            # Another replica writes between our WATCH and EXEC
+            real_watch = pipe.watch
+
+            def watch(*keys):
+                real_watch(*keys)
+                store.client.set('session:s1', '{"authorize_check": {"r9": {"auth": true}}}')
+                interfered.append(True)
+            pipe.watch = watch
+        return pipe
+
+    monkeypatch.setattr(store.client, 'pipeline', pipeline)
+    storage.save()
+
+    assert store.conflicts == 1
+    assert set(store.get('s1').authorize_check) == {'r1', 'r9'}
+
+
+def test_per_session_caps(monkeypatch):
+    monkeypatch.setattr(session_store, 'SESSION_MAX_REQUESTS', 3)
+    monkeypatch.setattr(session_store, 'SESSION_MAX_IMAGES', 2)
+    storage = SessionStorage('s1')
+    for index in range(5):
+        storage.authorize_check[f"r{index}"] = {}
+        storage.image_storage[f"i{index}"] = 'image/png'
+
+    assert list(storage.authorize_check) == ['r2', 'r3', 'r4']
+    assert list(storage.image_storage) == ['i3', 'i4']
+
+
+def test_caps_apply_to_redis_sessions(store, monkeypatch):
+    monkeypatch.setattr(session_store, 'SESSION_MAX_REQUESTS', 2)
+    first, second = store.get('s1'), store.get('s1')
+    first.authorize_check['r1'] = {}
+    first.authorize_check['r2'] = {}
+    first.save()
+    second.authorize_check['r3'] = {}
+    second.save()
+
+    assert list(store.get('s1').authorize_check) == ['r2', 'r3']
+
+
+def test_merge_session_changed_entry_becomes_recent():
+    base = {'authorize_check': {'r1': {'auth': False}, 'r2': {}}}
+    ours = {'authorize_check': {'r1': {'auth': True}, 'r2': {}}, 'image_storage': {},
+            'auth_verified': [], 'current_request_id': None, 'current_cost': None}
+    merged = merge_session(base, ours, base)
+
+    assert list(merged['authorize_check']) == ['r2', 'r1']
@@ -0,0 +1,125 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import settlement_queue
+from settlement_queue import SettlementQueue
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    completed = []
+    queue = SettlementQueue(None, lambda *args: completed.append(args), path=str(tmp_path / 'settlements.db'))
+    queue.completed = completed
+    monkeypatch.setattr(queue, 'start', lambda: None)  # No worker - outcomes are applied directly
+    monkeypatch.setattr(settlement_queue.random, 'uniform', lambda low, high: 1.0)
+    return queue
+
+
+def pending(queue, *request_ids):
+    for request_id in request_ids:
+        queue.enqueue(request_id, f"nonce-{request_id}", 'https://gateway', 's1')
+    return queue._execute(
+        'SELECT request_id, nonce, gateway_url, session_id, attempts, created_at FROM settlements ORDER BY request_id'
+    )
+
+
+def test_batch_results_complete_each_row(queue):
+    rows = pending(queue, 'r1', 'r2')
+    queue._record(rows, httpx.Response(200, json={'results': {
+        'nonce-r1': {'status': 'settled', 'transaction_hash': '0xabc'},
+        'nonce-r2': {'error': 'Nonce already settled'}
+    }}))
+
+    assert queue.status('r1')['status'] == 'settled'
+    assert queue.status('r1')['transaction_hash'] == '0xabc'
+    assert queue.status('r2')['status'] == 'failed'
+    assert queue.status('r2')['error'] == 'Nonce already settled'
+    assert [call[2] for call in queue.completed] == ['settled', 'failed']
+
+
+def test_single_nonce_response_applies_to_its_row(queue):
+    rows = pending(queue, 'r1')
+    queue._record(rows, httpx.Response(200, json={'status': 'settled', 'transaction_hash': '0xabc'}))
+    assert queue.status('r1')['status'] == 'settled'
+
+
+@pytest.mark.parametrize('response', [
+    httpx.Response(502, text='Bad gateway'),
+    httpx.Response(429, headers={'Retry-After': '20'}),
+    httpx.Response(408),
+    httpx.ConnectError('connection refused'),
+])
+def test_transient_failures_are_retried(queue, response):
+    rows = pending(queue, 'r1')
+    queue._record(rows, response)
+
+    status = queue.status('r1')
+    assert status['status'] == 'pending'
+    assert status['attempts'] == 1
+    assert queue.completed == []
+
+
+def test_retry_after_delays_the_retry(queue):
+    rows = pending(queue, 'r1')
+    queue._record(rows, httpx.Response(429, headers={'Retry-After': '20'}))
+    delay = queue._execute('SELECT next_attempt_at - updated_at AS delay FROM settlements')[0]['delay']
+    assert delay == pytest.approx(20, abs=1)
+
+
+def test_client_errors_are_final(queue):
+    rows = pending(queue, 'r1')
+    queue._record(rows, httpx.Response(404, json={'error': 'Unknown nonce'}))
+    assert queue.status('r1')['status'] == 'failed'
+    assert queue.status('r1')['error'] == 'Unknown nonce'
+
+
+def test_retries_stop_after_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(settlement_queue, 'SETTLEMENT_MAX_ATTEMPTS', 2)
+    pending(queue, 'r1')
+    for _ in range(2):
+        rows = queue._execute(
+            'SELECT request_id, nonce, gateway_url, session_id, attempts, created_at FROM settlements'
+        )
+        queue._record(rows, httpx.Response(503))
+
+    status = queue.status('r1')
+    assert (status['status'], status['attempts']) == ('failed', 2)
+    assert queue.completed[0][2] == 'failed'
+
+
+def gateway(queue, handler):
+    bodies = []
+
+    def record(request):
+        bodies.append(json.loads(request.content))
+        return handler(bodies[-1])
+
+    queue.http_client_for = lambda url: httpx.AsyncClient(base_url=url, transport=httpx.MockTransport(record))
+    return bodies
+
+
+def test_gateway_without_batching_is_settled_one_nonce_at_a_time(queue):
+    def legacy(body):
+        if 'nonce' not in body:
+            return httpx.Response(400, json={'error': 'Missing nonce'})
+        return httpx.Response(200, json={'status': 'settled', 'transaction_hash': '0x1'})
+
+    bodies = gateway(queue, legacy)
+    asyncio.run(queue._settle('https://gateway', pending(queue, 'r1', 'r2')))
+
+    assert bodies[0] == {'nonces': ['nonce-r1', 'nonce-r2']}
+    assert sorted(body['nonce'] for body in bodies[1:]) == ['nonce-r1', 'nonce-r2']
+    assert {queue.status(r)['status'] for r in ('r1', 'r2')} == {'settled'}
+    assert 'https://gateway' in queue._single_nonce_gateways
+
+
+def test_other_bad_requests_do_not_fall_back(queue):
+    bodies = gateway(queue, lambda body: httpx.Response(400, json={'error': 'Invalid nonce format'}))
+    asyncio.run(queue._settle('https://gateway', pending(queue, 'r1', 'r2')))
+
+    assert len(bodies) == 1
+    assert {queue.status(r)['status'] for r in ('r1', 'r2')} == {'failed'}
+    assert not queue._single_nonce_gateways
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+import tx_pipeline
+from tx_pipeline import NonceManager, TransactionSender
+
+ADDRESS = '0x0000000000000000000000000000000000000001'
+
+
+class FakeEth:
+    chain_id = 84532
+    max_priority_fee = 1
+    gas_price = 1
+
+    def __init__(self):
+        self.counts = {'pending': 7, 'latest': 7}
+        self.count_calls = 0
+        self.sent = []
+        self.errors = []  # Raised by the next send_raw_transaction calls, in order
+        self.known = set()
+
+    def get_block(self, block):
+        return {'number': 1, 'baseFeePerGas': 10}
+
+    def get_transaction_count(self, address, tag):
+        self.count_calls += 1
+        return self.counts[tag]
+
+    def send_raw_transaction(self, raw_tx):
+        self.sent.append(raw_tx)
+        if self.errors:
+            raise ValueError({'message': self.errors.pop(0)})
+        return Web3.keccak(raw_tx)
+
+    def get_transaction(self, tx_hash):
+        if tx_hash not in self.known:
+            raise TransactionNotFound(f"{tx_hash} not found")
+        return {'hash': tx_hash}
+
+
+class FakeWallet:
+    def get_address(self):
+        return ADDRESS
+
+    def sign_transaction(self, tx):
+        return {'rawTransaction': HexBytes(bytes([tx['nonce']]) + b'signed')}
+
+
+@pytest.fixture
+def eth(monkeypatch):
+    eth = FakeEth()
+    w3 = SimpleNamespace(eth=eth)
+    monkeypatch.setattr(tx_pipeline, 'get_web3', lambda: w3)
+    return eth
+
+
+def test_nonces_advance_locally_until_resync(eth):
+    nonces = NonceManager(ADDRESS)
+    assert nonces.peek() == 7
+    nonces.commit(7, '0x7')
+    nonces.commit(8, '0x8')
+    assert nonces.peek() == 9
+    assert eth.count_calls == 1
+
+    eth.counts['pending'] = 12
+    nonces.resync()
+    assert nonces.peek() == 12
+    assert eth.count_calls == 2
+
+
+def test_prune_drops_confirmed_transactions(eth):
+    nonces = NonceManager(ADDRESS)
+    for nonce in (7, 8, 9):
+        nonces.commit(nonce, f"0x{nonce}")
+    eth.counts['latest'] = 9
+    nonces.prune()
+    assert [entry['nonce'] for entry in nonces.pending()] == [9]
+
+
+def broadcast(eth):
+    sender = TransactionSender(FakeWallet())
+    return sender, sender._broadcast({'to': ADDRESS, 'value': 1, 'gas': 21000})
+
+
+def test_stale_nonce_is_resynced_and_resigned(eth):
+    eth.errors = ['nonce too low']
+    eth.counts['pending'] = 8
+    sender, tx_hash = broadcast(eth)
+
+    assert len(eth.sent) == 2
+    assert tx_hash == Web3.keccak(eth.sent[1]).hex()
+    assert [entry['nonce'] for entry in sender.nonces.pending()] == [8]
+
+
+def test_nonce_too_low_for_an_already_broadcast_transaction_is_not_resigned(eth):
+    # A send that timed out on one endpoint was mined; the failover endpoint reports nonce too low
+    eth.errors = ['nonce too low']
+    eth.known.add(Web3.keccak(HexBytes(bytes([7]) + b'signed')))
+    sender, tx_hash = broadcast(eth)
+
+    assert len(eth.sent) == 1
+    assert tx_hash == Web3.keccak(eth.sent[0]).hex()
+    assert [entry['nonce'] for entry in sender.nonces.pending()] == [7]
+
+
+def test_already_known_transaction_is_not_resent(eth):
+    eth.errors = ['already known']
+    sender, tx_hash = broadcast(eth)
+    assert len(eth.sent) == 1
+    assert tx_hash == Web3.keccak(eth.sent[0]).hex()
+
+
+def test_replacement_error_is_raised_and_resyncs(eth):
+    eth.errors = ['replacement transaction underpriced']
+    sender = TransactionSender(FakeWallet())
+    with pytest.raises(ValueError):
+        sender._broadcast({'to': ADDRESS, 'value': 1, 'gas': 21000})
+    assert len(eth.sent) == 1
+    assert sender.nonces._next is None
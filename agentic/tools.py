@@ -1,45 +1,39 @@
-import boto3
+import asyncio
 import base64
 import json
 import uuid
+import logging
+from typing import List
 from strands import tool
+from async_runtime import run_shared, get_loop
+from session_store import SessionStorage, BoundedDict, BoundedSet, get_session_store
+from image_store import get_image_store
+from generation_cache import get_generation_cache, make_key
+from analysis_cache import get_analysis_cache, parse_analysis_types, split_sections
 from cost_estimator import estimate_cost
-from wallet import get_wallet, get_balance, get_x402_httpx_client
+from wallet import get_wallet, get_x402_gateway_client, X402_PRESIGN
+from admission import get_admission_controller, AdmissionRejected
+from balance_cache import get_balance_cache
+from settlement_queue import get_settlement_queue
+from bedrock_client import get_bedrock_runtime, invoke_model
 import os
-import requests
 from botocore.auth import SigV4Auth
 from botocore.awsrequest import AWSRequest
 from dotenv import load_dotenv
 
 load_dotenv()
 
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.getenv('AWS_REGION', 'us-east-1'))
+logger = logging.getLogger(__name__)
 
-# Session-level storage - will be managed per session
-# authorize_check: User consent layer before x402 automatic payment
-# Enables natural language approval ("yes, proceed") with optional AgentKit spending allowances
-class SessionStorage:
-    def __init__(self):
-        self.image_storage = {}
-        self.authorize_check = {}  # User consent tracking - auth:True means user approved spend
-        self.auth_verified = set()
-        self.current_request_id = None  # Track current request_id
-        self.current_cost = None        # Track current cost
-
-# Global fallback for backward compatibility
-IMAGE_STORAGE = {}
-AUTHORIZE_CHECK = {}  # Consent gate: x402 handles payment automatically after user authorizes
-AUTH_VERIFIED = set()
+# Global fallback for backward compatibility (bounded so long-running containers don't leak)
+GLOBAL_MIRROR_MAX = int(os.getenv('GLOBAL_MIRROR_MAX', '256'))
+IMAGE_STORAGE = BoundedDict(GLOBAL_MIRROR_MAX)
+AUTHORIZE_CHECK = BoundedDict(GLOBAL_MIRROR_MAX)  # Consent gate: x402 handles payment automatically after user authorizes
+AUTH_VERIFIED = BoundedSet(GLOBAL_MIRROR_MAX)
 
 def get_session_storage(session_id="default"):
     """Get or create session-specific storage"""
-    if not hasattr(get_session_storage, '_sessions'):
-        get_session_storage._sessions = {}
-    
-    if session_id not in get_session_storage._sessions:
-        get_session_storage._sessions[session_id] = SessionStorage()
-    
-    return get_session_storage._sessions[session_id]
+    return get_session_store().get(session_id)
 
 # Seller wallet address
 SELLER_WALLET = os.getenv('SELLER_WALLET')
@@ -47,8 +41,109 @@ SELLER_WALLET = os.getenv('SELLER_WALLET')
 # Force load environment before wallet initialization
 load_dotenv(override=True)
 
-# Agent wallet
-AGENT_WALLET = get_wallet()
+def get_agent_wallet():
+    """Agent wallet (AgentKit/CDP provider is set up on first use)"""
+    return get_wallet()
+
+def __getattr__(name):
+    # Backward compatibility for module attributes that are now created lazily
+    if name == 'AGENT_WALLET':
+        return get_agent_wallet()
+    if name == 'bedrock_runtime':
+        return get_bedrock_runtime()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Batch generation limits (Nova Canvas returns at most 5 images per call)
+NOVA_CANVAS_MAX_IMAGES_PER_CALL = 5
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '20'))
+BATCH_MAX_PARALLEL = int(os.getenv('BATCH_MAX_PARALLEL', '4'))
+# Explicit base seed (Nova Canvas default is 12) so cached results are reproducible
+NOVA_CANVAS_SEED = int(os.getenv('NOVA_CANVAS_SEED', '12'))
+NOVA_CANVAS_MAX_SEED = 858993459
+
+def nova_canvas_seed(offset: int = 0) -> int:
+    """Seed for one Nova Canvas call: the base seed plus the call's offset within a request"""
+    return (NOVA_CANVAS_SEED + offset) % (NOVA_CANVAS_MAX_SEED + 1)
+
+def nova_canvas_config(number_of_images: int = 1, seed: int = NOVA_CANVAS_SEED) -> dict:
+    return {
+        "numberOfImages": number_of_images,
+        "quality": "standard",
+        "height": 1024,
+        "width": 1024,
+        "seed": seed
+    }
+
+def invoke_nova_canvas(prompt: str, number_of_images: int = 1, seed: int = NOVA_CANVAS_SEED) -> list:
+    """Generate images with Nova Canvas and return them as base64 strings"""
+    request_body = {
+        "taskType": "TEXT_IMAGE",
+        "textToImageParams": {
+            "text": prompt
+        },
+        "imageGenerationConfig": nova_canvas_config(number_of_images, seed)
+    }
+    
+    bedrock_response = invoke_model(
+        modelId="amazon.nova-canvas-v1:0",
+        body=json.dumps(request_body)
+    )
+    
+    response_body = json.loads(bedrock_response['body'].read())
+    return response_body['images']
+
+async def generate_images(prompts: list, images_per_prompt: int = 1) -> list:
+    """Generate and store images for every prompt with bounded parallel Bedrock calls.
+    
+    Returns content-addressed image IDs in prompt order. Each call gets its own seed,
+    so the chunks of a large request and repeats of a prompt in one batch produce
+    different images. With GENERATION_CACHE enabled, repeated prompt + config (seed
+    included) combinations are served from the image store instead.
+    """
+    image_store = get_image_store()
+    cache = get_generation_cache(image_store)
+    jobs = []
+    for prompt in prompts:
+        remaining = images_per_prompt
+        while remaining > 0:
+            number_of_images = min(remaining, NOVA_CANVAS_MAX_IMAGES_PER_CALL)
+            # Offset by call position: identical calls would return identical images
+            jobs.append((prompt, number_of_images, nova_canvas_seed(len(jobs))))
+            remaining -= number_of_images
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_PARALLEL)
+    admission = get_admission_controller()
+    
+    async def run_job(prompt, number_of_images, seed):
+        key = make_key(prompt, nova_canvas_config(number_of_images, seed)) if cache else None
+        if cache:
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached:
+                return cached
+        async with semaphore, admission.bedrock_call():
+            # boto3 is blocking - run on the loop's I/O threads
+            images_base64 = await asyncio.to_thread(invoke_nova_canvas, prompt, number_of_images, seed)
+        # Store raw images out of band under content-addressed IDs
+        image_ids = []
+        for image_base64 in images_base64:
+            image_ids.append(await asyncio.to_thread(image_store.put, base64.b64decode(image_base64)))
+        if cache:
+            cache.put(key, image_ids)
+        return image_ids
+    
+    results = await asyncio.gather(*(run_job(*job) for job in jobs))
+    return [image_id for image_ids in results for image_id in image_ids]
+
+def build_gateway_request(request_id: str, entry: dict) -> dict:
+    """Body for the gateway /generate_image call (price in USDC wei for x402)"""
+    cost_wei = int(round(entry['cost'] * 1e6))
+    return {'request_id': request_id, 'prompt': entry['prompt'], 'price': str(cost_wei)}
+
+def presign_payment(request_id: str, entry: dict) -> None:
+    """Start signing the x402 payment for an authorized request off the critical path"""
+    gateway_url = os.getenv('GATEWAY_URL').rstrip('/')
+    client = get_x402_gateway_client(get_agent_wallet(), gateway_url)
+    get_loop().call_soon_threadsafe(client.presign, request_id, "/generate_image", build_gateway_request(request_id, entry))
 
 @tool
 def estimate_image_cost(prompt: str, session_id: str = "default") -> str:
@@ -81,10 +176,55 @@ def estimate_image_cost(prompt: str, session_id: str = "default") -> str:
     # Store current request_id and cost in session
     storage.current_request_id = request_id
     storage.current_cost = cost_usd
+    storage.save()
     # Also update global for backward compatibility
     AUTHORIZE_CHECK[request_id] = storage.authorize_check[request_id]
     return f"REQUEST_ID:{request_id}|COST:{cost_usd:.4f}|USD:{cost_usd:.4f}"
 
+@tool
+def estimate_batch_image_cost(prompts: List[str], images_per_prompt: int = 1, session_id: str = "default") -> str:
+    """
+    Estimate the cost to generate several images with Nova Canvas, paid with a single x402 payment.
+    Use when the user orders multiple images (N prompts and/or N images per prompt).
+    
+    Args:
+        prompts: Descriptions of the images to generate
+        images_per_prompt: Number of images to generate for each prompt
+        
+    Returns:
+        Total cost estimate in USDC with request_id
+    """
+    storage = get_session_storage(session_id)
+    
+    # Check if there's already an active unauthorized request
+    if storage.current_request_id and storage.current_request_id in storage.authorize_check:
+        existing = storage.authorize_check[storage.current_request_id]
+        if not existing['auth']:
+            return f"Active request exists. Cost: {existing['cost']:.4f} USDC. Use make_payment() to proceed."
+    
+    if not prompts or images_per_prompt < 1:
+        return "Error: Provide at least one prompt and one image per prompt."
+    
+    count = len(prompts) * images_per_prompt
+    if count > BATCH_MAX_IMAGES:
+        return f"Error: Batch too large. Maximum {BATCH_MAX_IMAGES} images per request, requested {count}."
+    
+    estimate = estimate_cost(" ".join(prompts), 'nova-canvas', resolution='1024x1024', quality='standard', count=count)
+    request_id = str(uuid.uuid4())
+    cost_usd = estimate['totalCostUSD']
+    storage.authorize_check[request_id] = {
+        'prompt': " | ".join(prompts),
+        'prompts': list(prompts),
+        'images_per_prompt': images_per_prompt,
+        'cost': cost_usd,
+        'auth': False
+    }
+    storage.current_request_id = request_id
+    storage.current_cost = cost_usd
+    storage.save()
+    AUTHORIZE_CHECK[request_id] = storage.authorize_check[request_id]
+    return f"REQUEST_ID:{request_id}|COST:{cost_usd:.4f}|USD:{cost_usd:.4f}|IMAGES:{count}"
+
 @tool
 def check_wallet_balance(session_id: str = "default") -> str:
     """
@@ -93,10 +233,15 @@ def check_wallet_balance(session_id: str = "default") -> str:
     Returns:
         Wallet balance information
     """
-    balance_info = get_balance(AGENT_WALLET)
+    balance_cache = get_balance_cache(get_agent_wallet())
+    balance_info = balance_cache.get()
     if 'error' in balance_info:
         return f"Error: {balance_info['error']}"
-    return f"Address: {balance_info['address']}\nNetwork: {balance_info['network']}\nETH: {balance_info['eth_balance']:.6f}\nUSDC: {balance_info['usdc_balance']:.6f}"
+    result = f"Address: {balance_info['address']}\nNetwork: {balance_info['network']}\nETH: {balance_info['eth_balance']:.6f}\nUSDC: {balance_info['usdc_balance']:.6f}"
+    reserved = balance_cache.reserved_usdc()
+    if reserved > 0:
+        result += f"\nReserved (authorized, not yet settled): {reserved:.6f} USDC"
+    return result
 
 @tool
 def make_payment(request_id: str = None, session_id: str = "default") -> str:
@@ -123,20 +268,29 @@ def make_payment(request_id: str = None, session_id: str = "default") -> str:
     
     amount_usdc = storage.authorize_check[request_id]['cost']
     
-    balance_info = get_balance(AGENT_WALLET)
-    if balance_info['usdc_balance'] < amount_usdc:
-        return f"Error: Insufficient balance. Need {amount_usdc:.6f} USDC, have {balance_info['usdc_balance']:.6f} USDC"
+    # Served from the balance cache; the check and the reservation are one atomic step
+    reserved, available_usdc = get_balance_cache(get_agent_wallet()).try_reserve(request_id, amount_usdc)
+    if not reserved:
+        return f"Error: Insufficient balance. Need {amount_usdc:.6f} USDC, have {available_usdc:.6f} USDC available"
     
     storage.authorize_check[request_id]['auth'] = True
     storage.auth_verified.add(request_id)
+    storage.save()
     # Update global for backward compatibility
     AUTHORIZE_CHECK[request_id] = storage.authorize_check[request_id]
     AUTH_VERIFIED.add(request_id)
     
+    # Optional: sign the payment now so the next generate_image attaches it immediately
+    if X402_PRESIGN:
+        try:
+            presign_payment(request_id, storage.authorize_check[request_id])
+        except Exception as e:
+            logger.warning(f"x402 pre-signing skipped for {request_id}: {str(e)}")
+    
     return f"✅ Payment authorized for {amount_usdc:.4f} USDC! Ready to generate image."
 
 @tool
-def generate_image(request_id: str = None, session_id: str = "default") -> str:
+async def generate_image(request_id: str = None, session_id: str = "default") -> str:
     """
     Generate an image using Amazon Nova Canvas with x402 automatic payment.
     
@@ -146,8 +300,33 @@ def generate_image(request_id: str = None, session_id: str = "default") -> str:
     Returns:
         Success message with image ID
     """
-    import asyncio
-    
+    # All gateway and Bedrock I/O runs on the shared long-lived loop
+    return await run_shared(_generate_image(request_id, session_id))
+
+def release_reservation(request_id: str) -> None:
+    """Funds moved (or the authorization was consumed) - drop the reservation and refetch balances"""
+    balance_cache = get_balance_cache(get_agent_wallet())
+    balance_cache.release(request_id)
+    balance_cache.invalidate()
+
+def on_settlement_complete(request_id: str, session_id: str, status: str, transaction_hash: str) -> None:
+    release_reservation(request_id)
+    if session_id is None:
+        return
+    storage = get_session_storage(session_id)
+    entry = storage.authorize_check.get(request_id)
+    if entry is not None:
+        entry['settlement'] = status
+        entry['transaction_hash'] = transaction_hash
+        AUTHORIZE_CHECK[request_id] = entry
+        storage.save()
+    logger.info(f"Payment {status} for {request_id}: {transaction_hash}")
+
+def get_settlements():
+    """Settlement queue posting to each gateway over its pooled x402 client"""
+    return get_settlement_queue(lambda url: get_x402_gateway_client(get_agent_wallet(), url).http, on_settlement_complete)
+
+async def _generate_image(request_id: str, session_id: str) -> str:
     storage = get_session_storage(session_id)
     
     # If no request_id provided, use current session request_id
@@ -163,37 +342,53 @@ def generate_image(request_id: str = None, session_id: str = "default") -> str:
     
     prompt = storage.authorize_check[request_id]['prompt']
     cost_usdc = storage.authorize_check[request_id]['cost']
+    prompts = storage.authorize_check[request_id].get('prompts', [prompt])
+    images_per_prompt = storage.authorize_check[request_id].get('images_per_prompt', 1)
     
     # Get gateway URL from environment
     gateway_url = os.getenv('GATEWAY_URL').rstrip('/')
-    print(f"Using gateway URL: {gateway_url}")
+    logger.debug(f"Using gateway URL: {gateway_url}")
     
     # Check if payment was authorized - if not, return authorization required
     if not storage.authorize_check[request_id].get('auth'):
         return f"AUTHORIZE_CHECK - Cost: {cost_usdc:.4f} USDC. Payment authorization needed before image generation."
     
-    # Use x402 httpx client - it handles 402 and payment automatically
+    # Pooled x402 client for this gateway - it handles 402 and payment automatically
+    # Wallet setup is blocking on a cold start - keep it off the shared loop
+    client = get_x402_gateway_client(await asyncio.to_thread(get_agent_wallet), gateway_url)
+    
+    # Rate limits and the generation queue are checked before anything is charged
+    images = len(prompts) * images_per_prompt
+    try:
+        async with get_admission_controller().generation(session_id, client.signer.address, images, cost_usdc):
+            return await _paid_generation(storage, request_id, session_id, gateway_url, client)
+    except AdmissionRejected as e:
+        return (f"BUSY|RETRY_AFTER:{e.retry_after}\n\n{e.reason}. Payment is still authorized and nothing was charged. "
+                f"Call generate_image again in {e.retry_after}s.")
+
+async def _paid_generation(storage, request_id: str, session_id: str, gateway_url: str, client) -> str:
+    """Pay through x402, generate the image(s) and queue settlement"""
+    cost_usdc = storage.authorize_check[request_id]['cost']
+    prompt = storage.authorize_check[request_id]['prompt']
+    prompts = storage.authorize_check[request_id].get('prompts', [prompt])
+    images_per_prompt = storage.authorize_check[request_id].get('images_per_prompt', 1)
+    
     async def make_request():
-        async with get_x402_httpx_client(AGENT_WALLET, gateway_url) as client:
-            print(f"\n=== X402 REQUEST ===")
-            print(f"Gateway: {gateway_url}/generate_image")
-            print(f"Request ID: {request_id}")
-            print(f"Cost: {cost_usdc} USDC")
-            
-            # Convert USDC to wei for x402 protocol
-            cost_wei = int(cost_usdc * 1e6)
-            response = await client.post(
-                "/generate_image",
-                json={'request_id': request_id, 'prompt': prompt, 'price': str(cost_wei)},
-                timeout=30
-            )
-            
-            print(f"Response status: {response.status_code}")
-            print(f"Response body: {response.text[:500]}")
-            return response
+        logger.info(f"x402 request {request_id}: {gateway_url}/generate_image ({cost_usdc} USDC)")
+        
+        response = await client.post(
+            "/generate_image",
+            json=build_gateway_request(request_id, storage.authorize_check[request_id]),
+            timeout=30,
+            presign_key=request_id if X402_PRESIGN else None
+        )
+        
+        logger.info(f"x402 response {request_id}: {response.status_code}")
+        logger.debug(f"x402 response body {request_id}: {response.text[:500]}")
+        return response
     
     try:
-        response = asyncio.run(make_request())
+        response = await make_request()
         
         if response.status_code != 200:
             return f"Error: Gateway returned {response.status_code}. Response: {response.text[:200]}"
@@ -203,130 +398,146 @@ def generate_image(request_id: str = None, session_id: str = "default") -> str:
         payment_nonce = response_data.get('nonce')
             
     except Exception as e:
-        import traceback
-        print(f"x402 error: {str(e)}")
-        print(traceback.format_exc())
+        logger.error(f"x402 error for {request_id}: {str(e)}", exc_info=True)
         return f"Error: {str(e)}"
     
-    # Generate image with Bedrock
-    request_body = {
-        "taskType": "TEXT_IMAGE",
-        "textToImageParams": {
-            "text": prompt
-        },
-        "imageGenerationConfig": {
-            "numberOfImages": 1,
-            "quality": "standard",
-            "height": 1024,
-            "width": 1024
-        }
-    }
-    
-    bedrock_response = bedrock_runtime.invoke_model(
-        modelId="amazon.nova-canvas-v1:0",
-        body=json.dumps(request_body)
-    )
-    
-    response_body = json.loads(bedrock_response['body'].read())
-    image_base64 = response_body['images'][0]
-    
-    # x402 spec: settle after content delivery (fair billing - only charge on success)
-    transaction_hash = None
-    if payment_nonce:
-        try:
-            settle_response = requests.post(
-                f"{gateway_url}/settle",
-                json={'nonce': payment_nonce},
-                timeout=30
-            )
-            if settle_response.status_code == 200:
-                settle_data = settle_response.json()
-                transaction_hash = settle_data.get('transaction_hash')
-                print(f"Payment settled: {transaction_hash}")
-            else:
-                print(f"Settlement returned {settle_response.status_code} (testnet expected)")
-        except Exception as e:
-            print(f"Settlement error (testnet expected): {e}")
-    
-    # Store image with unique ID (don't return base64 to agent)
-    image_id = str(uuid.uuid4())
-    image_data = f"data:image/png;base64,{image_base64}"
-    storage.image_storage[image_id] = image_data
-    # Update global for backward compatibility
-    IMAGE_STORAGE[image_id] = image_data
-    
-    # Store image_id for potential analysis
-    storage.authorize_check[request_id]['image_id'] = image_id
+    # Generate image(s) with Bedrock - a batch is paid once, generated in parallel
+    try:
+        generated_ids = await generate_images(prompts, images_per_prompt)
+    except Exception as e:
+        # Settlement only follows delivery, so the verified payment is never charged;
+        # the request stays authorized for a retry
+        logger.error(f"Image generation failed after payment verification for {request_id}: {str(e)}")
+        return (f"Error: Image generation failed ({str(e)}). The payment was not settled, so nothing was charged. "
+                f"Call generate_image again to retry.")
+    
+    # Record image IDs in the session (don't return base64 to agent)
+    image_ids = []
+    for image_id in generated_ids:
+        storage.image_storage[image_id] = "image/png"
+        # Update global for backward compatibility
+        IMAGE_STORAGE[image_id] = "image/png"
+        image_ids.append(image_id)
+    
+    # Store image_id(s) for potential analysis
+    storage.authorize_check[request_id]['image_id'] = image_ids[0]
+    storage.authorize_check[request_id]['image_ids'] = image_ids
+    storage.authorize_check[request_id]['settlement'] = 'pending' if payment_nonce else None
     AUTHORIZE_CHECK[request_id] = storage.authorize_check[request_id]
     
     # Clear current request_id after successful completion to allow new requests
     storage.current_request_id = None
     storage.current_cost = None
+    storage.save()
+    
+    # x402 spec: settle after content delivery (fair billing - only charge on success)
+    # Queued after the session is saved so the image isn't held up by the facilitator
+    if payment_nonce:
+        await asyncio.to_thread(get_settlements().enqueue, request_id, payment_nonce, gateway_url, session_id)
+    else:
+        release_reservation(request_id)
     
     # Build success message with transaction info
-    success_msg = f"SUCCESS|IMAGE_ID:{image_id}\n\nImage generated successfully! Payment verified on base-sepolia.\nImage ID: {image_id}"
-    if transaction_hash:
-        success_msg += f"\nTransaction: {transaction_hash}\nExplorer: https://sepolia.basescan.org/tx/{transaction_hash}"
+    if len(image_ids) == 1:
+        success_msg = f"SUCCESS|IMAGE_ID:{image_id}\n\nImage generated successfully! Payment verified on base-sepolia.\nImage ID: {image_id}"
+    else:
+        success_msg = f"SUCCESS|IMAGE_IDS:{','.join(image_ids)}\n\n{len(image_ids)} images generated successfully with a single payment! Payment verified on base-sepolia.\nImage IDs: {', '.join(image_ids)}"
+    if payment_nonce:
+        success_msg += f"\nPayment settlement queued (request ID: {request_id})."
     
     return success_msg
 
 
+MONETIZATION_INSTRUCTIONS = "If monetization: provide viability (1-10), market value, licensing opportunities, legal considerations, optimization tips, platforms, and SEO keywords. Otherwise, provide the requested analysis."
+
+def build_analysis_prompt(analysis_types: list) -> str:
+    if len(analysis_types) == 1:
+        return f"Analyze this AI-generated image for: {analysis_types[0]}. {MONETIZATION_INSTRUCTIONS}"
+    headers = ", ".join(f"'### {analysis_type}'" for analysis_type in analysis_types)
+    return (
+        f"Analyze this AI-generated image for each of: {', '.join(analysis_types)}. "
+        f"Answer each in its own section starting with a header line exactly as follows: {headers}. "
+        f"{MONETIZATION_INSTRUCTIONS}"
+    )
+
 @tool
-def analyze_content_monetization(image_id: str, analysis_type: str = "monetization", session_id: str = "default") -> str:
+async def analyze_content_monetization(image_id: str, analysis_type: str = "monetization", session_id: str = "default") -> str:
     """
     Analyze image using Claude Sonnet 4 with vision. ONLY use when user EXPLICITLY requests analysis, description, poem, or other image analysis.
     DO NOT use automatically after image generation unless specifically asked.
+    Request several analyses at once with a comma-separated analysis_type (e.g. "description, poem") -
+    they are answered in a single vision call, and repeated analyses of the same image are cached.
     
     Args:
-        image_id: The ID of the generated image to analyze (format: IMAGE_ID:uuid)
-        analysis_type: Type of analysis (monetization, description, poem, etc.)
+        image_id: The ID of the generated image to analyze (format: IMAGE_ID:id)
+        analysis_type: Type of analysis (monetization, description, poem, etc.), comma-separated for several
         
     Returns:
         Analysis based on requested type
     """
-    # Extract UUID from IMAGE_ID:uuid format
+    # Extract ID from IMAGE_ID:id format
     if image_id.startswith("IMAGE_ID:"):
         uuid_part = image_id.replace("IMAGE_ID:", "")
     else:
         uuid_part = image_id
     
-    # Get image from session storage first, fallback to global
+    # Check session storage first, fallback to global
     storage = get_session_storage(session_id)
-    if uuid_part in storage.image_storage:
-        image_data = storage.image_storage[uuid_part]
-    elif uuid_part in IMAGE_STORAGE:
-        image_data = IMAGE_STORAGE[uuid_part]
-    else:
+    if uuid_part not in storage.image_storage and uuid_part not in IMAGE_STORAGE:
         return "Error: Image not found. Please generate an image first."
-    image_base64 = image_data.replace("data:image/png;base64,", "")
-    request_body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 2000,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/png",
-                            "data": image_base64
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": f"Analyze this AI-generated image for: {analysis_type}. If monetization: provide viability (1-10), market value, licensing opportunities, legal considerations, optimization tips, platforms, and SEO keywords. Otherwise, provide the requested analysis."
-                    }
-                ]
-            }
-        ]
-    }
-    
-    response = bedrock_runtime.invoke_model(
-        modelId="us.anthropic.claude-sonnet-4-20250514-v1:0",
-        body=json.dumps(request_body)
-    )
     
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text']
+    # Image IDs are content hashes, so cached analyses are shared by identical images
+    analysis_types = parse_analysis_types(analysis_type)
+    cache = get_analysis_cache()
+    results = {name: cache.get(uuid_part, name) for name in analysis_types}
+    missing = [name for name in analysis_types if results[name] is None]
+    
+    if missing:
+        image_bytes = await asyncio.to_thread(get_image_store().get, uuid_part)
+        if image_bytes is None:
+            return "Error: Image not found. Please generate an image first."
+        image_base64 = base64.b64encode(image_bytes).decode()
+        request_body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": min(2000 * len(missing), 8000),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/png",
+                                "data": image_base64
+                            }
+                        },
+                        {
+                            "type": "text",
+                            "text": build_analysis_prompt(missing)
+                        }
+                    ]
+                }
+            ]
+        }
+        
+        response = await asyncio.to_thread(
+            invoke_model,
+            modelId="us.anthropic.claude-sonnet-4-20250514-v1:0",
+            body=json.dumps(request_body)
+        )
+        
+        response_body = json.loads(response['body'].read())
+        text = response_body['content'][0]['text']
+        
+        sections = {missing[0]: text} if len(missing) == 1 else split_sections(text, missing)
+        if len(sections) < len(missing):
+            # Model didn't follow the section format - return the analysis as-is, uncached
+            return text
+        for name, section in sections.items():
+            cache.put(uuid_part, name, section)
+            results[name] = section
+    
+    if len(analysis_types) == 1:
+        return results[analysis_types[0]]
+    return "\n\n".join(f"### {name}\n{results[name]}" for name in analysis_types)
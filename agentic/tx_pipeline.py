@@ -0,0 +1,261 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from web3_provider import get_web3
+
+logger = logging.getLogger(__name__)
+
+# Fee cache lifetime (roughly one Base block), priority fee floor and fee headroom
+TX_FEE_TTL = float(os.getenv('TX_FEE_TTL', '2'))
+TX_MIN_PRIORITY_FEE = int(os.getenv('TX_MIN_PRIORITY_FEE', '1000000'))  # wei
+TX_BASE_FEE_MULTIPLIER = float(os.getenv('TX_BASE_FEE_MULTIPLIER', '2'))
+# Gas estimate headroom and fallback when estimation fails
+TX_GAS_BUFFER = float(os.getenv('TX_GAS_BUFFER', '1.2'))
+TX_DEFAULT_GAS = int(os.getenv('TX_DEFAULT_GAS', '100000'))
+TX_GAS_CACHE_MAX = int(os.getenv('TX_GAS_CACHE_MAX', '256'))
+# How long callers wait for their transaction to be broadcast
+TX_SEND_TIMEOUT = float(os.getenv('TX_SEND_TIMEOUT', '60'))
+
+# Node errors meaning our local nonce is out of sync with the chain. 'nonce too low' can also
+# mean this very transaction was mined after a send that timed out on another endpoint, so it
+# is only re-signed once the node confirms it doesn't know the transaction's hash
+_NONCE_ERRORS = ('nonce too low', 'nonce too high')
+_MINED_ERRORS = ('nonce too low',)
+# This exact transaction is already in the mempool (e.g. a send that timed out on another endpoint)
+_KNOWN_ERRORS = ('already known',)
+# A different transaction holds this nonce in the mempool - retrying could pay twice
+_REPLACEMENT_ERRORS = ('replacement transaction underpriced',)
+
+
+class FeeEstimator:
+    """EIP-1559 fee fields cached per block (falls back to legacy gasPrice)"""
+
+    def __init__(self, ttl: float = TX_FEE_TTL):
+        self.ttl = ttl
+        self._fees = None
+        self._block = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        with self._lock:
+            if self._fees is not None and time.monotonic() - self._fetched_at < self.ttl:
+                return self._fees
+
+            w3 = get_web3()
+            block = w3.eth.get_block('latest')
+            if block['number'] != self._block or self._fees is None:
+                base_fee = block.get('baseFeePerGas')
+                if base_fee is None:
+                    self._fees = {'gasPrice': w3.eth.gas_price}
+                else:
+                    priority_fee = max(w3.eth.max_priority_fee, TX_MIN_PRIORITY_FEE)
+                    self._fees = {
+                        'maxPriorityFeePerGas': priority_fee,
+                        'maxFeePerGas': int(base_fee * TX_BASE_FEE_MULTIPLIER) + priority_fee
+                    }
+                self._block = block['number']
+            self._fetched_at = time.monotonic()
+            return self._fees
+
+    @property
+    def block(self):
+        return self._block
+
+
+class NonceManager:
+    """Local nonce counter for one address with pending-transaction tracking.
+
+    The counter is seeded from the chain's pending count and advanced locally, so
+    consecutive transactions get consecutive nonces without an RPC round-trip each.
+    resync() reseeds it when the node reports a nonce conflict.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self._next = None
+        self._pending = {}  # nonce -> (tx_hash, sent_at)
+        self._lock = threading.Lock()
+
+    def peek(self) -> int:
+        with self._lock:
+            if self._next is None:
+                self._next = get_web3().eth.get_transaction_count(self.address, 'pending')
+            return self._next
+
+    def commit(self, nonce: int, tx_hash: str) -> None:
+        """Record a broadcast transaction and advance the counter past it"""
+        with self._lock:
+            self._pending[nonce] = (tx_hash, time.monotonic())
+            self._next = max(self._next or 0, nonce + 1)
+
+    def resync(self) -> None:
+        with self._lock:
+            self._next = None
+
+    def prune(self) -> None:
+        """Drop pending entries the chain has confirmed"""
+        with self._lock:
+            if not self._pending:
+                return
+        confirmed = get_web3().eth.get_transaction_count(self.address, 'latest')
+        with self._lock:
+            for nonce in [n for n in self._pending if n < confirmed]:
+                del self._pending[nonce]
+
+    def pending(self) -> list:
+        with self._lock:
+            return [{'nonce': nonce, 'transaction_hash': tx_hash, 'age': round(time.monotonic() - sent_at, 1)}
+                    for nonce, (tx_hash, sent_at) in sorted(self._pending.items())]
+
+
+class TransactionSender:
+    """Queued sender that pipelines transactions from one wallet.
+
+    Callers submit unsigned transactions (to/data/value); gas is estimated in the
+    caller's thread (cached per gas_key), then a single worker thread assigns fees
+    and nonces, signs and broadcasts in order without waiting for receipts. Many
+    transfers can therefore be in flight at once without nonce collisions.
+    """
+
+    def __init__(self, wallet):
+        self.wallet = wallet
+        self.address = wallet.get_address()
+        self.nonces = NonceManager(self.address)
+        self.fees = FeeEstimator()
+        self._chain_id = None
+        self._gas_cache = {}
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True, name='tx-sender')
+        self._worker.start()
+        self.sent = 0
+        self.failed = 0
+
+    def estimate_gas(self, tx: dict, gas_key=None) -> int:
+        if gas_key is not None and gas_key in self._gas_cache:
+            return self._gas_cache[gas_key]
+        try:
+            gas = int(get_web3().eth.estimate_gas({**tx, 'from': self.address}) * TX_GAS_BUFFER)
+        except Exception as e:
+            logger.warning(f"Gas estimation failed, using {TX_DEFAULT_GAS}: {str(e)}")
+            return TX_DEFAULT_GAS
+        if gas_key is not None:
+            if len(self._gas_cache) >= TX_GAS_CACHE_MAX:
+                self._gas_cache.pop(next(iter(self._gas_cache)))
+            self._gas_cache[gas_key] = gas
+        return gas
+
+    def submit(self, tx: dict, gas_key=None) -> Future:
+        """Queue a transaction; the future resolves to its hash once broadcast"""
+        tx = dict(tx)
+        if 'gas' not in tx:
+            tx['gas'] = self.estimate_gas(tx, gas_key)
+        future = Future()
+        self._queue.put((tx, future))
+        return future
+
+    def send(self, tx: dict, gas_key=None, timeout: float = TX_SEND_TIMEOUT) -> str:
+        return self.submit(tx, gas_key).result(timeout=timeout)
+
+    def _run(self) -> None:
+        while True:
+            tx, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._broadcast(tx))
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                future.set_exception(e)
+
+    def _broadcast(self, tx: dict, retry: bool = True) -> str:
+        w3 = get_web3()
+        if self._chain_id is None:
+            self._chain_id = w3.eth.chain_id
+
+        block = self.fees.block
+        fees = self.fees.get()
+        if self.fees.block != block:
+            try:
+                self.nonces.prune()
+            except Exception as e:
+                logger.warning(f"Pending transaction prune failed: {str(e)}")
+
+        nonce = self.nonces.peek()
+        signed_tx = self.wallet.sign_transaction({
+            **tx, **fees,
+            'from': self.address,
+            'nonce': nonce,
+            'chainId': self._chain_id
+        })
+        raw_tx = signed_tx['rawTransaction']
+        try:
+            tx_hash = w3.eth.send_raw_transaction(raw_tx).hex()
+        except Exception as e:
+            error = str(e).lower()
+            if any(marker in error for marker in _KNOWN_ERRORS):
+                # Broadcast already succeeded - sending it again at another nonce would pay twice
+                tx_hash = Web3.keccak(raw_tx).hex()
+                logger.info(f"Transaction {tx_hash} (nonce {nonce}) already known to the node")
+            elif any(marker in error for marker in _REPLACEMENT_ERRORS):
+                # Move later transactions past the occupied nonce, but don't re-send this one
+                self.nonces.resync()
+                raise
+            elif any(marker in error for marker in _MINED_ERRORS) and self._was_broadcast(raw_tx):
+                tx_hash = Web3.keccak(raw_tx).hex()
+                logger.info(f"Transaction {tx_hash} (nonce {nonce}) was already broadcast")
+            elif retry and any(marker in error for marker in _NONCE_ERRORS):
+                logger.warning(f"Nonce {nonce} rejected ({str(e)}), resyncing")
+                self.nonces.resync()
+                return self._broadcast(tx, retry=False)
+            else:
+                raise
+        self.nonces.commit(nonce, tx_hash)
+        return tx_hash
+
+    def _was_broadcast(self, raw_tx) -> bool:
+        """Whether the chain already has this signed transaction (pending or mined).
+
+        Raises when the lookup itself fails - re-signing without knowing could pay twice.
+        """
+        tx_hash = Web3.keccak(raw_tx)
+        try:
+            get_web3().eth.get_transaction(tx_hash)
+            return True
+        except TransactionNotFound:
+            return False
+        except Exception as e:
+            self.nonces.resync()
+            raise RuntimeError(f"Nonce rejected and status of transaction {tx_hash.hex()} is unknown: {str(e)}") from e
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'pending': self.nonces.pending()
+        }
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+def get_transaction_sender(wallet) -> TransactionSender:
+    """Get or create the transaction sender for a wallet"""
+    with _senders_lock:
+        sender = _senders.get(id(wallet))
+        if sender is None:
+            sender = _senders[id(wallet)] = TransactionSender(wallet)
+        return sender
+
+def get_transaction_stats() -> list:
+    """Queue and nonce statistics per sending wallet"""
+    with _senders_lock:
+        senders = list(_senders.values())
+    return [{'wallet': sender.address, **sender.stats()} for sender in senders]
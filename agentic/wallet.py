@@ -1,5 +1,10 @@
 import os
+import time
+import asyncio
 import logging
+import threading
+import importlib.util
+import httpx
 from coinbase_agentkit import (
     AgentKit,
     AgentKitConfig,
@@ -7,8 +12,12 @@ from coinbase_agentkit import (
     CdpEvmWalletProviderConfig,
 )
 from web3_provider import get_web3
+from tx_pipeline import get_transaction_sender
+from telemetry import telemetry
 from web3 import Web3
 from x402.clients.httpx import x402HttpxClient
+from x402.clients.base import x402Client
+from x402.types import x402PaymentRequiredResponse
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,6 +28,20 @@ logger.setLevel(logging.INFO)
 # USDC contract address from environment
 USDC_CONTRACT = os.getenv('USDC_CONTRACT')
 
+# Multicall3 is deployed at the same address on Base, Base Sepolia and most EVM chains
+MULTICALL3_ADDRESS = os.getenv('MULTICALL3_ADDRESS', '0xcA11bde05977b3631167028862bE2a173976CA11')
+
+# x402 gateway connection pool limits
+X402_MAX_CONNECTIONS = int(os.getenv('X402_MAX_CONNECTIONS', '50'))
+X402_MAX_KEEPALIVE = int(os.getenv('X402_MAX_KEEPALIVE', '20'))
+X402_KEEPALIVE_EXPIRY = float(os.getenv('X402_KEEPALIVE_EXPIRY', '60'))
+# HTTP/2 is used only when the optional h2 package is installed
+X402_HTTP2 = os.getenv('X402_HTTP2', 'true').lower() == 'true' and importlib.util.find_spec('h2') is not None
+
+# Speculative payment signing after consent (authorization window is 300s at the gateway)
+X402_PRESIGN = os.getenv('X402_PRESIGN', 'false').lower() == 'true'
+X402_PRESIGN_MAX_AGE = float(os.getenv('X402_PRESIGN_MAX_AGE', '120'))
+
 # ERC-20 ABI
 ERC20_ABI = [
     {
@@ -40,6 +63,39 @@ ERC20_ABI = [
     }
 ]
 
+# Multicall3 ABI (aggregate3 + getEthBalance only)
+MULTICALL3_ABI = [
+    {
+        "inputs": [{
+            "components": [
+                {"name": "target", "type": "address"},
+                {"name": "allowFailure", "type": "bool"},
+                {"name": "callData", "type": "bytes"}
+            ],
+            "name": "calls",
+            "type": "tuple[]"
+        }],
+        "name": "aggregate3",
+        "outputs": [{
+            "components": [
+                {"name": "success", "type": "bool"},
+                {"name": "returnData", "type": "bytes"}
+            ],
+            "name": "returnData",
+            "type": "tuple[]"
+        }],
+        "stateMutability": "payable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"name": "addr", "type": "address"}],
+        "name": "getEthBalance",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
 class _SignedMessageAdapter:
     """Minimal adapter for x402's expected signed message shape."""
 
@@ -99,62 +155,252 @@ class _CdpWalletAccountAdapter:
         return _SignedMessageAdapter(signature)
 
 
+def _payment_selector(accepts, network_filter=None, scheme_filter=None, max_value=None):
+    return x402Client.default_payment_requirements_selector(
+        accepts,
+        network_filter=os.getenv('NETWORK_ID', 'base-sepolia'),
+        scheme_filter=scheme_filter,
+        max_value=max_value
+    )
+
+
+# Cached CDP signer adapters (avoids a remote get_address() per purchase)
+_signers = {}
+_signers_lock = threading.Lock()
+
+def get_signer(wallet) -> _CdpWalletAccountAdapter:
+    """Get or create the cached CDP signer adapter for a wallet"""
+    with _signers_lock:
+        signer = _signers.get(id(wallet))
+        if signer is None:
+            try:
+                signer = _CdpWalletAccountAdapter(wallet)
+                logger.info('Using CDP wallet signer for x402 (private key remains in CDP)')
+            except Exception as e:
+                logger.error(f'Failed to configure CDP wallet signer: {e}')
+                raise ValueError(f'Failed to configure CDP wallet signing for x402: {e}') from e
+            _signers[id(wallet)] = signer
+    return signer
+
+
 def get_x402_httpx_client(wallet, base_url: str):
     """Create x402 HTTP client using CDP-managed signing (no key export)."""
-    from x402.clients.base import x402Client
-
-    try:
-        account = _CdpWalletAccountAdapter(wallet)
-        logger.info('Using CDP wallet signer for x402 (private key remains in CDP)')
-    except Exception as e:
-        logger.error(f'Failed to configure CDP wallet signer: {e}')
-        raise ValueError(f'Failed to configure CDP wallet signing for x402: {e}') from e
-    
-    def payment_selector(accepts, network_filter=None, scheme_filter=None, max_value=None):
-        return x402Client.default_payment_requirements_selector(
-            accepts,
-            network_filter=os.getenv('NETWORK_ID', 'base-sepolia'),
-            scheme_filter=scheme_filter,
-            max_value=max_value
-        )
-    
     return x402HttpxClient(
-        account=account,
+        account=get_signer(wallet),
         base_url=base_url,
-        payment_requirements_selector=payment_selector
+        payment_requirements_selector=_payment_selector
     )
 
+
+class X402GatewayClient:
+    """Long-lived x402 client for one gateway.
+
+    Keeps a pooled keep-alive (HTTP/2 when available) connection to the gateway and
+    performs the 402 negotiation itself on that pool, so concurrent purchases reuse
+    warm connections and share no per-request retry state.
+    """
+
+    def __init__(self, signer: _CdpWalletAccountAdapter, base_url: str):
+        self.base_url = base_url
+        self.signer = signer
+        self._x402 = x402Client(signer, payment_requirements_selector=_payment_selector)
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            http2=X402_HTTP2,
+            timeout=30,
+            limits=httpx.Limits(
+                max_connections=X402_MAX_CONNECTIONS,
+                max_keepalive_connections=X402_MAX_KEEPALIVE,
+                keepalive_expiry=X402_KEEPALIVE_EXPIRY
+            )
+        )
+        self._presigned = {}  # key -> (created_at, task resolving to payment header or None)
+
+    async def create_payment_header(self, response: httpx.Response) -> str:
+        """Build the signed payment header for a 402 response"""
+        payment_response = x402PaymentRequiredResponse(**response.json())
+        requirements = self._x402.select_payment_requirements(payment_response.accepts)
+        # CDP signing is a blocking remote call
+        with telemetry.span('x402.sign', network=requirements.network):
+            return await asyncio.to_thread(
+                self._x402.create_payment_header, requirements, payment_response.x402_version
+            )
+
+    async def _presign(self, path: str, json: dict):
+        """Fetch the 402 requirements for a request and sign them ahead of time"""
+        try:
+            response = await self.http.post(path, json=json)
+            if response.status_code != 402:
+                return None
+            return await self.create_payment_header(response)
+        except Exception as e:
+            logger.warning(f'x402 pre-signing failed: {str(e)}')
+            return None
+
+    def presign(self, key: str, path: str, json: dict) -> None:
+        """Start negotiating and signing a payment in the background. Call on the client's loop.
+
+        The signed EIP-3009 authorization only moves funds once the gateway settles it,
+        so an unused pre-signed header simply expires.
+        """
+        now = time.monotonic()
+        for stale_key, (created_at, task) in list(self._presigned.items()):
+            if now - created_at > X402_PRESIGN_MAX_AGE:
+                task.cancel()
+                del self._presigned[stale_key]
+        self._presigned[key] = (now, asyncio.ensure_future(self._presign(path, json)))
+
+    async def take_presigned(self, key: str):
+        """Return the pre-signed payment header for key if one is still fresh"""
+        entry = self._presigned.pop(key, None)
+        if entry is None:
+            return None
+        created_at, task = entry
+        if time.monotonic() - created_at > X402_PRESIGN_MAX_AGE:
+            task.cancel()
+            return None
+        return await task
+
+    async def post(self, path: str, json: dict, timeout: float = 30, presign_key: str = None) -> httpx.Response:
+        """POST to the gateway, paying via x402 if it answers 402.
+
+        With a presign_key whose header is ready, the payment is attached to the first
+        request, skipping the 402 round-trip and signing on the critical path.
+        """
+        with telemetry.span('x402.negotiate', path=path):
+            payment_header = await self.take_presigned(presign_key) if presign_key else None
+            if payment_header:
+                response = await self.http.post(
+                    path,
+                    json=json,
+                    headers={'X-PAYMENT': payment_header, 'Access-Control-Expose-Headers': 'X-PAYMENT-RESPONSE'},
+                    timeout=timeout
+                )
+            else:
+                with telemetry.span('x402.request', path=path):
+                    response = await self.http.post(path, json=json, timeout=timeout)
+            if response.status_code != 402:
+                return response
+
+            payment_header = await self.create_payment_header(response)
+            with telemetry.span('x402.paid_request', path=path):
+                return await self.http.post(
+                    path,
+                    json=json,
+                    headers={'X-PAYMENT': payment_header, 'Access-Control-Expose-Headers': 'X-PAYMENT-RESPONSE'},
+                    timeout=timeout
+                )
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+# Gateway clients keyed by (gateway URL, signer address)
+_gateway_clients = {}
+_gateway_clients_lock = threading.Lock()
+
+def get_x402_gateway_client(wallet, base_url: str) -> X402GatewayClient:
+    """Get the pooled x402 client for a gateway (thread-safe: presign workers share it).
+    Its HTTP calls must be made on a single event loop."""
+    signer = get_signer(wallet)
+    key = (base_url, signer.address)
+    with _gateway_clients_lock:
+        client = _gateway_clients.get(key)
+        if client is None:
+            client = X402GatewayClient(signer, base_url)
+            _gateway_clients[key] = client
+            logger.info(f'Created pooled x402 client for {base_url} (http2={X402_HTTP2})')
+    return client
+
 _agentkit = None
+_agentkit_lock = threading.Lock()
 
 def get_agentkit():
-    """Get or create AgentKit instance"""
+    """Get or create AgentKit instance (thread-safe: startup warm-up may race the first request)"""
     global _agentkit
-    if _agentkit is None:
-        wallet_provider = CdpEvmWalletProvider(
-            CdpEvmWalletProviderConfig(
-                api_key_id=os.getenv('CDP_API_KEY_ID'),
-                api_key_secret=os.getenv('CDP_API_KEY_SECRET'),
-                wallet_secret=os.getenv('CDP_WALLET_SECRET'),
-                network_id=os.getenv('NETWORK_ID'),
-                # Shared idempotency key is safe - wallet uniqueness comes from CDP_API_KEY + CDP_WALLET_SECRET
-                # You can generate your own with: python -c "import uuid; print(uuid.uuid4())"
-                idempotency_key='550e8400-e29b-41d4-a716-446655440000',
-            )
+    with _agentkit_lock:
+        if _agentkit is None:
+            _agentkit = _create_agentkit()
+    return _agentkit
+
+def _create_agentkit():
+    wallet_provider = CdpEvmWalletProvider(
+        CdpEvmWalletProviderConfig(
+            api_key_id=os.getenv('CDP_API_KEY_ID'),
+            api_key_secret=os.getenv('CDP_API_KEY_SECRET'),
+            wallet_secret=os.getenv('CDP_WALLET_SECRET'),
+            network_id=os.getenv('NETWORK_ID'),
+            # Shared idempotency key is safe - wallet uniqueness comes from CDP_API_KEY + CDP_WALLET_SECRET
+            # You can generate your own with: python -c "import uuid; print(uuid.uuid4())"
+            idempotency_key='550e8400-e29b-41d4-a716-446655440000',
         )
-        _agentkit = AgentKit(
-            AgentKitConfig(
-                wallet_provider=wallet_provider,
-                action_providers=[],
-            )
+    )
+    agentkit = AgentKit(
+        AgentKitConfig(
+            wallet_provider=wallet_provider,
+            action_providers=[],
         )
-        print(f"Wallet initialized: {_agentkit.wallet_provider.get_address()}")
-    return _agentkit
+    )
+    logger.info(f"Wallet initialized: {agentkit.wallet_provider.get_address()}")
+    return agentkit
 
 def get_wallet():
     """Get wallet from AgentKit"""
     agentkit = get_agentkit()
     return agentkit.wallet_provider
 
+# Contract objects built once per address
+_contracts = {}
+
+def get_contract(address: str, abi=ERC20_ABI):
+    """Get or create a cached contract object (ERC-20 by default)"""
+    contract = _contracts.get(address)
+    if contract is None:
+        w3 = get_web3()
+        contract = _contracts[address] = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+    return contract
+
+def _decode_uint(w3, result):
+    success, return_data = result
+    if not success or not return_data:
+        return None
+    return w3.codec.decode(['uint256'], return_data)[0]
+
+def get_balances(addresses: list, tokens: list = None) -> dict:
+    """ETH and ERC-20 balances (raw base units) for many addresses in one eth_call via Multicall3.
+
+    Returns {address: {'eth': wei, token_address: units, ...}}; a value is None if that
+    individual read failed.
+    """
+    tokens = tokens if tokens is not None else [USDC_CONTRACT]
+    w3 = get_web3()
+    multicall = get_contract(MULTICALL3_ADDRESS, MULTICALL3_ABI)
+    addresses = [Web3.to_checksum_address(address) for address in addresses]
+
+    calls = []
+    for address in addresses:
+        calls.append((multicall.address, True, multicall.functions.getEthBalance(address)._encode_transaction_data()))
+        for token in tokens:
+            calls.append((get_contract(token).address, True, get_contract(token).functions.balanceOf(address)._encode_transaction_data()))
+
+    results = iter(multicall.functions.aggregate3(calls).call())
+    balances = {}
+    for address in addresses:
+        balances[address] = {'eth': _decode_uint(w3, next(results))}
+        for token in tokens:
+            balances[address][token] = _decode_uint(w3, next(results))
+    return balances
+
+def get_wallet_balances(addresses: list) -> dict:
+    """ETH and USDC balances for many addresses in a single RPC round-trip"""
+    balances = {}
+    for address, raw in get_balances(addresses).items():
+        balances[address] = {
+            'eth_balance': (raw['eth'] or 0) / 1e18,
+            'usdc_balance': (raw[USDC_CONTRACT] or 0) / 1e6
+        }
+    return balances
+
 def get_eth_balance(wallet) -> float:
     """Get native ETH balance using Web3"""
     try:
@@ -169,9 +415,7 @@ def get_eth_balance(wallet) -> float:
 def get_usdc_balance(address: str) -> float:
     """Get USDC balance using Web3"""
     try:
-        w3 = get_web3()
-        contract = w3.eth.contract(address=USDC_CONTRACT, abi=ERC20_ABI)
-        balance_wei = contract.functions.balanceOf(address).call()
+        balance_wei = get_contract(USDC_CONTRACT).functions.balanceOf(address).call()
         return balance_wei / 1e6
     except Exception as e:
         logger.error(f"Error getting USDC balance: {str(e)}")
@@ -183,11 +427,15 @@ def get_balance(wallet) -> dict:
         wallet_address = wallet.get_address()
         network = wallet.get_network()
         
-        # Get native ETH balance using AgentKit
-        eth_balance = get_eth_balance(wallet)
-        
-        # Get USDC balance using Web3
-        usdc_balance = get_usdc_balance(wallet_address)
+        # Get ETH and USDC balances in one Multicall3 round-trip, falling back to separate reads
+        try:
+            balances = get_wallet_balances([wallet_address])[Web3.to_checksum_address(wallet_address)]
+            eth_balance = balances['eth_balance']
+            usdc_balance = balances['usdc_balance']
+        except Exception as e:
+            logger.warning(f"Multicall balance read failed, using separate calls: {str(e)}")
+            eth_balance = get_eth_balance(wallet)
+            usdc_balance = get_usdc_balance(wallet_address)
         
         logger.info(f"Balances - ETH: {eth_balance}, USDC: {usdc_balance}")
         
@@ -212,25 +460,22 @@ def native_transfer(wallet, to_address: str, amount_wei: int) -> dict:
         amount_usdc = amount_wei / 1e6
         logger.info(f"Transferring {amount_usdc} USDC to {to_address}")
         
-        w3 = get_web3()
-        contract = w3.eth.contract(address=USDC_CONTRACT, abi=ERC20_ABI)
-        wallet_address = wallet.get_address()
-        
-        tx = contract.functions.transfer(to_address, amount_wei).build_transaction({
-            'from': wallet_address,
-            'nonce': w3.eth.get_transaction_count(wallet_address),
-            'gas': 100000,
-            'gasPrice': w3.eth.gas_price,
-        })
-        
-        signed_tx = wallet.sign_transaction(tx)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx['rawTransaction'])
+        contract = get_contract(USDC_CONTRACT)
+        encode_abi = getattr(contract, 'encode_abi', None) or contract.encodeABI  # web3 v7 / v6
+        tx = {
+            'to': Web3.to_checksum_address(USDC_CONTRACT),
+            'value': 0,
+            'data': encode_abi('transfer', args=[to_address, amount_wei])
+        }
+
+        # Queued sender assigns nonce and per-block fees; gas estimate cached per recipient
+        tx_hash = get_transaction_sender(wallet).send(tx, gas_key=('transfer', to_address.lower()))
         
-        logger.info(f"USDC transfer successful: {tx_hash.hex()}")
+        logger.info(f"USDC transfer successful: {tx_hash}")
         
         return {
             'status': 'success',
-            'transaction_hash': tx_hash.hex(),
+            'transaction_hash': tx_hash,
             'amount_wei': amount_wei,
             'amount_usdc': amount_usdc,
             'to': to_address
@@ -1,18 +1,173 @@
 import os
+import time
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from web3 import Web3
+from web3.providers import BaseProvider
 from dotenv import load_dotenv
+from telemetry import telemetry
 
 load_dotenv()
 
-# Base Sepolia RPC
+logger = logging.getLogger(__name__)
+
+# Base Sepolia RPC (RPC_URLS: comma-separated endpoints in preference order)
 RPC_URL = os.getenv('RPC_URL')
+RPC_URLS = [url.strip() for url in os.getenv('RPC_URLS', RPC_URL or '').split(',') if url.strip()]
+
+# Provider tuning
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '10'))
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', '20'))
+RPC_HEDGE_DELAY = float(os.getenv('RPC_HEDGE_DELAY', '0.5'))
+RPC_FAILURE_THRESHOLD = int(os.getenv('RPC_FAILURE_THRESHOLD', '3'))
+RPC_COOLDOWN = float(os.getenv('RPC_COOLDOWN', '30'))
+
+# Read-only methods that are safe to send to two endpoints at once
+HEDGED_METHODS = {
+    'eth_blockNumber', 'eth_call', 'eth_chainId', 'eth_estimateGas', 'eth_feeHistory',
+    'eth_gasPrice', 'eth_getBalance', 'eth_getBlockByNumber', 'eth_getCode',
+    'eth_getTransactionCount', 'eth_getTransactionReceipt', 'eth_maxPriorityFeePerGas',
+    'net_version'
+}
+
+# Weight of the latest sample in the latency moving average
+_LATENCY_ALPHA = 0.2
+
+
+class _Endpoint:
+    """One RPC endpoint with its pooled session and health statistics"""
+
+    __slots__ = ('url', 'provider', 'latency', 'requests', 'errors', 'consecutive_errors', 'down_until')
+
+    def __init__(self, url: str):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=RPC_POOL_SIZE, pool_maxsize=RPC_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        self.url = url
+        self.provider = Web3.HTTPProvider(url, request_kwargs={'timeout': RPC_TIMEOUT}, session=session)
+        self.latency = None  # Moving average in seconds
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.down_until = 0.0
+
+
+class FailoverHTTPProvider(BaseProvider):
+    """Multi-endpoint HTTP provider with latency-based routing, hedged reads and failover.
+
+    Requests go to the healthy endpoint with the lowest average latency. Reads that
+    haven't answered within RPC_HEDGE_DELAY are also sent to the next endpoint and the
+    first answer wins. Failed requests fail over to the next endpoint, and an endpoint
+    with RPC_FAILURE_THRESHOLD consecutive errors is skipped for RPC_COOLDOWN seconds.
+    """
+
+    def __init__(self, urls: list, hedge_delay: float = RPC_HEDGE_DELAY):
+        super().__init__()
+        if not urls:
+            raise ValueError('At least one RPC endpoint is required (set RPC_URL or RPC_URLS)')
+        self.endpoints = [_Endpoint(url) for url in urls]
+        self.hedge_delay = hedge_delay
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=RPC_POOL_SIZE, thread_name_prefix='rpc')
+
+    def _ranked(self) -> list:
+        """Healthy endpoints by latency (untried first), then endpoints cooling down"""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.down_until <= now]
+            down = [e for e in self.endpoints if e.down_until > now]
+        healthy.sort(key=lambda e: e.latency or 0.0)
+        down.sort(key=lambda e: e.down_until)
+        return healthy + down
+
+    def _call(self, endpoint: _Endpoint, method, params):
+        started = time.monotonic()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception as e:
+            with self._lock:
+                endpoint.requests += 1
+                endpoint.errors += 1
+                endpoint.consecutive_errors += 1
+                if endpoint.consecutive_errors >= RPC_FAILURE_THRESHOLD:
+                    endpoint.down_until = time.monotonic() + RPC_COOLDOWN
+            logger.warning(f"RPC {method} failed on {endpoint.url}: {str(e)}")
+            raise
+        elapsed = time.monotonic() - started
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.consecutive_errors = 0
+            endpoint.down_until = 0.0
+            endpoint.latency = elapsed if endpoint.latency is None else (1 - _LATENCY_ALPHA) * endpoint.latency + _LATENCY_ALPHA * elapsed
+        return response
+
+    def make_request(self, method, params):
+        with telemetry.span(f"rpc.{method}"):
+            return self._make_request(method, params)
+
+    def _make_request(self, method, params):
+        endpoints = iter(self._ranked())
+        hedge = method in HEDGED_METHODS and len(self.endpoints) > 1
+        pending = set()
+        last_error = None
+
+        def launch() -> bool:
+            endpoint = next(endpoints, None)
+            if endpoint is None:
+                return False
+            pending.add(self._executor.submit(self._call, endpoint, method, params))
+            return True
+
+        launch()
+        while pending:
+            done, pending = wait(pending, timeout=self.hedge_delay if hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slow endpoint - hedge the read to the next one
+                launch()
+                continue
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+            if not pending:
+                launch()  # Fail over
+
+        raise last_error or ConnectionError(f'All RPC endpoints failed for {method}')
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(endpoint.provider.is_connected() for endpoint in self._ranked())
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'url': endpoint.url,
+                'latency_ms': round(endpoint.latency * 1000, 1) if endpoint.latency is not None else None,
+                'requests': endpoint.requests,
+                'errors': endpoint.errors,
+                'error_rate': endpoint.errors / endpoint.requests if endpoint.requests else 0.0,
+                'healthy': endpoint.down_until <= now
+            } for endpoint in self.endpoints]
+
 
 # Global Web3 instance
 _web3 = None
+_web3_lock = threading.Lock()
 
 def get_web3():
     """Get or create Web3 instance"""
     global _web3
     if _web3 is None:
-        _web3 = Web3(Web3.HTTPProvider(RPC_URL))
+        with _web3_lock:
+            if _web3 is None:
+                _web3 = Web3(FailoverHTTPProvider(RPC_URLS))
     return _web3
+
+def get_rpc_stats() -> list:
+    """Per-endpoint latency and error statistics for monitoring"""
+    return get_web3().provider.stats()